@@ -1,10 +1,32 @@
 import dash
 from dash import html, dcc, Input, Output, State, ctx
 import dash_bootstrap_components as dbc
+import flask
 import serial.tools.list_ports
-from pymodbus.client.serial import ModbusSerialClient
-from pymodbus.exceptions import ModbusException
+# pymodbus 3.6 API, see requirements.txt: Framer, the message modules and server.async_io were removed in 3.7
+from pymodbus.client.serial import ModbusSerialClient, AsyncModbusSerialClient
+from pymodbus.client.tcp import ModbusTcpClient, AsyncModbusTcpClient
+from pymodbus.framer import Framer
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse, ModbusExceptions
+from pymodbus.bit_read_message import ReadCoilsResponse, ReadDiscreteInputsResponse
+from pymodbus.bit_write_message import WriteSingleCoilResponse, WriteMultipleCoilsResponse
+from pymodbus.register_read_message import (ReadHoldingRegistersResponse, ReadInputRegistersResponse,
+                                            ReadWriteMultipleRegistersResponse)
+from pymodbus.register_write_message import WriteSingleRegisterResponse, WriteMultipleRegistersResponse
+from pymodbus.datastore import ModbusBaseSlaveContext, ModbusServerContext
+from pymodbus.server import ModbusTcpServer, ModbusSerialServer
+from pymodbus.server.async_io import ModbusServerRequestHandler
 import time
+import threading
+import asyncio
+import concurrent.futures
+import itertools
+import math
+import queue
+import random
+import select
+import socket
 import signal
 import sys
 import os
@@ -14,10 +36,13 @@ from datetime import datetime
 import csv
 import base64
 import io
+import json
+import argparse
 import plotly.graph_objects as go
 from collections import deque
 import plotly.io as pio
 import pandas as pd
+import numpy as np
 from dash.exceptions import PreventUpdate
 
 #version of the github
@@ -41,15 +66,21 @@ MODBUS_CONFIG = {
     'stopbits': 2,
     'bytesize': 8,
     'timeout': 1,
-    'unit_id': 1
+    'unit_id': 1,
+    'model': 'default',  # Device model, units of the same model share the learned register holes
+    'engine': 'thread',  # 'thread' (one worker thread per port) or 'asyncio' (all ports on one event loop)
+    'transport': 'rtu',  # 'rtu' (serial port), 'tcp' or 'rtu_over_tcp' (Ethernet gateway), see TRANSPORT_OPTIONS
+    'pipeline_depth': 1  # Connections per Modbus TCP gateway on the asyncio engine, >1 keeps several transactions in flight
 }
 
 # Example register map - now includes register type
 # Valid types: 'Holding', 'Input', 'Coil', 'Discrete_input
 
 # Example register map - now includes register type and bit definitions
+# Optional 'scan' key selects the scan class (see SCAN_CLASS_OPTIONS), default is 'normal'
 REGISTER_MAP = {
-    # Address: {'name': 'Description', 'type': 'Function', 'multiplier': k, 'unit': ''},
+    # Address: {'name': 'Description', 'type': 'Function', 'multiplier': k, 'unit': '', 'scan': 'normal', 'data_type': 'uint16'},
+    # Values of more than one register also take 'word_order' ('big' or 'little') and, for strings, 'words'
     0: {'name': 'Motor control mode', 'type': 'Holding', 'multiplier': 1, 'unit': ''},
     1: {'name': 'Motor base frequency', 'type': 'Holding', 'multiplier': 1, 'unit': ''},
     2: {'name': 'Motor base voltage', 'type': 'Holding', 'multiplier': 1, 'unit': ''},
@@ -130,12 +161,12 @@ REGISTER_MAP = {
     78: {'name': 'Reserved HR78', 'type': 'Holding', 'multiplier': 1, 'unit': ''},
     79: {'name': 'Reserved HR79', 'type': 'Holding', 'multiplier': 1, 'unit': ''},
     # Input registers from 35-50 (Measurements)
-    1035: {'name': 'U Output current measurement', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    1036: {'name': 'V Output current measurement', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    1037: {'name': 'W Output current measurement', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    1038: {'name': 'DC BUS voltage measurement', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    1039: {'name': 'DC BUS current measurement', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    1040: {'name': 'DC BUS power measurement', 'type': 'Input', 'multiplier': 1, 'unit': ''},
+    1035: {'name': 'U Output current measurement', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    1036: {'name': 'V Output current measurement', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    1037: {'name': 'W Output current measurement', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    1038: {'name': 'DC BUS voltage measurement', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    1039: {'name': 'DC BUS current measurement', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    1040: {'name': 'DC BUS power measurement', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
     1041: {'name': 'Reserved IR41', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     1042: {'name': 'Reserved IR42', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     1043: {'name': 'Reserved IR43', 'type': 'Input', 'multiplier': 1, 'unit': ''},
@@ -150,18 +181,17 @@ REGISTER_MAP = {
     105: {'name': 'see doc', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     106: {'name': 'Drive status registers (bitfield see doc.)', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     107: {'name': 'Speed status registers (bitfield see doc.)', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    108: {'name': 'Motor equivalent frequency [0.1Hz]', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    109: {'name': 'Actual current of the motor [0.1A]', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    110: {'name': 'Current power of the motor [0.01KW]', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    111: {'name': 'Voltage applied to the motor (phase to phase)', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    112: {'name': 'Reserved IR112', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    113: {'name': 'DC bus voltage', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    114: {'name': 'Drive temperature', 'type': 'Input', 'multiplier': 1, 'unit': ''},
+    108: {'name': 'Motor equivalent frequency [0.1Hz]', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    109: {'name': 'Actual current of the motor [0.1A]', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    110: {'name': 'Current power of the motor [0.01KW]', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    111: {'name': 'Voltage applied to the motor (phase to phase)', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    112: {'name': 'Reserved IR112', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    113: {'name': 'DC bus voltage', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
+    114: {'name': 'Drive temperature', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'fast'},
     115: {'name': 'Drive life time', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     116: {'name': 'Drive run time', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     117: {'name': 'Drive run time after last alarm', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    118: {'name': 'Total energy supplied to the motor [0.1kWh]', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    119: {'name': 'Total energy supplied to the motor', 'type': 'Input', 'multiplier': 1, 'unit': ''},
+    118: {'name': 'Total energy supplied to the motor [0.1kWh]', 'type': 'Input', 'multiplier': 1, 'unit': '', 'data_type': 'uint32'},  # 118-119
     120: {'name': 'Drive network address', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     121: {'name': 'Network address set by the drive dipswitches', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     122: {'name': 'Communication error info', 'type': 'Input', 'multiplier': 1, 'unit': ''},
@@ -183,15 +213,12 @@ REGISTER_MAP = {
     138: {'name': 'Alarm log 2', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     139: {'name': 'Alarm log 3', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     140: {'name': 'Alarm log 4', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    141: {'name': 'Bootloader version', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    142: {'name': 'Firmware version', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    143: {'name': 'Firmware checksum', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    144: {'name': 'Motor control version', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    145: {'name': 'Serial number 1', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    146: {'name': 'Serial number 2', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    147: {'name': 'Serial number 3', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    148: {'name': 'Serial number 4', 'type': 'Input', 'multiplier': 1, 'unit': ''},
-    149: {'name': 'Hardware identification', 'type': 'Input', 'multiplier': 1, 'unit': ''},
+    141: {'name': 'Bootloader version', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'once'},
+    142: {'name': 'Firmware version', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'once'},
+    143: {'name': 'Firmware checksum', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'once'},
+    144: {'name': 'Motor control version', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'once'},
+    145: {'name': 'Serial number', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'once', 'data_type': 'string', 'words': 4},  # 145-148
+    149: {'name': 'Hardware identification', 'type': 'Input', 'multiplier': 1, 'unit': '', 'scan': 'once'},
     150: {'name': 'Reserved IR150', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     151: {'name': 'Reserved IR151', 'type': 'Input', 'multiplier': 1, 'unit': ''},
     152: {'name': 'Reserved IR152', 'type': 'Input', 'multiplier': 1, 'unit': ''},
@@ -787,23 +814,71 @@ REGISTER_TYPE_OPTIONS = [
     {'label': 'Discrete Input', 'value': 'Discrete_input'}
 ]
 
+# Scan classes - how often each register is read
+# 'normal' follows the polling interval, 'once' is read on connect only and
+# 'on_change' is read on connect and again after this application writes to it
+SCAN_CLASS_OPTIONS = [
+    {'label': 'Fast', 'value': 'fast'},
+    {'label': 'Normal', 'value': 'normal'},
+    {'label': 'Slow', 'value': 'slow'},
+    {'label': 'On change', 'value': 'on_change'},
+    {'label': 'Read once', 'value': 'once'}
+]
+DEFAULT_SCAN_CLASS = 'normal'
+SCAN_CLASS_PERIODS = {
+    'fast': 0.1,  # Seconds
+    'slow': 30
+}
+
+# Data types of Holding and Input registers; values of more than one word start at the address of
+# the register and are always read in one request
+DATA_TYPE_OPTIONS = [
+    {'label': 'UINT16', 'value': 'uint16'},
+    {'label': 'INT16', 'value': 'int16'},
+    {'label': 'UINT32', 'value': 'uint32'},
+    {'label': 'INT32', 'value': 'int32'},
+    {'label': 'FLOAT32', 'value': 'float32'},
+    {'label': 'String', 'value': 'string'}
+]
+DEFAULT_DATA_TYPE = 'uint16'
+DATA_TYPE_WORDS = {'uint16': 1, 'int16': 1, 'uint32': 2, 'int32': 2, 'float32': 2}  # Strings set 'words' themselves
+# Order of the words of multi-word values: 'big' sends the most significant word first, 'little' the least
+WORD_ORDER_OPTIONS = [
+    {'label': 'High word first', 'value': 'big'},
+    {'label': 'Low word first', 'value': 'little'}
+]
+DEFAULT_WORD_ORDER = 'big'
+
+# Rendering of the register graph: WebGL draws many traces of thousands of points far faster than SVG
+GRAPH_RENDER_OPTIONS = [
+    {'label': 'SVG rendering', 'value': 'svg'},
+    {'label': 'WebGL rendering', 'value': 'webgl'}
+]
+DEFAULT_GRAPH_RENDER_MODE = 'svg'
+GRAPH_MARKER_POINTS = 300  # Traces with more points than this are drawn as lines only
+
 # Initialize variables
 renamed_vars = {k: v['name'] for k, v in REGISTER_MAP.items()}
-client = None
 
 # Add these variables to the global section near the top of the file
-last_read_duration = 0  # Track how long the last read operation took
 min_polling_interval = 1  # Minimum polling interval in seconds
 def load_register_map_from_csv(file_path):
     """
     Load register map from a CSV file.
     
     Expected CSV format:
-    Address,Name,Type,Multiplier,Unit,BitDefinitions
-    0,Virtual probe error,Discrete_input,1,,
-    0,Virtual probe temperature (Sv),Input,0.1,°C,
+    Address,Name,Type,Multiplier,Unit,BitDefinitions,ScanRate,DataType,WordOrder,Words
+    0,Virtual probe error,Discrete_input,1,,,,,,
+    0,Virtual probe temperature (Sv),Input,0.1,°C,,fast,int16,,
+    118,Total energy,Input,0.1,kWh,,,uint32,big,
+    145,Serial number,Input,1,,,once,string,,4
     ...
     
+    ScanRate is optional and takes one of the scan classes: fast, normal, slow, on_change or once.
+    DataType is optional and takes uint16 (default), int16, uint32, int32, float32 or string.
+    WordOrder (big = high word first, the default, or little) applies to the 32-bit types and strings.
+    Words is the length of a string in registers (two characters each).
+    
     :param file_path: Path to the CSV file
     :return: Dictionary of register map in the format expected by the application
     """
@@ -842,12 +917,42 @@ def load_register_map_from_csv(file_path):
                         logger.warning(f"Invalid register type '{reg_type}' for address {address}, defaulting to 'Holding'")
                         reg_type = 'Holding'
                     
+                    # Get scan class if available (accepts e.g. 'On-change' or 'read once')
+                    scan_class = (row.get('ScanRate') or DEFAULT_SCAN_CLASS).strip().lower().replace('-', '_').replace(' ', '_')
+                    if scan_class == 'read_once':
+                        scan_class = 'once'
+                    if scan_class not in [option['value'] for option in SCAN_CLASS_OPTIONS]:
+                        logger.warning(f"Invalid scan rate '{row.get('ScanRate')}' for address {address}, defaulting to '{DEFAULT_SCAN_CLASS}'")
+                        scan_class = DEFAULT_SCAN_CLASS
+                    
+                    # Get data type if available
+                    data_type = (row.get('DataType') or DEFAULT_DATA_TYPE).strip().lower()
+                    if data_type not in [option['value'] for option in DATA_TYPE_OPTIONS]:
+                        logger.warning(f"Invalid data type '{row.get('DataType')}' for address {address}, defaulting to '{DEFAULT_DATA_TYPE}'")
+                        data_type = DEFAULT_DATA_TYPE
+                    
+                    # Get word order of multi-word values if available
+                    word_order = (row.get('WordOrder') or DEFAULT_WORD_ORDER).strip().lower()
+                    if word_order not in [option['value'] for option in WORD_ORDER_OPTIONS]:
+                        logger.warning(f"Invalid word order '{row.get('WordOrder')}' for address {address}, defaulting to '{DEFAULT_WORD_ORDER}'")
+                        word_order = DEFAULT_WORD_ORDER
+                    
                     # Add to register map
                     register_map[address] = {
                         'name': name,
                         'type': reg_type,
-                        'multiplier': multiplier
+                        'multiplier': multiplier,
+                        'scan': scan_class,
+                        'data_type': data_type
                     }
+                    if word_order != DEFAULT_WORD_ORDER:
+                        register_map[address]['word_order'] = word_order
+                    if data_type == 'string':
+                        try:
+                            register_map[address]['words'] = int(row.get('Words') or 1)
+                        except ValueError:
+                            logger.warning(f"Invalid string length '{row.get('Words')}' for address {address}, defaulting to 1 word")
+                            register_map[address]['words'] = 1
                     
                     # Add unit if present
                     if unit:
@@ -889,34 +994,6 @@ def load_register_map_from_csv(file_path):
         return {}
 
 # Add this function to measure reading time and calculate the optimal polling interval
-def adjust_polling_interval(start_time):
-    """
-    Calculate the time it took to read all registers and adjust polling interval accordingly.
-    
-    :param start_time: The time when reading started
-    :return: Suggested polling interval (read time + 1 second)
-    """
-    global last_read_duration
-    
-    # Calculate how long the read operation took
-    end_time = time.time()
-    read_duration = end_time - start_time
-    
-    # Update the last read duration
-    last_read_duration = read_duration
-    
-    # Calculate suggested polling interval (read time + 1 second)
-    suggested_interval = read_duration + min_polling_interval
-    
-    # Round up to nearest 0.1 second for better display
-    suggested_interval = round(suggested_interval * 10) / 10
-    
-    # Cap at a minimum interval
-    suggested_interval = max(suggested_interval, min_polling_interval)
-    
-    logger.debug(f"Read operation took {read_duration:.2f}s, suggested polling interval: {suggested_interval:.1f}s")
-    return suggested_interval
-
 # Detect pymodbus version to handle API differences
 try:
     import pymodbus
@@ -937,14 +1014,15 @@ except:
     USE_UNIT_PARAMETER = False
 
 # Function to perform a modbus read with version compatibility
-def read_modbus_register(client, address, unit_id, register_type="holding"):
+def read_modbus_register(client, address, unit_id, register_type="holding", count=1):
     """
     Reads a Modbus register (holding, input, coil, or discrete input) with compatibility for different parameter names.
 
     :param client: Modbus client
-    :param address: Register address
+    :param address: Register address (first address when reading a block)
     :param unit_id: Modbus unit/slave ID
     :param register_type: "holding", "input", "coil", or "discrete_input"
+    :param count: Number of consecutive registers or bits to read
     :return: Modbus response
     """
     try:
@@ -963,52 +1041,2544 @@ def read_modbus_register(client, address, unit_id, register_type="holding"):
 
         # Use the appropriate parameter (unit or slave) based on pymodbus version
         if USE_UNIT_PARAMETER:
-            result = read_func(address=address, count=1, unit=unit_id)
+            result = read_func(address=address, count=count, unit=unit_id)
+        else:
+            result = read_func(address=address, count=count, slave=unit_id)
+
+        return result
+
+    except Exception as e:
+        logger.error(f"Error reading {register_type} register at {address}: {e}")
+        logger.error(traceback.format_exc())
+        raise
+
+# --- Block read planner ---
+# Maximum quantities per request allowed by the Modbus specification
+MAX_READ_REGISTERS = 125  # FC03/FC04
+MAX_READ_BITS = 2000  # FC01/FC02
+ILLEGAL_DATA_ADDRESS = 2  # Modbus exception code for addresses the device does not implement
+
+# Register types that are read as 16-bit words (the others are single bits)
+WORD_REGISTER_TYPES = ('Holding', 'Input')
+
+# Largest run of unused addresses read along with a block instead of starting a new request.
+# A new RTU request costs ~8 request bytes, ~5 response overhead bytes and two 3.5 character
+# silences, i.e. about as much bus time as 8 extra words or 128 extra bits.
+MAX_BRIDGE_GAP_REGISTERS = 8
+MAX_BRIDGE_GAP_BITS = 128
+
+# Addresses devices rejected with ILLEGAL DATA ADDRESS, by device model and register type. Next to the
+# holes, the addresses at which a device refuses to continue a request are kept under the key of
+# get_boundary_key: a block starting before such an address must not reach it.
+HOLES_FILE = "register_holes.json"
+LEARNED_HOLES = {}
+holes_lock = threading.Lock()
+
+def get_model_holes(model):
+    """Return the learned holes of a device model as a dict of address sets keyed by register type."""
+    with holes_lock:
+        return LEARNED_HOLES.setdefault(model or 'default', {})
+
+def get_boundary_key(register_type):
+    """Return the key under which the learned block boundaries of a register type are kept in a holes dict."""
+    return f"{register_type} boundaries"
+
+def count_learned_holes(holes):
+    """Return the number of addresses in a holes dict (used to detect newly learned holes)."""
+    with holes_lock:
+        return sum(len(addresses) for addresses in holes.values())
+
+def load_learned_holes(file_path=HOLES_FILE):
+    """Load the holes learned in earlier sessions; a missing or unreadable file starts with none."""
+    if not os.path.exists(file_path):
+        return
+    try:
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+        with holes_lock:
+            for model, holes_by_type in data.items():
+                model_holes = LEARNED_HOLES.setdefault(model, {})
+                for register_type, addresses in holes_by_type.items():
+                    model_holes.setdefault(register_type, set()).update(int(address) for address in addresses)
+        logger.info(f"Loaded learned register holes for {len(data)} device model(s) from {file_path}")
+    except Exception as e:
+        logger.error(f"Error loading learned register holes from {file_path}: {str(e)}")
+
+def save_learned_holes(file_path=HOLES_FILE):
+    """Persist the learned holes so later sessions plan around them from the first scan."""
+    try:
+        with holes_lock:
+            data = {model: {register_type: sorted(addresses) for register_type, addresses in holes_by_type.items()}
+                    for model, holes_by_type in LEARNED_HOLES.items()}
+        with open(file_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        logger.info(f"Saved learned register holes to {file_path}")
+    except Exception as e:
+        logger.error(f"Error saving learned register holes to {file_path}: {str(e)}")
+
+def get_register_words(register_info):
+    """Return the number of consecutive registers a value occupies (1 for 16-bit types and bits)."""
+    if register_info.get('type') not in WORD_REGISTER_TYPES:
+        return 1
+    data_type = register_info.get('data_type', DEFAULT_DATA_TYPE)
+    if data_type == 'string':
+        try:
+            return min(max(int(register_info.get('words', 1)), 1), MAX_READ_REGISTERS)
+        except (TypeError, ValueError):
+            return 1
+    return DATA_TYPE_WORDS.get(data_type, 1)
+
+def make_read_block(register_type, units):
+    """
+    Return a block reading the given units, each a (start, words) tuple of one value.
+
+    Units of more than one word are listed in the block's 'spans' so the block is never split inside them.
+    """
+    start = units[0][0]
+    addresses = [address for unit_start, words in units for address in range(unit_start, unit_start + words)]
+    return {'type': register_type, 'start': start, 'count': addresses[-1] - start + 1, 'addresses': addresses,
+            'spans': {unit_start: words for unit_start, words in units if words > 1}}
+
+def get_block_units(block):
+    """Return the values read by a block as (start, words) tuples, see make_read_block."""
+    spans = block.get('spans', {})
+    units = []
+    addresses = iter(block['addresses'])
+    for address in addresses:
+        words = spans.get(address, 1)
+        units.append((address, words))
+        for _ in range(words - 1):
+            next(addresses)
+    return units
+
+def plan_block_reads(register_map, holes=None, isolated=None, block_size=MAX_READ_REGISTERS):
+    """
+    Group the registers of a map into runs that can each be read with a single request.
+
+    Small gaps between wanted addresses are read along (bridged) unless they contain a known hole.
+    Wanted addresses that are known holes or listed in isolated get a request of their own.
+    Blocks never extend across a learned boundary (see get_boundary_key).
+    All words of a multi-word value (see get_register_words) are wanted and always end up in the same request.
+
+    :param register_map: Dictionary of registers keyed by address (same format as REGISTER_MAP)
+    :param holes: Learned holes of the device model, as returned by get_model_holes
+    :param isolated: Addresses to read on their own (e.g. quarantined registers)
+    :param block_size: Maximum number of registers per read request
+    :return: List of blocks, each a dict with 'type', 'start', 'count', the wanted 'addresses'
+             and the 'spans' of the multi-word values
+    """
+    holes = holes or {}
+    isolated = isolated or set()
+    units_by_type = {}
+    for address, register_info in register_map.items():
+        units_by_type.setdefault(register_info['type'], []).append((address, get_register_words(register_info)))
+
+    blocks = []
+    for register_type, units in units_by_type.items():
+        if register_type in WORD_REGISTER_TYPES:
+            max_count, max_gap = block_size, MAX_BRIDGE_GAP_REGISTERS
+        else:
+            max_count, max_gap = MAX_READ_BITS, MAX_BRIDGE_GAP_BITS
+        with holes_lock:
+            type_holes = set(holes.get(register_type, ()))
+            type_boundaries = set(holes.get(get_boundary_key(register_type), ()))
+        
+        # Registers inside a multi-word value are read as part of it; overlapping values are merged
+        merged = []
+        for address, words in sorted(units):
+            if merged and address < merged[-1][0] + merged[-1][1]:
+                start, previous_words = merged[-1]
+                merged[-1] = (start, max(previous_words, address + words - start))
+            else:
+                merged.append((address, words))
+        
+        block = None
+        for address, words in merged:
+            unit_addresses = range(address, address + words)
+            if type_holes.intersection(unit_addresses) or isolated.intersection(unit_addresses):
+                blocks.append(make_read_block(register_type, [(address, words)]))
+                block = None
+                continue
+            
+            # Extend the current block if the gap is small, holds no known hole and the request stays within limits
+            block_end = block['start'] + block['count'] if block else None
+            if (block and address - block_end <= max_gap and address + words - block['start'] <= max_count
+                    and not type_holes.intersection(range(block_end, address))
+                    and not type_boundaries.intersection(range(block['start'] + 1, address + 1))):
+                block['count'] = address + words - block['start']
+                block['addresses'].extend(unit_addresses)
+                if words > 1:
+                    block['spans'][address] = words
+            else:
+                block = make_read_block(register_type, [(address, words)])
+                blocks.append(block)
+
+    return blocks
+
+def split_block(block):
+    """
+    Split a block into two halves of its wanted values; the gap between the halves is not read.
+
+    :return: Tuple (left block, right block, range of the skipped gap)
+    """
+    units = get_block_units(block)
+    middle = len(units) // 2
+    halves = [make_read_block(block['type'], units[:middle]), make_read_block(block['type'], units[middle:])]
+    gap = range(halves[0]['start'] + halves[0]['count'], halves[1]['start'])
+    return halves[0], halves[1], gap
+
+def block_read_steps(blocks, holes=None, breaker=None):
+    """
+    Generator deciding which request to send next while reading planned blocks.
+
+    It yields the block to read and expects the Modbus response (or None if the request failed)
+    to be sent back, so the same logic drives the threaded and the asyncio engine.
+
+    A block rejected with ILLEGAL DATA ADDRESS is bisected until the invalid addresses are found.
+    Those are added to holes: a single wanted address that is rejected, or a bridged gap whose
+    two neighbouring halves both read fine. If the halves of a block without gap both read fine,
+    the device only refuses the combined span, and the start of the right half is learned as a
+    block boundary instead. A block rejected with any other exception response
+    is retried register by register, so one unreadable address does not hide the rest of its block.
+
+    :param blocks: Blocks as returned by plan_block_reads
+    :param holes: Learned holes of the device model (as returned by get_model_holes), updated in place
+    :param breaker: Circuit breaker dict of the device; its 'timeouts' count of consecutive requests
+                    without response is updated and the remaining blocks are skipped once it reaches
+                    BREAKER_TRIP_TIMEOUTS
+    :return: (as StopIteration value) dictionary mapping each address to its raw value
+             (int for registers, bool for bits), or to None if the address could not be read
+    """
+    holes = holes if holes is not None else {}
+    values = {}
+    pending = deque(blocks)
+    while pending:
+        block = pending.popleft()
+        result = yield block
+        bisection = block.get('bisection')
+
+        if breaker is not None:
+            # An exception response still proves the device is alive
+            if result is None or (result.isError() and not getattr(result, 'exception_code', None)):
+                breaker['timeouts'] += 1
+            else:
+                breaker['timeouts'] = 0
+
+        if result and not result.isError():
+            data = result.registers if block['type'] in WORD_REGISTER_TYPES else result.bits
+            for address in block['addresses']:
+                values[address] = data[address - block['start']]
+            if bisection:
+                bisection['pending'] -= 1
+                if bisection['pending'] == 0 and not bisection['failed'] and bisection['gap']:
+                    # Both halves read fine, so the skipped gap holds the invalid address(es)
+                    logger.info(f"Learned invalid {block['type']} addresses {bisection['gap'].start}-{bisection['gap'].stop - 1}")
+                    with holes_lock:
+                        holes.setdefault(block['type'], set()).update(bisection['gap'])
+                elif bisection['pending'] == 0 and not bisection['failed']:
+                    # Both halves read fine, so only the span across them is refused
+                    logger.info(f"Learned {block['type']} block boundary at {bisection['boundary']}")
+                    with holes_lock:
+                        holes.setdefault(get_boundary_key(block['type']), set()).add(bisection['boundary'])
+            continue
+
+        if bisection:
+            bisection['failed'] = True
+
+        if result is not None and getattr(result, 'exception_code', None) == ILLEGAL_DATA_ADDRESS:
+            if len(get_block_units(block)) > 1:
+                left, right, gap = split_block(block)
+                logger.debug(f"Device rejected {block['type']} {block['start']}+{block['count']} as illegal, bisecting")
+                left['bisection'] = right['bisection'] = {'gap': gap, 'boundary': right['start'], 'pending': 2,
+                                                          'failed': False}
+                pending.extendleft([right, left])
+                continue
+            logger.info(f"Learned invalid {block['type']} address {block['start']}")
+            with holes_lock:
+                holes.setdefault(block['type'], set()).update(block['addresses'])
+
+        elif result is not None and getattr(result, 'exception_code', None) and len(get_block_units(block)) > 1:
+            # The device answered but refused the block - fall back to single reads (multi-word values stay whole)
+            logger.debug(f"Device rejected block {block['type']} {block['start']}+{block['count']}, reading registers individually")
+            single_blocks = [make_read_block(block['type'], [unit]) for unit in get_block_units(block)]
+            pending.extendleft(reversed(single_blocks))
+            continue
+
+        if result is not None:
+            error_info = result.message if hasattr(result, 'message') else str(result)
+            logger.warning(f"Error reading {block['type']} {block['start']}+{block['count']}: {error_info}")
+        for address in block['addresses']:
+            values[address] = None
+
+        if breaker is not None and breaker['timeouts'] >= BREAKER_TRIP_TIMEOUTS:
+            # The device stopped answering - do not wait out a timeout for each remaining block
+            logger.debug(f"No response to {breaker['timeouts']} requests in a row, skipping {len(pending)} remaining blocks")
+            break
+
+    return values
+
+def read_register_blocks(client, blocks, unit_id, holes=None, breaker=None, between_requests=None, device_key=None):
+    """
+    Read planned blocks and split each response back into per-address values.
+
+    :param client: Modbus client
+    :param blocks: Blocks as returned by plan_block_reads
+    :param unit_id: Modbus unit/slave ID
+    :param holes: Learned holes of the device model, updated with newly found invalid addresses
+    :param breaker: Circuit breaker dict of the device, see block_read_steps
+    :param between_requests: Called before every request, e.g. to serve queued writes first
+    :param device_key: Device the requests are counted for in the metrics (not counted if None)
+    :return: Dictionary mapping each address to its raw value, or to None if it could not be read
+    """
+    steps = block_read_steps(blocks, holes, breaker)
+    try:
+        block = next(steps)
+        while True:
+            if between_requests:
+                between_requests()
+            start = time.perf_counter()
+            try:
+                result = read_modbus_register(client, block['start'], unit_id, block['type'], count=block['count'])
+            except Exception as e:
+                logger.warning(f"Block read of {block['type']} {block['start']}-{block['start'] + block['count'] - 1} failed: {e}")
+                result = None
+            if device_key:
+                record_transaction(device_key, f"read_{block['type'].lower()}", result, time.perf_counter() - start,
+                                   get_rtu_read_bytes(block['type'], block['count']))
+            block = steps.send(result)
+    except StopIteration as finished:
+        return finished.value
+
+async def async_read_register_blocks(client, blocks, unit_id, holes=None, breaker=None, between_requests=None,
+                                    device_key=None):
+    """
+    Same as read_register_blocks for the pymodbus async clients; must run on the asyncio engine loop.
+
+    :param client: AsyncModbusSerialClient or AsyncModbusTcpClient
+    :param blocks: Blocks as returned by plan_block_reads
+    :param unit_id: Modbus unit/slave ID
+    :param holes: Learned holes of the device model, updated with newly found invalid addresses
+    :param breaker: Circuit breaker dict of the device, see block_read_steps
+    :param between_requests: Coroutine function awaited before every request, e.g. to serve queued writes first
+    :param device_key: Device the requests are counted for in the metrics (not counted if None)
+    :return: Dictionary mapping each address to its raw value, or to None if it could not be read
+    """
+    steps = block_read_steps(blocks, holes, breaker)
+    try:
+        block = next(steps)
+        while True:
+            if between_requests:
+                await between_requests()
+            start = time.perf_counter()
+            try:
+                # The async clients return an awaitable from the same read methods
+                result = await read_modbus_register(client, block['start'], unit_id, block['type'], count=block['count'])
+            except Exception as e:
+                logger.warning(f"Block read of {block['type']} {block['start']}-{block['start'] + block['count'] - 1} failed: {e}")
+                result = None
+            if device_key:
+                record_transaction(device_key, f"read_{block['type'].lower()}", result, time.perf_counter() - start,
+                                   get_rtu_read_bytes(block['type'], block['count']))
+            block = steps.send(result)
+    except StopIteration as finished:
+        return finished.value
+
+# Function to write a value to a Modbus register
+
+def write_modbus_register(client, address, value, unit_id, register_type):
+    """
+    Writes a value to a Modbus register.
+    :param client: Modbus client
+    :param address: Register address
+    :param value: Value to write
+    :param unit_id: Modbus unit/slave ID
+    :param register_type: "Holding" or "Coil"
+    :return: Modbus response
+    """
+    try:
+        if register_type not in ("Holding", "Coil"):
+            raise ValueError("write register_type must be 'Holding' or 'Coil'")
+        
+        # Select the appropriate write function
+        if register_type == "Holding":
+            write_func = client.write_register
+        elif register_type == "Coil":
+            # Fix: Use write_coil (singular) not write_coils (plural)
+            write_func = client.write_coil
+            
+            # For coils, ensure value is boolean
+            value = bool(int(float(value)))
+            
+        # Use the appropriate parameter based on pymodbus version
+        if USE_UNIT_PARAMETER:
+            result = write_func(address=address, value=value, unit=unit_id)
+        else:
+            result = write_func(address=address, value=value, slave=unit_id)
+        return result
+    except Exception as e:
+        logger.error(f"Error writing to {register_type} {address}: {str(e)}")
+        return None
+
+# --- Block write planner ---
+# Maximum quantities per request allowed by the Modbus specification
+MAX_WRITE_REGISTERS = 123  # FC16
+MAX_WRITE_BITS = 1968  # FC15
+MAX_READWRITE_REGISTERS = 121  # FC23 write quantity
+
+def plan_block_writes(writes, verify=False):
+    """
+    Group writes into runs of adjacent addresses that can each be sent with a single request.
+
+    :param writes: List of (address, raw value, register type) tuples; for repeated addresses the last value wins.
+                   A list of raw words is written to consecutive registers and never split across requests
+                   unless it is longer than one request allows
+    :param verify: True if Holding runs are sent with FC23 so they are read back in the same transaction
+    :return: List of blocks, each a dict with 'type', 'start', 'addresses' and 'values'
+    """
+    values_by_type = {}
+    for address, value, register_type in writes:
+        if register_type not in ("Holding", "Coil"):
+            raise ValueError("write register_type must be 'Holding' or 'Coil'")
+        values_by_type.setdefault(register_type, {})[address] = value
+
+    blocks = []
+    for register_type, values in values_by_type.items():
+        if register_type == "Holding":
+            max_count = MAX_READWRITE_REGISTERS if verify else MAX_WRITE_REGISTERS
+        else:
+            max_count = MAX_WRITE_BITS
+        block = None
+        for address in sorted(values):
+            words = values[address] if isinstance(values[address], list) else [values[address]]
+            for offset in range(0, len(words), max_count):
+                chunk = words[offset:offset + max_count]
+                start = address + offset
+                if not (block and start == block['start'] + len(block['addresses'])
+                        and len(block['addresses']) + len(chunk) <= max_count):
+                    block = {'type': register_type, 'start': start, 'addresses': [], 'values': []}
+                    blocks.append(block)
+                block['addresses'].extend(range(start, start + len(chunk)))
+                block['values'].extend(chunk)
+
+    return blocks
+
+def write_modbus_block(client, block, unit_id, verify=False):
+    """
+    Send one planned write block: FC06/FC05 for a single address, FC16/FC15 for a run,
+    or FC23 (write and read back) for Holding registers when verify is set.
+
+    :param client: Modbus client (for the async clients the returned value must be awaited)
+    :param block: Block as returned by plan_block_writes
+    :param unit_id: Modbus unit/slave ID
+    :param verify: Read Holding registers back in the same transaction
+    :return: Modbus response
+    """
+    unit_parameter = {'unit': unit_id} if USE_UNIT_PARAMETER else {'slave': unit_id}
+    if block['type'] == "Holding" and verify:
+        return client.readwrite_registers(read_address=block['start'], read_count=len(block['values']),
+                                          write_address=block['start'], values=block['values'], **unit_parameter)
+    if len(block['values']) == 1:
+        return write_modbus_register(client, block['start'], block['values'][0], unit_id, block['type'])
+    if block['type'] == "Holding":
+        return client.write_registers(address=block['start'], values=block['values'], **unit_parameter)
+    return client.write_coils(address=block['start'], values=[bool(int(float(value))) for value in block['values']],
+                              **unit_parameter)
+
+def check_write_block(block, response, verify=False):
+    """
+    Map the response to a write block back to its addresses.
+
+    :param block: Block as returned by plan_block_writes
+    :param response: Response of write_modbus_block, or None if the request failed
+    :param verify: True if the block was sent with FC23; registers that read back differently count as failed
+    :return: Dictionary mapping each address to the response, or to None if the write failed
+    """
+    if response is None or response.isError():
+        error_info = response.message if hasattr(response, 'message') else str(response)
+        logger.warning(f"Write of {block['type']} {block['start']}+{len(block['addresses'])} failed: {error_info}")
+        return {address: None for address in block['addresses']}
+    
+    results = {}
+    for index, address in enumerate(block['addresses']):
+        results[address] = response
+        if verify and block['type'] == "Holding" and response.registers[index] != block['values'][index]:
+            logger.warning(f"Verification of Holding {address} failed: wrote {block['values'][index]}, "
+                           f"read back {response.registers[index]}")
+            results[address] = None
+    return results
+
+# --- Value decoding ---
+# The bus workers decode the raw words of a scan in one pass with NumPy (word order, data type,
+# multiplier and bits), so rendering the table is a lookup per register however large the map is.
+WORD_BITS = 16
+
+# Decoding plan of the word registers in REGISTER_MAP, rebuilt when register_map_version changes.
+# The register table is rendered again when it changes too (see update_table).
+decode_plan = {'version': -1}
+register_map_version = 0
+
+def mark_register_map_changed():
+    """Rebuild the decoding plan and the register table; call after REGISTER_MAP or the bit definitions changed."""
+    global register_map_version
+    register_map_version += 1
+
+def get_register_multiplier(register_info):
+    """Return the multiplier of a register as a float, 1 if it is missing or not a number."""
+    try:
+        return float(register_info.get('multiplier', 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+def get_register_data_type(register_info):
+    """Return the data type of a word register, DEFAULT_DATA_TYPE if it is missing or unknown."""
+    data_type = register_info.get('data_type', DEFAULT_DATA_TYPE)
+    if data_type not in [option['value'] for option in DATA_TYPE_OPTIONS]:
+        return DEFAULT_DATA_TYPE
+    return data_type
+
+def get_register_word_order(register_info):
+    """Return the word order of a multi-word register, DEFAULT_WORD_ORDER if it is missing or unknown."""
+    word_order = register_info.get('word_order', DEFAULT_WORD_ORDER)
+    if word_order not in [option['value'] for option in WORD_ORDER_OPTIONS]:
+        return DEFAULT_WORD_ORDER
+    return word_order
+
+def get_decode_plan():
+    """
+    Return the decoding plan of REGISTER_MAP: the addresses of the word registers in ascending order
+    with the number of words, multiplier, word order and data type of each, as NumPy arrays.
+    """
+    global decode_plan
+    version = register_map_version
+    plan = decode_plan
+    if plan['version'] == version:
+        return plan
+
+    registers = sorted((address, register_info) for address, register_info in list(REGISTER_MAP.items())
+                       if isinstance(register_info, dict) and register_info.get('type') in WORD_REGISTER_TYPES)
+    data_types = np.array([get_register_data_type(info) for _, info in registers], dtype=str)
+    plan = {
+        'version': version,
+        'addresses': np.array([address for address, _ in registers], dtype=np.int64),
+        'words': np.array([get_register_words(info) for _, info in registers], dtype=np.int64),
+        'multipliers': np.array([get_register_multiplier(info) for _, info in registers], dtype=np.float64),
+        'swapped': np.array([get_register_word_order(info) == 'little' for _, info in registers], dtype=bool)
+    }
+    for data_type in ('int16', 'int32', 'float32', 'string'):
+        plan[data_type] = data_types == data_type
+    decode_plan = plan
+    return plan
+
+def decode_register_values(values):
+    """
+    Decode the raw values of a device in one pass.
+
+    :param values: Dictionary of raw words keyed by address, None for failed reads
+    :return: Dictionary of columns sorted by address with one row per word register of REGISTER_MAP whose
+             words were all read: 'addresses', 'words' (number of registers), 'raw' (the words as one unsigned
+             integer), 'values' (numeric value, NaN for strings), 'scaled' (multiplied), 'binary' (32 bits,
+             MSB first; the last 16 per word are significant), 'bits' (boolean matrix, bit 0 first) and
+             'strings' (bytes, empty for numbers)
+    """
+    plan = get_decode_plan()
+    value_addresses = np.fromiter(values.keys(), dtype=np.int64, count=len(values))
+    raw = np.array(list(values.values()), dtype=np.float64)  # None becomes NaN
+    order = np.argsort(value_addresses, kind='stable')
+    value_addresses, raw = value_addresses[order], raw[order]
+
+    # Gather the words of every register: one row per register, one column per word
+    max_words = max(int(plan['words'].max()) if len(plan['words']) else 1, 2)
+    offsets = np.arange(max_words)
+    wanted = plan['addresses'][:, None] + offsets
+    used = offsets < plan['words'][:, None]
+    if len(value_addresses):
+        positions = np.minimum(np.searchsorted(value_addresses, wanted), len(value_addresses) - 1)
+        present = (value_addresses[positions] == wanted) & ~np.isnan(raw[positions])
+        words = np.where(present & used, np.nan_to_num(raw[positions]), 0).astype(np.int64) & 0xFFFF
+    else:
+        present = np.zeros(wanted.shape, dtype=bool)
+        words = np.zeros(wanted.shape, dtype=np.int64)
+    rows = np.flatnonzero(np.all(present | ~used, axis=1))
+    words, used, word_counts = words[rows], used[rows], plan['words'][rows]
+
+    # Put the most significant word first
+    swapped = plan['swapped'][rows][:, None] & used
+    words = np.take_along_axis(words, np.where(swapped, word_counts[:, None] - 1 - offsets, offsets), axis=1)
+
+    unsigned = np.where(word_counts == 1, words[:, 0], (words[:, 0] << WORD_BITS) | words[:, 1])
+    numbers = unsigned.astype(np.float64)
+    numbers = np.where(plan['int16'][rows] & (unsigned >= 1 << 15), unsigned - (1 << 16), numbers)
+    numbers = np.where(plan['int32'][rows] & (unsigned >= 1 << 31), unsigned - (1 << 32), numbers)
+    numbers = np.where(plan['float32'][rows], unsigned.astype(np.uint32).view(np.float32), numbers)
+    is_string = plan['string'][rows]
+    numbers[is_string] = np.nan
+
+    bits = (unsigned[:, None] >> np.arange(2 * WORD_BITS)) & 1
+    binary = np.ascontiguousarray(bits[:, ::-1] + ord('0'), dtype=np.uint8).view(f'S{2 * WORD_BITS}').ravel()
+    # Modbus sends the high byte of every word first; trailing NUL padding is dropped by the bytes dtype
+    strings = np.ascontiguousarray(words.astype('>u2')).view(f'S{2 * max_words}').ravel()
+    return {
+        'addresses': plan['addresses'][rows],
+        'words': word_counts,
+        'raw': unsigned,
+        'values': numbers,
+        'scaled': numbers * plan['multipliers'][rows],
+        'binary': binary,
+        'bits': bits.astype(bool),
+        'strings': np.where(is_string, strings, b'')
+    }
+
+def find_decoded_row(decoded, address):
+    """Return the row of an address in the columns of decode_register_values, or None if it was not decoded."""
+    row = int(np.searchsorted(decoded['addresses'], address))
+    if row < len(decoded['addresses']) and decoded['addresses'][row] == address:
+        return row
+    return None
+
+def encode_register_words(register_info, display_value):
+    """
+    Convert a value entered in the UI back to the raw words of a register (the inverse of the decoding).
+
+    :param register_info: Register map entry
+    :param display_value: Value with the multiplier applied, as number or string (text for string registers)
+    :return: List of raw words to write to consecutive registers starting at the register's address
+    :raises ValueError: If the value does not fit the data type
+    """
+    data_type = get_register_data_type(register_info)
+    word_count = get_register_words(register_info)
+    if data_type == 'string':
+        data = str(display_value).encode('ascii', errors='replace')
+        if len(data) > 2 * word_count:
+            raise ValueError(f"'{display_value}' is longer than {2 * word_count} characters")
+        data = data.ljust(2 * word_count, b'\0')
+        words = [int.from_bytes(data[index:index + 2], 'big') for index in range(0, len(data), 2)]
+    else:
+        multiplier = get_register_multiplier(register_info)
+        value = float(display_value) / multiplier if multiplier != 0 else float(display_value)
+        if data_type == 'float32':
+            raw_value = int(np.array(value, dtype=np.float32).view(np.uint32))
         else:
-            result = read_func(address=address, count=1, slave=unit_id)
+            raw_value = int(round(value))  # Scaled values like 0.3 / 0.1 fall just short of the integer
+            if data_type in ('int16', 'int32'):
+                if not -(1 << (WORD_BITS * word_count - 1)) <= raw_value < 1 << (WORD_BITS * word_count - 1):
+                    raise ValueError(f"{display_value} is out of range for {data_type}")
+                if raw_value < 0:
+                    # Two's complement
+                    raw_value += 1 << (WORD_BITS * word_count)
+        if not 0 <= raw_value < 1 << (WORD_BITS * word_count):
+            raise ValueError(f"{display_value} is out of range for {data_type}")
+        words = [(raw_value >> (WORD_BITS * index)) & 0xFFFF for index in reversed(range(word_count))]
+    if get_register_word_order(register_info) == 'little':
+        words.reverse()
+    return words
+
+# --- Background bus workers ---
+# Every serial port (bus) gets its own worker thread that owns the client and scans the units
+# on that bus round-robin. Dash callbacks only read DEVICE_SNAPSHOTS.
+POLLER_SETTINGS = {
+    'interval': 10  # Seconds between two scans of the normal scan class
+}
+
+# Running buses keyed by port; each is a dict with the client, its lock, the worker thread and the scanned unit IDs
+BUS_WORKERS = {}
+# Scanned devices keyed by "<port>:<unit_id>" with their scheduler state
+DEVICES = {}
+# Latest scan results per device, keyed like DEVICES
+DEVICE_SNAPSHOTS = {}
+snapshot_lock = threading.Lock()
+graph_lock = threading.Lock()  # Keeps the times, values and sample count of a graph series consistent
+bus_registry_lock = threading.RLock()  # Protects BUS_WORKERS and DEVICES while buses are started or stopped
+
+def make_device_key(port, unit_id):
+    """Return the key identifying a unit on a bus in DEVICES and DEVICE_SNAPSHOTS."""
+    return f"{port}:{unit_id}"
+
+def parse_unit_ids(value):
+    """
+    Parse the unit ID setting, either a single ID or a comma separated list such as "1,2,5".
+
+    :param value: Integer or string from the Unit ID input
+    :return: List of unique unit IDs (1-247) in the given order
+    """
+    unit_ids = []
+    for part in str(value if value is not None else '').replace(';', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            unit_id = int(float(part))
+        except ValueError:
+            logger.warning(f"Ignoring invalid unit ID '{part}'")
+            continue
+        if 1 <= unit_id <= 247 and unit_id not in unit_ids:
+            unit_ids.append(unit_id)
+    return unit_ids
+
+def publish_snapshot(device_key, **fields):
+    """
+    Update the snapshot of a device with the given fields and give it a new sequence number.
+
+    Each device counts its own sequence, so viewers of one device can skip re-rendering while only
+    other devices publish.
+    """
+    with snapshot_lock:
+        snapshot = DEVICE_SNAPSHOTS.setdefault(device_key, {
+            'status': 'stopped',  # 'running', 'connection_lost' or 'stopped'
+            'values': {},  # Address -> raw value, None if the last read failed
+            'decoded': None,  # Columns of decode_register_values for 'values'
+            'quarantine': {},  # Address -> {'failures', 'until'} of registers that keep failing
+            'timestamp': None,  # Time of the last completed scan
+            'read_duration': 0,
+            'sequence': 0,  # Incremented on every publish of this device
+        })
+        snapshot.update(fields)
+        snapshot['sequence'] += 1
+
+def get_device_snapshot(device_key):
+    """Return a copy of the latest snapshot of a device, or None if the device is not scanned."""
+    with snapshot_lock:
+        snapshot = DEVICE_SNAPSHOTS.get(device_key)
+        return dict(snapshot) if snapshot else None
+
+# Every scan is recorded in GRAPH_DATA for all Holding and Input registers, graphed or not, so that
+# the history of a register can be looked at after the fact. Each graph buffer grows until it covers
+# the retention window, but never beyond max_rows scans.
+RECORDER_SETTINGS = {
+    'retention': 600,  # Seconds of history kept per device
+    'max_rows': 20000  # Scans kept per graph buffer at most, whatever the retention
+}
+
+def record_graph_samples(device_key, values, decoded, timestamp):
+    """
+    Append a row with the scanned values to each graph buffer of the device with a register read by the scan.
+
+    :param device_key: Device the values were read from
+    :param values: Dictionary of raw values keyed by address read by the scan
+    :param decoded: Columns returned by decode_register_values for the device
+    :param timestamp: Time of the scan
+    """
+    if len(decoded['addresses']) == 0:
+        return
+    timestamp = np.datetime64(timestamp, 'us')
+    with graph_lock:
+        for buffer in get_graph_buffers(device_key).values():
+            addresses = buffer['addresses']
+            rows = np.minimum(np.searchsorted(decoded['addresses'], addresses), len(decoded['addresses']) - 1)
+            read = np.array([values.get(address) is not None for address in addresses.tolist()], dtype=bool)
+            read &= decoded['addresses'][rows] == addresses
+            samples = np.where(read, decoded['scaled'][rows], np.nan).astype(np.float32)
+            if not np.isnan(samples).all():
+                append_graph_row(buffer, timestamp, samples)
+
+def append_graph_row(buffer, timestamp, samples):
+    """
+    Append a row to a graph buffer, growing it while its oldest row is within the retention window; the caller holds graph_lock.
+
+    :param buffer: Graph buffer of create_graph_buffer
+    :param timestamp: Time of the scan as datetime64
+    :param samples: Value of each column of the buffer, NaN for registers the scan did not read
+    """
+    capacity = buffer['capacity']
+    row = buffer['count'] % capacity
+    # Grow instead of overwriting the oldest row while it is still within the retention window
+    retention = np.timedelta64(int(RECORDER_SETTINGS['retention'] * 1e6), 'us')
+    if (buffer['count'] >= capacity and capacity < RECORDER_SETTINGS['max_rows']
+            and buffer['times'][row] >= timestamp - retention):
+        resize_graph_buffer(buffer, min(2 * capacity, RECORDER_SETTINGS['max_rows']))
+        capacity = buffer['capacity']
+        row = buffer['count'] % capacity
+    buffer['times'][[row, row + capacity]] = timestamp
+    buffer['values'][[row, row + capacity]] = samples
+    buffer['count'] += 1
+
+# Back-off of registers that keep failing (see update_quarantine)
+QUARANTINE_BASE_DELAY = 5  # Seconds
+QUARANTINE_MAX_DELAY = 300
+
+# Circuit breaker of devices that stop answering (see update_breaker)
+BREAKER_TRIP_TIMEOUTS = 3  # Consecutive requests without response
+BREAKER_BASE_DELAY = 2  # Seconds
+BREAKER_MAX_DELAY = 60
+
+def get_scan_period(scan_class, bus=None):
+    """
+    Return the scan period of a scan class in seconds.
+
+    :param scan_class: One of the values of SCAN_CLASS_OPTIONS
+    :param bus: Bus dict; if given, the period admitted by its scheduler (see update_bus_schedule)
+    :return: Period in seconds, or None for classes that are not read periodically ('once', 'on_change')
+    """
+    if bus and scan_class in bus['schedule']['periods']:
+        return bus['schedule']['periods'][scan_class]
+    if scan_class == 'normal':
+        return POLLER_SETTINGS['interval']
+    return SCAN_CLASS_PERIODS.get(scan_class)
+
+def select_due_registers(device, registers, now):
+    """
+    Pick the registers of a device whose scan class is due at the given time.
+
+    :param device: Device dict from DEVICES
+    :param registers: Register map to schedule
+    :param now: Current time (time.time())
+    :return: Tuple (due registers dict, set of due scan classes, time the next scan class falls due)
+    """
+    last_scan = device['last_scan']
+    pending_reads = device['pending_reads']
+    bus = get_device_bus(device['key'])
+    present_classes = {register_info.get('scan', DEFAULT_SCAN_CLASS) for register_info in registers.values()}
+    
+    due_classes = set()
+    next_due = now + POLLER_SETTINGS['interval']
+    for scan_class in present_classes:
+        period = get_scan_period(scan_class, bus)
+        if scan_class not in last_scan:
+            # Every class is read on the first scan after connecting
+            due_classes.add(scan_class)
+            if period is not None:
+                next_due = min(next_due, now + period)
+        elif period is not None:
+            if now - last_scan[scan_class] >= period:
+                due_classes.add(scan_class)
+                next_due = min(next_due, now + period)
+            else:
+                next_due = min(next_due, last_scan[scan_class] + period)
+    
+    # Quarantined registers are skipped until their back-off expires, unless a re-read was requested.
+    # Those of classes without a period ('once', 'on_change') are probed again once it has expired.
+    quarantine = device['quarantine']
+    due_registers = {}
+    for address, register_info in registers.items():
+        scan_class = register_info.get('scan', DEFAULT_SCAN_CLASS)
+        released = quarantine.get(address, {}).get('until', 0) <= now
+        if (address in pending_reads or (scan_class in due_classes and released)
+                or (address in quarantine and released and get_scan_period(scan_class, bus) is None)):
+            due_registers[address] = register_info
+    return due_registers, due_classes, next_due
+
+def update_quarantine(device, values, now):
+    """
+    Quarantine registers that keep failing so they stop costing a timeout on every scan.
+
+    A register that fails once is read on its own in the next scan. Every further consecutive
+    failure skips it for QUARANTINE_BASE_DELAY seconds, doubling up to QUARANTINE_MAX_DELAY,
+    after which it is probed again. One successful read releases it.
+
+    :param device: Device dict from DEVICES
+    :param values: Values returned by read_register_blocks
+    :param now: Start time of the scan
+    """
+    if len(values) > 1 and all(value is None for value in values.values()):
+        # Nothing answered - the device is unreachable, not the individual registers
+        return
+    
+    quarantine = device['quarantine']
+    for address, value in values.items():
+        if value is not None:
+            if quarantine.pop(address, None):
+                logger.info(f"Register {address} on {device['key']} responds again, released from quarantine")
+            continue
+        
+        entry = quarantine.setdefault(address, {'failures': 0, 'until': now})
+        entry['failures'] += 1
+        if entry['failures'] > 1:
+            delay = min(QUARANTINE_BASE_DELAY * 2 ** (entry['failures'] - 2), QUARANTINE_MAX_DELAY)
+            entry['until'] = now + delay
+            logger.warning(f"Register {address} on {device['key']} failed {entry['failures']} times, quarantined for {delay}s")
+
+def get_device_bus(device_key):
+    """Return the bus dict a device is scanned on, or None if the device is not connected."""
+    device = DEVICES.get(device_key)
+    return BUS_WORKERS.get(device['port']) if device else None
+
+def wake_bus(bus):
+    """Let the worker of a bus start its next round right away instead of sleeping until the next scan falls due."""
+    if bus['engine'] == 'asyncio':
+        bus['loop'].call_soon_threadsafe(bus['async_wakeup'].set)
+    else:
+        bus['wakeup_event'].set()
+
+def request_register_reread(device_key, address):
+    """Ask the bus worker to read a register of a device again as soon as possible (e.g. after a write)."""
+    device = DEVICES.get(device_key)
+    bus = get_device_bus(device_key)
+    if device and bus:
+        device['pending_reads'].add(address)
+        wake_bus(bus)
+
+def is_bus_connected(bus):
+    """Return True if the client of a bus currently has an open connection."""
+    if bus['engine'] == 'asyncio':
+        return bus['client'].connected
+    return bus['client'].is_socket_open()
+
+def ensure_bus_connected(bus):
+    """
+    Check the connection of a bus and try to reopen it if it was lost.
+
+    :param bus: Bus dict from BUS_WORKERS
+    :return: True if the client is connected
+    """
+    client = bus['client']
+    if client.is_socket_open():
+        return True
+    
+    logger.warning(f"Socket of {bus['port']} not open, attempting to reconnect")
+    try:
+        connected = client.connect()
+    except Exception as e:
+        logger.error(f"Error during reconnection attempt on {bus['port']}: {str(e)}")
+        connected = False
+    if connected:
+        enable_keepalive(client)
+    else:
+        logger.error(f"Failed to reconnect to {bus['port']}")
+    return connected
+
+def get_bus_register_map(bus):
+    """Return the register map scanned on a bus: REGISTER_MAP unless the bus was created with a map of its own."""
+    return REGISTER_MAP if bus['register_map'] is None else bus['register_map']
+
+def get_probe_block(device, register_map):
+    """Return a single-register block used to check whether a tripped device answers again."""
+    for address, register_info in sorted(register_map.items()):
+        with holes_lock:
+            is_hole = address in device['holes'].get(register_info['type'], ())
+        if not is_hole and address not in device['quarantine']:
+            return {'type': register_info['type'], 'start': address, 'count': 1, 'addresses': [address]}
+    address = min(register_map)
+    return {'type': register_map[address]['type'], 'start': address, 'count': 1, 'addresses': [address]}
+
+def begin_device_scan(bus, device, now):
+    """
+    Work out what the next scan of a device has to read.
+
+    While the circuit breaker of the device is open only a single-register liveness probe is
+    read, once its back-off has expired.
+
+    :param bus: Bus dict the device is connected to
+    :param device: Device dict from DEVICES
+    :param now: Start time of the scan
+    :return: Scan dict with 'registers', 'due_classes', 'next_due', 'blocks', 'known_holes',
+             'start_time' and 'probe'; nothing needs to be read if 'blocks' is empty
+    """
+    register_map = get_bus_register_map(bus)
+    breaker = device['breaker']
+    if breaker['open']:
+        if now < breaker['retry_at']:
+            return {'registers': {}, 'due_classes': set(), 'next_due': breaker['retry_at'], 'blocks': [],
+                    'known_holes': 0, 'start_time': now, 'probe': False}
+        block = get_probe_block(device, register_map)
+        return {'registers': {block['start']: register_map[block['start']]}, 'due_classes': set(),
+                'next_due': now, 'blocks': [block], 'known_holes': count_learned_holes(device['holes']),
+                'start_time': now, 'probe': True}
+    
+    registers, due_classes, next_due = select_due_registers(device, dict(register_map), now)
+    device['pending_reads'].difference_update(registers)
+    # Failing registers are read on their own so they cannot take a whole block down with them
+    blocks = plan_block_reads(registers, device['holes'], isolated=set(device['quarantine']),
+                              block_size=bus['block_size'])
+    return {'registers': registers, 'due_classes': due_classes, 'next_due': next_due, 'blocks': blocks,
+            'known_holes': count_learned_holes(device['holes']), 'start_time': now, 'probe': False}
+
+def update_breaker(device, scan):
+    """
+    Open or close the circuit breaker of a device after a scan.
+
+    The breaker opens after BREAKER_TRIP_TIMEOUTS consecutive requests without any response.
+    While open, a liveness probe is sent after BREAKER_BASE_DELAY seconds, doubling up to
+    BREAKER_MAX_DELAY after every unanswered probe. Any answer closes it again.
+
+    :param device: Device dict from DEVICES
+    :param scan: Scan dict returned by begin_device_scan
+    :return: True if the breaker is open after the scan
+    """
+    breaker = device['breaker']
+    now = time.time()
+    if scan['probe']:
+        if breaker['timeouts'] == 0:
+            logger.info(f"{device['key']} answers again, resuming the full scan")
+            breaker.update({'open': False, 'probes': 0})
+            # Everything may have changed while the device was away
+            device['last_scan'].clear()
+            return False
+        breaker['probes'] += 1
+    elif breaker['timeouts'] >= BREAKER_TRIP_TIMEOUTS:
+        logger.warning(f"{device['key']} did not answer {breaker['timeouts']} requests in a row, "
+                       f"pausing its scan and probing for it instead")
+        breaker.update({'open': True, 'probes': 0})
+    else:
+        return False
+    
+    breaker['retry_at'] = now + min(BREAKER_BASE_DELAY * 2 ** breaker['probes'], BREAKER_MAX_DELAY)
+    publish_snapshot(device['key'], status='offline', retry_at=breaker['retry_at'])
+    return True
+
+def finish_device_scan(device, scan, values):
+    """
+    Record the values read by a device scan and publish them to its snapshot.
+
+    :param device: Device dict from DEVICES
+    :param scan: Scan dict returned by begin_device_scan
+    :param values: Values returned by read_register_blocks
+    :return: Time at which the next scan of the device falls due
+    """
+    start_time = scan['start_time']
+    due_classes = scan['due_classes']
+    
+    if count_learned_holes(device['holes']) != scan['known_holes']:
+        save_learned_holes()
+    
+    if update_breaker(device, scan):
+        # Values of an aborted scan or failed probe say nothing about the individual registers
+        return device['breaker']['retry_at']
+    if scan['probe']:
+        # Start the full scan right away
+        return time.time()
+    
+    for scan_class in due_classes:
+        device['last_scan'][scan_class] = start_time
+    observe_metric('modbus_scan_duration_seconds', {'device': device['key']}, time.time() - start_time)
+    
+    connection_errors = sum(1 for value in values.values() if value is None)
+    if connection_errors > 0:
+        logger.warning(f"{connection_errors} out of {len(values)} register reads failed on {device['key']}")
+    update_quarantine(device, values, start_time)
+    
+    # The read time shown in the UI is the duration of the normal scan
+    snapshot = get_device_snapshot(device['key']) or {'values': {}, 'read_duration': 0}
+    merged_values = dict(snapshot['values'])
+    merged_values.update(values)
+    decoded = decode_register_values(merged_values)
+    
+    record_graph_samples(device['key'], values, decoded, datetime.now())
+    read_duration = snapshot['read_duration']
+    if 'normal' in due_classes:
+        read_duration = time.time() - start_time
+    
+    publish_snapshot(
+        device['key'],
+        status='running',
+        values=merged_values,
+        decoded=decoded,
+        quarantine={address: dict(entry) for address, entry in device['quarantine'].items()},
+        timestamp=datetime.now(),
+        read_duration=read_duration
+    )
+    return scan['next_due']
+
+def scan_device(bus, device):
+    """
+    Read the registers of the bus's register map whose scan class is due on one device
+    and publish the results to its snapshot.
+
+    :param bus: Bus dict the device is connected to
+    :param device: Device dict from DEVICES
+    :return: Time at which the next scan of the device falls due
+    """
+    scan = begin_device_scan(bus, device, time.time())
+    if not scan['blocks']:
+        return scan['next_due']
+    
+    # Queued writes are sent between the read blocks of the scan
+    values = read_register_blocks(bus['client'], scan['blocks'], device['unit_id'], device['holes'], device['breaker'],
+                                  between_requests=lambda: serve_bus_queue(bus), device_key=device['key'])
+    return finish_device_scan(device, scan, values)
+
+def get_round_devices(bus):
+    """Return the devices of a bus in the order of the next round, starting with a different unit every round
+    so a slow unit does not starve the others."""
+    units = list(bus['units'])
+    bus['next_unit'] %= max(len(units), 1)
+    rotated = units[bus['next_unit']:] + units[:bus['next_unit']]
+    bus['next_unit'] += 1
+    return [DEVICES[key] for key in (make_device_key(bus['port'], unit_id) for unit_id in rotated) if key in DEVICES]
+
+def mark_bus_disconnected(bus):
+    """Flag every device of a bus as unreachable after its connection was lost."""
+    for unit_id in list(bus['units']):
+        device = DEVICES.get(make_device_key(bus['port'], unit_id))
+        if device:
+            # The device may have restarted - read everything again once it is back
+            device['last_scan'].clear()
+            publish_snapshot(device['key'], status='connection_lost')
+
+def bus_worker_loop(bus):
+    """Scan the units of one bus round-robin until the bus is stopped, sleeping until the next scan class falls due."""
+    logger.info(f"Bus worker for {bus['port']} started")
+    while not bus['stop_event'].is_set():
+        # Cleared before serving the queue, so a job queued during the round cuts the next wait short
+        bus['wakeup_event'].clear()
+        next_due = time.time() + POLLER_SETTINGS['interval']
+        try:
+            if not ensure_bus_connected(bus):
+                mark_bus_disconnected(bus)
+                fail_bus_queue(bus, ConnectionError(f"{bus['port']} is not connected"))
+            else:
+                serve_bus_queue(bus)
+                update_bus_schedule(bus, time.time())
+                for device in get_round_devices(bus):
+                    if bus['stop_event'].is_set():
+                        break
+                    next_due = min(next_due, scan_device(bus, device))
+        except Exception as e:
+            logger.error(f"Unexpected error in bus worker for {bus['port']}: {str(e)}")
+            logger.error(traceback.format_exc())
+        
+        # If the scan took longer than the period, start the next one immediately
+        bus['wakeup_event'].wait(max(next_due - time.time(), 0))
+    logger.info(f"Bus worker for {bus['port']} stopped")
+
+# --- Scan scheduler ---
+# Instead of padding the scan with idle time, the scheduler estimates how much bus time every
+# scan class costs - RTU frame times from the byte format plus the learned turnaround time of
+# each device - and admits the classes in priority order against a target bus utilisation.
+# Classes that do not fit are scanned less often than requested instead of overrunning the bus.
+SCHEDULER_SETTINGS = {
+    'target_utilisation': 0.8,  # Share of the bus time the periodic scans may use, the rest is left for writes
+    'update_period': 5  # Seconds between schedule updates
+}
+SCHEDULED_CLASSES = ('fast', 'normal', 'slow')  # Admission order
+SCHEDULER_MIN_SHARE = 0.05  # Share of the target a class that does not fit still gets, so it is never starved
+DEFAULT_TURNAROUND = 0.02  # Seconds a device is assumed to need per request until it has been measured
+TURNAROUND_SMOOTHING = 0.2  # Weight of a new measurement in the learned turnaround time
+
+def get_bus_frame_time(bus, frame_bytes):
+    """Return the line time of a request and its response on a bus; 0 for gateways, where the network dominates."""
+    if parse_gateway_endpoint(bus['port']):
+        return 0.0
+    config = bus['config']
+    return get_rtu_transaction_time(config['baudrate'], *frame_bytes, character_bits=get_character_bits(config))
+
+def record_transaction(device_key, operation, result, duration, frame_bytes):
+    """
+    Account a finished request: update the metrics, the busy time of the bus and the turnaround
+    time of the device (the part of the duration not explained by the frame times).
+    """
+    observe_modbus_request(device_key, operation, result, duration, frame_bytes)
+    device = DEVICES.get(device_key)
+    bus = get_device_bus(device_key)
+    if not device or not bus:
+        return
+    bus['busy_time'] += duration
+    if result is not None and (not result.isError() or getattr(result, 'exception_code', None)):
+        turnaround = max(duration - get_bus_frame_time(bus, frame_bytes), 0.0)
+        device['turnaround'] += TURNAROUND_SMOOTHING * (turnaround - device['turnaround'])
+
+def record_write_block(device_key, block, verify, response, duration):
+    """Account a sent write block (see write_modbus_block), see record_transaction."""
+    verify = verify and block['type'] == 'Holding'
+    operation = 'readwrite_holding' if verify else f"write_{block['type'].lower()}"
+    record_transaction(device_key, operation, response, duration, get_rtu_write_bytes(block['type'], len(block['values']), verify))
+
+def estimate_scan_cost(bus, device, registers):
+    """Return the estimated bus time in seconds to read the given registers from a device once."""
+    return sum(get_bus_frame_time(bus, get_rtu_read_bytes(block['type'], block['count'])) + device['turnaround']
+               for block in plan_block_reads(registers, device['holes'], block_size=bus['block_size']))
+
+def plan_bus_schedule(costs, target):
+    """
+    Admit the scan classes of a bus in priority order against the target utilisation.
+
+    :param costs: Scan class -> estimated bus time of one scan of that class over all units
+    :param target: Target utilisation (0-1)
+    :return: Tuple (scan class -> admitted period in seconds, planned utilisation)
+    """
+    periods = {}
+    planned = 0.0
+    for scan_class in SCHEDULED_CLASSES:
+        requested = get_scan_period(scan_class)
+        cost = costs.get(scan_class, 0)
+        if not cost:
+            periods[scan_class] = requested
+            continue
+        share = cost / requested
+        remaining = target - planned
+        if share > remaining:
+            share = max(remaining, target * SCHEDULER_MIN_SHARE)
+        periods[scan_class] = max(requested, cost / share)
+        planned += cost / periods[scan_class]
+    return periods, planned
+
+def update_bus_schedule(bus, now):
+    """Re-plan the scan periods of a bus from the current map, holes and turnaround times (at most every update_period)."""
+    schedule = bus['schedule']
+    if now - schedule['updated'] < SCHEDULER_SETTINGS['update_period']:
+        return
+    devices = [DEVICES[key] for key in (make_device_key(bus['port'], unit_id) for unit_id in bus['units']) if key in DEVICES]
+    registers_by_class = {}
+    for address, register_info in list(get_bus_register_map(bus).items()):
+        registers_by_class.setdefault(register_info.get('scan', DEFAULT_SCAN_CLASS), {})[address] = register_info
+    costs = {scan_class: sum(estimate_scan_cost(bus, device, registers_by_class.get(scan_class, {})) for device in devices)
+             for scan_class in SCHEDULED_CLASSES}
+    
+    target = SCHEDULER_SETTINGS['target_utilisation']
+    periods, planned = plan_bus_schedule(costs, target)
+    demand = sum(cost / get_scan_period(scan_class) for scan_class, cost in costs.items())
+    # Measured over the time since the last update
+    busy_time = bus['busy_time']
+    utilisation = (busy_time - schedule['busy_time']) / (now - schedule['updated']) if schedule['updated'] else None
+    
+    stretched = {scan_class: period for scan_class, period in periods.items() if period > get_scan_period(scan_class)}
+    if stretched and stretched.keys() != schedule['stretched'].keys():
+        logger.warning(f"Scan demand on {bus['port']} is {demand:.0%} of the bus, more than the {target:.0%} target; "
+                       f"scanning {', '.join(f'{c} every {p:.2f}s' for c, p in stretched.items())}")
+    bus['schedule'] = {'periods': periods, 'stretched': stretched, 'planned_utilisation': planned, 'demand': demand,
+                       'utilisation': utilisation, 'target': target, 'updated': now, 'busy_time': busy_time}
+
+# --- Transaction queue ---
+# Writes and on-demand reads are not sent by the callers: they are queued on the bus and sent
+# by its worker between the read blocks of the scan, so transactions never interleave on the
+# port and a write waits at most for one block read. Callers get a concurrent.futures.Future.
+WRITE_PRIORITY = 0  # Lower values are served first
+READ_PRIORITY = 1
+WRITE_TIMEOUT = 10  # Seconds a Dash callback waits for a queued write
+job_sequence = itertools.count()  # Keeps jobs of the same priority in submission order
+
+def submit_bus_job(device_key, kind, priority, **fields):
+    """
+    Queue a transaction for the worker of the bus a device is on.
+
+    :param device_key: Device key as returned by make_device_key
+    :param kind: 'write' (fields: writes) or 'read' (fields: blocks)
+    :param priority: WRITE_PRIORITY or READ_PRIORITY
+    :return: concurrent.futures.Future resolved with the result of the job
+    """
+    device = DEVICES.get(device_key)
+    bus = get_device_bus(device_key)
+    if not device or not bus:
+        raise ValueError(f"Device {device_key} is not connected")
+    
+    job = dict(fields, kind=kind, device=device, future=concurrent.futures.Future())
+    bus['queue'].put((priority, next(job_sequence), job))
+    wake_bus(bus)
+    return job['future']
+
+def submit_writes(device_key, writes, priority=WRITE_PRIORITY, verify=False):
+    """
+    Queue writes to a device; they are sent without a scan request in between, adjacent
+    addresses merged into FC16/FC15 requests (see plan_block_writes).
+
+    :param device_key: Device key as returned by make_device_key
+    :param writes: List of (address, raw value, register type) tuples
+    :param priority: Queue priority, WRITE_PRIORITY by default
+    :param verify: Write Holding registers with FC23 and check the values read back in the same transaction
+    :return: Future resolved with a dict mapping each address to its Modbus response (None if the write failed)
+    """
+    return submit_bus_job(device_key, 'write', priority, writes=list(writes), verify=verify)
+
+def submit_reads(device_key, addresses, priority=READ_PRIORITY):
+    """
+    Queue a read of registers of REGISTER_MAP on a device, grouped into block requests.
+
+    :param device_key: Device key as returned by make_device_key
+    :param addresses: Register addresses to read
+    :param priority: Queue priority, READ_PRIORITY by default
+    :return: Future resolved with a dict mapping each address to its raw value (None if it could not be read)
+    """
+    device = DEVICES.get(device_key)
+    registers = {address: REGISTER_MAP[address] for address in addresses if address in REGISTER_MAP}
+    holes = device['holes'] if device else None
+    return submit_bus_job(device_key, 'read', priority, blocks=plan_block_reads(registers, holes))
+
+def next_bus_job(bus):
+    """Take the most urgent job from the queue of a bus, or return None if it is empty."""
+    while True:
+        try:
+            _, _, job = bus['queue'].get_nowait()
+        except queue.Empty:
+            return None
+        # Skip jobs whose caller cancelled the future
+        if job['future'].set_running_or_notify_cancel():
+            return job
+
+def complete_bus_job(job, result):
+    """Resolve the future of a finished job; written registers are read again soon after."""
+    if job['kind'] == 'write':
+        # Words of multi-word values are read again with the register they belong to
+        for address in result:
+            if address in REGISTER_MAP:
+                request_register_reread(job['device']['key'], address)
+    job['future'].set_result(result)
+
+def serve_bus_queue(bus):
+    """Send every queued transaction of a bus (worker thread only)."""
+    while True:
+        job = next_bus_job(bus)
+        if job is None:
+            return
+        device = job['device']
+        try:
+            if job['kind'] == 'read':
+                result = read_register_blocks(bus['client'], job['blocks'], device['unit_id'], device['holes'],
+                                              device_key=device['key'])
+            else:
+                result = {}
+                for block in plan_block_writes(job['writes'], job['verify']):
+                    start = time.perf_counter()
+                    try:
+                        response = write_modbus_block(bus['client'], block, device['unit_id'], job['verify'])
+                    except Exception as e:
+                        logger.error(f"Error writing {block['type']} {block['start']} on {device['key']}: {str(e)}")
+                        response = None
+                    record_write_block(device['key'], block, job['verify'], response, time.perf_counter() - start)
+                    result.update(check_write_block(block, response, job['verify']))
+            complete_bus_job(job, result)
+        except Exception as e:
+            logger.error(f"Queued {job['kind']} on {device['key']} failed: {str(e)}")
+            job['future'].set_exception(e)
+
+def fail_bus_queue(bus, error):
+    """Fail every queued transaction of a bus, e.g. when its connection is lost or it is stopped."""
+    while True:
+        job = next_bus_job(bus)
+        if job is None:
+            return
+        job['future'].set_exception(error)
+
+# --- Metrics ---
+# Counters and histograms of the bus traffic in Prometheus text format, served at /metrics.
+# Everything is kept in METRICS keyed by metric name and label values, updated by the bus
+# workers and the Flask request hooks; gauges like the queue depth are read at scrape time.
+METRIC_DEFINITIONS = {
+    'modbus_requests_total': ('counter', "Modbus requests sent"),
+    'modbus_request_duration_seconds': ('histogram', "Time from sending a Modbus request to its response or timeout"),
+    'modbus_timeouts_total': ('counter', "Modbus requests without a response"),
+    'modbus_crc_errors_total': ('counter', "Modbus responses dropped for a bad CRC or an incomplete frame"),
+    'modbus_exceptions_total': ('counter', "Modbus exception responses by exception code"),
+    'modbus_bytes_total': ('counter', "Bytes on the wire by direction, estimated from the frame sizes"),
+    'modbus_scan_duration_seconds': ('histogram', "Duration of a device scan"),
+    'modbus_queue_depth': ('gauge', "Transactions waiting in the queue of a bus"),
+    'dash_callback_duration_seconds': ('histogram', "Time to compute the response of a Dash callback")
+}
+METRIC_BUCKETS = {
+    'modbus_request_duration_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    'modbus_scan_duration_seconds': (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    'dash_callback_duration_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+}
+TCP_FRAME_OVERHEAD = 4  # MBAP header (7 bytes) instead of unit ID and CRC (3 bytes)
+METRICS = {}  # (name, ((label, value), ...)) -> number, or histogram dict for histograms
+metrics_lock = threading.Lock()
+
+def increment_metric(name, labels, amount=1):
+    """Add to a counter; labels is a dict of label names and values."""
+    key = (name, tuple(sorted(labels.items())))
+    with metrics_lock:
+        METRICS[key] = METRICS.get(key, 0) + amount
+
+def observe_metric(name, labels, value):
+    """Record one observation of a histogram."""
+    key = (name, tuple(sorted(labels.items())))
+    buckets = METRIC_BUCKETS[name]
+    with metrics_lock:
+        histogram = METRICS.setdefault(key, {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0})
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram['buckets'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+def observe_modbus_request(device_key, operation, result, duration, frame_bytes):
+    """
+    Record a finished Modbus request in the metrics.
+
+    :param device_key: Device the request was sent to
+    :param operation: Label of the request, e.g. 'read_holding' or 'write_coil'
+    :param result: Modbus response, or None if the request raised
+    :param duration: Seconds from sending to the response or timeout
+    :param frame_bytes: (request bytes, response bytes) of an RTU frame, see get_rtu_read_bytes
+    """
+    labels = {'device': device_key}
+    device = DEVICES.get(device_key)
+    gateway = parse_gateway_endpoint(device['port']) if device else None
+    overhead = TCP_FRAME_OVERHEAD if gateway and gateway[0] == 'tcp' else 0
+    
+    increment_metric('modbus_requests_total', dict(labels, operation=operation))
+    observe_metric('modbus_request_duration_seconds', dict(labels, operation=operation), duration)
+    increment_metric('modbus_bytes_total', dict(labels, direction='tx'), frame_bytes[0] + overhead)
+    if result is None or (result.isError() and not getattr(result, 'exception_code', None)):
+        # pymodbus drops frames with a bad CRC and reports them like a missing response, but with the partial frame
+        if 'Incomplete' in str(result) or 'CRC' in str(result):
+            increment_metric('modbus_crc_errors_total', labels)
+        else:
+            increment_metric('modbus_timeouts_total', labels)
+    elif result.isError():
+        increment_metric('modbus_exceptions_total', dict(labels, code=str(result.exception_code)))
+        increment_metric('modbus_bytes_total', dict(labels, direction='rx'), 5 + overhead)
+    else:
+        increment_metric('modbus_bytes_total', dict(labels, direction='rx'), frame_bytes[1] + overhead)
+
+def format_metric_labels(labels):
+    """Format label pairs as {name="value",...} with Prometheus escaping."""
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+def render_metrics():
+    """Return all metrics in the Prometheus text exposition format."""
+    with metrics_lock:
+        samples = {key: (dict(value, buckets=list(value['buckets'])) if isinstance(value, dict) else value)
+                   for key, value in METRICS.items()}
+    for port, bus in list(BUS_WORKERS.items()):
+        samples[('modbus_queue_depth', (('bus', port),))] = bus['queue'].qsize()
+    
+    lines = []
+    for name, (metric_type, help_text) in METRIC_DEFINITIONS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for (sample_name, labels), value in sorted(samples.items(), key=lambda item: item[0]):
+            if sample_name != name:
+                continue
+            if metric_type != 'histogram':
+                lines.append(f"{name}{format_metric_labels(labels)} {value}")
+                continue
+            for bound, count in zip(METRIC_BUCKETS[name], value['buckets']):
+                lines.append(f"{name}_bucket{format_metric_labels(labels + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{name}_bucket{format_metric_labels(labels + (('le', '+Inf'),))} {value['count']}")
+            lines.append(f"{name}_sum{format_metric_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{format_metric_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+# --- Transports ---
+# A bus is either a serial port or an Ethernet gateway. Gateways are addressed by an endpoint
+# such as "tcp://192.168.1.10:502", which is also the key of the bus, so all units behind one
+# gateway share its connection.
+TRANSPORT_OPTIONS = [
+    {'label': 'Modbus RTU (serial)', 'value': 'rtu'},
+    {'label': 'Modbus TCP', 'value': 'tcp'},
+    {'label': 'RTU over TCP', 'value': 'rtu_over_tcp'}
+]
+ENDPOINT_SCHEMES = {'tcp': 'tcp', 'rtu_over_tcp': 'rtu+tcp'}
+DEFAULT_GATEWAY_PORT = 502
+MAX_PIPELINE_DEPTH = 8
+
+def make_gateway_endpoint(transport, address):
+    """
+    Build the endpoint of a gateway from the address typed in the UI.
+
+    :param transport: 'tcp' or 'rtu_over_tcp'
+    :param address: "host" or "host:port"
+    :return: Endpoint like "tcp://host:502", or None if the address is not valid
+    """
+    host, _, tcp_port = (address or '').strip().rpartition(':')
+    if not host:
+        host, tcp_port = tcp_port, str(DEFAULT_GATEWAY_PORT)
+    if not host or not tcp_port.isdigit() or not 0 < int(tcp_port) < 65536:
+        return None
+    return f"{ENDPOINT_SCHEMES[transport]}://{host}:{int(tcp_port)}"
+
+def parse_gateway_endpoint(port):
+    """
+    Split a gateway endpoint into its parts.
+
+    :param port: Port of a bus (serial port or gateway endpoint)
+    :return: (transport, host, tcp_port), or None for a serial port
+    """
+    for transport, scheme in ENDPOINT_SCHEMES.items():
+        prefix = f"{scheme}://"
+        if port.startswith(prefix):
+            host, _, tcp_port = port[len(prefix):].rpartition(':')
+            return transport, host, int(tcp_port)
+    return None
+
+def create_modbus_client(port, config, use_async=False):
+    """
+    Create the client for a serial port or gateway endpoint, without connecting it.
+
+    :param port: Serial port, gateway endpoint (see make_gateway_endpoint) or in-process simulator
+    :param config: Connection settings (baudrate, parity, stopbits, bytesize, timeout)
+    :param use_async: Create the asyncio variant of the client
+    :return: Modbus client
+    """
+    if port in SIMULATORS and port.startswith(SIMULATOR_SCHEME):
+        return SimulatedModbusClient(SIMULATORS[port], timeout=config['timeout'], use_async=use_async)
+    gateway = parse_gateway_endpoint(port)
+    if gateway is None:
+        client_class = AsyncModbusSerialClient if use_async else ModbusSerialClient
+        return client_class(
+            port=port,
+            baudrate=config['baudrate'],
+            parity=config['parity'],
+            stopbits=config['stopbits'],
+            bytesize=config['bytesize'],
+            timeout=config['timeout']
+        )
+    transport, host, tcp_port = gateway
+    # RTU over TCP carries plain RTU frames (with CRC, without MBAP header) through the socket
+    framer = Framer.RTU if transport == 'rtu_over_tcp' else Framer.SOCKET
+    client_class = AsyncModbusTcpClient if use_async else ModbusTcpClient
+    return client_class(host, port=tcp_port, framer=framer, timeout=config['timeout'])
+
+def enable_keepalive(client):
+    """Turn on TCP keep-alive for a connected gateway client, so idle connections are not dropped by NAT or the gateway."""
+    sock = getattr(client, 'socket', None)
+    if sock is None and getattr(client, 'transport', None):
+        sock = client.transport.get_extra_info('socket')
+    # asyncio hands out a wrapper of the socket, so check the type instead of the class
+    if getattr(sock, 'type', None) == socket.SOCK_STREAM:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        except OSError as e:
+            logger.warning(f"Could not enable TCP keep-alive: {str(e)}")
+
+def get_pipeline_depth(port, config):
+    """
+    Return how many connections to open to a bus.
+
+    Only Modbus TCP gateways on the asyncio engine keep several transactions in flight; RTU framing
+    has no transaction ID to match the responses, so serial ports and RTU over TCP use one.
+    """
+    gateway = parse_gateway_endpoint(port)
+    if gateway is None or gateway[0] != 'tcp' or config.get('engine') != 'asyncio':
+        return 1
+    return max(1, min(int(config.get('pipeline_depth') or 1), MAX_PIPELINE_DEPTH))
+
+# --- Device simulator ---
+# Simulated slave for testing and benchmarking without hardware. One simulator holds the
+# registers of one or more units, seeded from a register map, and answers either in-process
+# (port "sim://<name>", no I/O at all), through a pseudo-terminal pair (Modbus RTU) or as a
+# local Modbus TCP server. All three share the functions below, so they behave the same.
+SIMULATOR_SCHEME = "sim://"
+SIMULATORS = {}  # Port or endpoint to reach a simulator -> simulator dict
+SIMULATOR_DEFAULTS = {
+    'latency': 0.005,  # Seconds between request and response
+    'jitter': 0.002,  # Random extra delay, uniform in [0, jitter]
+    'exception_rate': 0.0,  # Share of requests answered with exception 4 (slave device failure)
+    'timeout_rate': 0.0,  # Share of requests not answered at all
+    'baudrate': None  # In-process only: add the transmission time of the RTU frames at this baud rate
+}
+SIMULATOR_EXCEPTION_CODE = 4  # Slave device failure
+SIMULATOR_BIT_TYPES = ('Coil', 'Discrete_input')
+RTU_CHARACTER_BITS = 11  # Start bit, 8 data bits, parity or second stop bit, stop bit
+RTU_FRAME_GAP_CHARACTERS = 3.5  # Silent interval that ends an RTU frame
+
+def get_rtu_transaction_time(baudrate, request_bytes, response_bytes, character_bits=RTU_CHARACTER_BITS):
+    """Return the seconds an RTU request and its response occupy the line, including the frame gaps."""
+    return (request_bytes + response_bytes + 2 * RTU_FRAME_GAP_CHARACTERS) * character_bits / baudrate
+
+def get_character_bits(config):
+    """Return the bits per character of a serial byte format: start bit, data bits, parity bit, stop bits."""
+    return 1 + config['bytesize'] + (0 if config['parity'] == 'N' else 1) + config['stopbits']
+
+def get_rtu_read_bytes(register_type, count):
+    """Return the sizes of an RTU read request and its response: (request bytes, response bytes)."""
+    data_bytes = 2 * count if register_type in WORD_REGISTER_TYPES else (count + 7) // 8
+    return 8, 5 + data_bytes
+
+def get_rtu_write_bytes(register_type, count, verify=False):
+    """
+    Return the sizes of an RTU write request and its response, for the requests sent by write_modbus_block.
+
+    :param verify: FC23, reading back the written registers
+    """
+    data_bytes = 2 * count if register_type in WORD_REGISTER_TYPES else (count + 7) // 8
+    if verify:
+        return 13 + data_bytes, 5 + data_bytes
+    if count == 1:
+        return 8, 8  # FC05/FC06 echo the request
+    return 9 + data_bytes, 8
+
+def get_default_generators(register_map):
+    """
+    Value generators for a register map: bit toggles on the status registers 106/107, a ramp on
+    the other 16-bit Input registers, everything else keeps its value until written.
+    """
+    generators = {}
+    for address, register_info in register_map.items():
+        if register_info['type'] != 'Input' or get_register_words(register_info) > 1:
+            continue
+        if address in (106, 107):
+            generators[address] = {'kind': 'toggle', 'bits': list(range(16)), 'period': 2}
+        else:
+            generators[address] = {'kind': 'ramp', 'min': 0, 'max': 1000, 'period': 60}
+    return generators
+
+def create_simulator(name, register_map=None, unit_ids=(1,), generators=None, seed=None, **settings):
+    """
+    Create a simulated device and register it for in-process access as "sim://<name>".
+
+    :param name: Name of the simulator
+    :param register_map: Register map the device implements (REGISTER_MAP if None); other addresses
+                         answer with exception 2 like the holes of a real device
+    :param unit_ids: Unit IDs answered by the simulator, all with the same registers
+    :param generators: Address -> generator dict, see simulate_value (get_default_generators if None)
+    :param seed: Seed for the random delays, faults and noise, for repeatable runs
+    :param settings: Overrides of SIMULATOR_DEFAULTS
+    :return: Simulator dict
+    """
+    register_map = REGISTER_MAP if register_map is None else register_map
+    generators = get_default_generators(register_map) if generators is None else generators
+    values = {register_type: {} for register_type in ('Holding', 'Input', 'Coil', 'Discrete_input')}
+    for address, register_info in register_map.items():
+        for word_address in range(address, address + get_register_words(register_info)):
+            values[register_info['type']][word_address] = False if register_info['type'] in SIMULATOR_BIT_TYPES else 0
+    
+    sim = dict(SIMULATOR_DEFAULTS, **settings)
+    sim.update({
+        'name': name,
+        'units': {unit_id: {register_type: dict(table) for register_type, table in values.items()}
+                  for unit_id in unit_ids},
+        'generators': {(register_map[address]['type'], address): dict(generator)
+                       for address, generator in generators.items() if address in register_map},
+        'random': random.Random(seed),
+        'start': time.time(),
+        'lock': threading.Lock(),
+        'requests': 0,
+        'faults': 0
+    })
+    SIMULATORS[SIMULATOR_SCHEME + name] = sim
+    return sim
+
+def get_simulated_delay(sim, frame_bytes=(0, 0)):
+    """
+    Return how long the simulated device takes to answer one request.
+
+    :param frame_bytes: (request bytes, response bytes) on the wire, used when the simulator has a baud rate
+    """
+    with sim['lock']:
+        delay = sim['latency'] + sim['random'].uniform(0, sim['jitter'])
+    if sim['baudrate']:
+        delay += get_rtu_transaction_time(sim['baudrate'], *frame_bytes)
+    return delay
+
+def roll_simulated_fault(sim):
+    """Count a request and decide whether it fails: returns None, 'timeout' or 'exception'."""
+    with sim['lock']:
+        sim['requests'] += 1
+        roll = sim['random'].random()
+        if roll < sim['timeout_rate']:
+            fault = 'timeout'
+        elif roll < sim['timeout_rate'] + sim['exception_rate']:
+            fault = 'exception'
+        else:
+            return None
+        sim['faults'] += 1
+        return fault
+
+def is_simulated_block(sim, unit_id, register_type, address, count):
+    """Return True if the unit implements every address of the block."""
+    table = sim['units'][unit_id][register_type]
+    return all(address + offset in table for offset in range(count))
+
+def simulate_value(sim, register_type, address, stored, now):
+    """
+    Apply the generator of an address, if any, to its stored value.
+
+    Generators are dicts with 'kind' and 'period' (seconds):
+    - ramp: counts from 'min' to 'max' once per period
+    - noise: 'mean' plus gaussian noise with 'stddev'
+    - toggle: flips the listed 'bits' like a binary counter, the first bit every period
+    """
+    generator = sim['generators'].get((register_type, address))
+    if not generator:
+        return stored
+    elapsed = now - sim['start']
+    kind = generator['kind']
+    if kind == 'ramp':
+        low, high = generator.get('min', 0), generator.get('max', 1000)
+        value = low + int((elapsed % generator['period']) / generator['period'] * (high - low))
+    elif kind == 'noise':
+        value = int(round(sim['random'].gauss(generator.get('mean', 1000), generator.get('stddev', 10))))
+    elif kind == 'toggle':
+        step = int(elapsed / generator['period'])
+        value = int(stored)
+        for index, bit in enumerate(generator.get('bits', [0])):
+            if (step >> index) & 1:
+                value ^= 1 << bit
+    else:
+        raise ValueError(f"Unknown simulator generator '{kind}'")
+    if register_type in SIMULATOR_BIT_TYPES:
+        return bool(value & 1)
+    return max(0, min(value, 0xFFFF))
+
+def read_simulated_values(sim, unit_id, register_type, address, count):
+    """Return the current values of a block of a simulated unit."""
+    now = time.time()
+    table = sim['units'][unit_id][register_type]
+    with sim['lock']:
+        return [simulate_value(sim, register_type, address + offset, table[address + offset], now)
+                for offset in range(count)]
+
+def write_simulated_values(sim, unit_id, register_type, address, values):
+    """Store written values; a written address stops following its generator, like a setpoint."""
+    table = sim['units'][unit_id][register_type]
+    with sim['lock']:
+        for offset, value in enumerate(values):
+            table[address + offset] = bool(value) if register_type in SIMULATOR_BIT_TYPES else int(value) & 0xFFFF
+            sim['generators'].pop((register_type, address + offset), None)
+
+class SimulatedModbusClient:
+    """
+    In-process stand-in for the pymodbus serial/TCP clients, answering from a simulator.
+
+    Implements the part of the client API the poller uses; with use_async the request methods
+    return awaitables like the pymodbus async clients.
+    """
+    def __init__(self, sim, timeout=1, use_async=False):
+        self.sim = sim
+        self.timeout = timeout
+        self.use_async = use_async
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+        if self.use_async:
+            return asyncio.sleep(0, result=True)
+        return True
+
+    def is_socket_open(self):
+        return self.connected
+
+    def close(self):
+        self.connected = False
+
+    def _execute(self, handle, frame_bytes):
+        # Timeouts take as long as the client waits, like on a real bus
+        fault = roll_simulated_fault(self.sim)
+        delay = self.timeout if fault == 'timeout' else get_simulated_delay(self.sim, frame_bytes)
+        if not self.use_async:
+            time.sleep(delay)
+            return self._respond(handle, fault)
+
+        async def respond():
+            await asyncio.sleep(delay)
+            return self._respond(handle, fault)
+        return respond()
+
+    def _respond(self, handle, fault):
+        if fault == 'timeout':
+            return ModbusIOException(f"No response from simulator {self.sim['name']}")
+        return handle(fault)
+
+    def _read(self, function_code, register_type, response_class, address, count, unit_id):
+        def handle(fault):
+            if unit_id not in self.sim['units']:
+                return ModbusIOException(f"Simulator {self.sim['name']} has no unit {unit_id}")
+            if not is_simulated_block(self.sim, unit_id, register_type, address, count):
+                return ExceptionResponse(function_code, ILLEGAL_DATA_ADDRESS)
+            if fault == 'exception':
+                return ExceptionResponse(function_code, SIMULATOR_EXCEPTION_CODE)
+            return response_class(read_simulated_values(self.sim, unit_id, register_type, address, count))
+        return self._execute(handle, get_rtu_read_bytes(register_type, count))
+
+    def _write(self, function_code, register_type, address, values, unit_id, build_response):
+        def handle(fault):
+            if unit_id not in self.sim['units']:
+                return ModbusIOException(f"Simulator {self.sim['name']} has no unit {unit_id}")
+            if not is_simulated_block(self.sim, unit_id, register_type, address, len(values)):
+                return ExceptionResponse(function_code, ILLEGAL_DATA_ADDRESS)
+            if fault == 'exception':
+                return ExceptionResponse(function_code, SIMULATOR_EXCEPTION_CODE)
+            write_simulated_values(self.sim, unit_id, register_type, address, values)
+            return build_response()
+        return self._execute(handle, get_rtu_write_bytes(register_type, len(values), function_code == 0x17))
+
+    @staticmethod
+    def _unit(slave, unit):
+        return unit if unit is not None else slave
+
+    def read_holding_registers(self, address, count=1, slave=1, unit=None, **kwargs):
+        return self._read(0x03, 'Holding', ReadHoldingRegistersResponse, address, count, self._unit(slave, unit))
+
+    def read_input_registers(self, address, count=1, slave=1, unit=None, **kwargs):
+        return self._read(0x04, 'Input', ReadInputRegistersResponse, address, count, self._unit(slave, unit))
+
+    def read_coils(self, address, count=1, slave=1, unit=None, **kwargs):
+        return self._read(0x01, 'Coil', ReadCoilsResponse, address, count, self._unit(slave, unit))
+
+    def read_discrete_inputs(self, address, count=1, slave=1, unit=None, **kwargs):
+        return self._read(0x02, 'Discrete_input', ReadDiscreteInputsResponse, address, count, self._unit(slave, unit))
+
+    def write_register(self, address, value, slave=1, unit=None, **kwargs):
+        return self._write(0x06, 'Holding', address, [value], self._unit(slave, unit),
+                           lambda: WriteSingleRegisterResponse(address, value))
+
+    def write_registers(self, address, values, slave=1, unit=None, **kwargs):
+        return self._write(0x10, 'Holding', address, values, self._unit(slave, unit),
+                           lambda: WriteMultipleRegistersResponse(address, len(values)))
+
+    def write_coil(self, address, value, slave=1, unit=None, **kwargs):
+        return self._write(0x05, 'Coil', address, [value], self._unit(slave, unit),
+                           lambda: WriteSingleCoilResponse(address, value))
+
+    def write_coils(self, address, values, slave=1, unit=None, **kwargs):
+        return self._write(0x0F, 'Coil', address, values, self._unit(slave, unit),
+                           lambda: WriteMultipleCoilsResponse(address, len(values)))
+
+    def readwrite_registers(self, read_address=0, read_count=0, write_address=0, values=(), slave=1, unit=None, **kwargs):
+        unit_id = self._unit(slave, unit)
+        return self._write(0x17, 'Holding', write_address, list(values), unit_id,
+                           lambda: ReadWriteMultipleRegistersResponse(
+                               read_simulated_values(self.sim, unit_id, 'Holding', read_address, read_count)))
+
+class SimulatedSlaveContext(ModbusBaseSlaveContext):
+    """pymodbus datastore of one simulated unit, used by the pty and TCP simulator servers."""
+    TYPES = {'h': 'Holding', 'i': 'Input', 'c': 'Coil', 'd': 'Discrete_input'}
+
+    def __init__(self, sim, unit_id):
+        self.sim = sim
+        self.unit_id = unit_id
+
+    def reset(self):
+        pass
+
+    def validate(self, fc_as_hex, address, count=1):
+        # The delay and faults are applied by SimulatedRequestHandler before the request gets here
+        return is_simulated_block(self.sim, self.unit_id, self.TYPES[self.decode(fc_as_hex)], address, count)
+
+    def getValues(self, fc_as_hex, address, count=1):
+        return read_simulated_values(self.sim, self.unit_id, self.TYPES[self.decode(fc_as_hex)], address, count)
+
+    def setValues(self, fc_as_hex, address, values):
+        write_simulated_values(self.sim, self.unit_id, self.TYPES[self.decode(fc_as_hex)], address, values)
+
+class SimulatedRequestHandler(ModbusServerRequestHandler):
+    """
+    Request handler of the simulator servers that applies the latency and faults of the simulator.
+
+    The latency is awaited on the server's event loop, so requests of other connections are
+    served meanwhile like by a gateway with several devices behind it.
+    """
+
+    async def _async_execute(self, request, *addr):
+        if request.slave_id not in self.server.context:
+            # Unknown units are left to the server, which ignores them
+            return await super()._async_execute(request, *addr)
+        sim = self.server.context[request.slave_id].sim
+        fault = roll_simulated_fault(sim)
+        if fault == 'timeout':
+            return  # Left unanswered
+        await asyncio.sleep(get_simulated_delay(sim))
+        if fault == 'exception':
+            response = request.doException(ModbusExceptions.SlaveFailure)
+            response.transaction_id = request.transaction_id
+            response.slave_id = request.slave_id
+            self.server_send(response, *addr)
+            return
+        await super()._async_execute(request, *addr)
+
+class SimulatedTcpServer(ModbusTcpServer):
+    """Modbus TCP server of a simulator, see SimulatedRequestHandler."""
+
+    def callback_new_connection(self):
+        return SimulatedRequestHandler(self)
+
+class SimulatedSerialServer(ModbusSerialServer):
+    """Modbus RTU server of a simulator, see SimulatedRequestHandler."""
+
+    def callback_new_connection(self):
+        return SimulatedRequestHandler(self)
+
+def run_simulator_server(server_class, **kwargs):
+    """Create a simulator server and serve on an event loop of its own (target of the server thread)."""
+    async def serve():
+        # The server binds to the running loop when it is created
+        server = server_class(**kwargs)
+        await server.serve_forever()
+    asyncio.run(serve())
+
+def get_simulator_context(sim):
+    """Return the pymodbus server context answering for all units of a simulator."""
+    slaves = {unit_id: SimulatedSlaveContext(sim, unit_id) for unit_id in sim['units']}
+    return ModbusServerContext(slaves=slaves, single=False)
+
+def start_simulator_tcp(sim, tcp_port=5020, host="127.0.0.1", transport='tcp'):
+    """
+    Serve a simulator as a local Modbus TCP server in a background thread.
+
+    :param transport: 'tcp' for Modbus TCP, 'rtu_over_tcp' for RTU frames through the socket
+    :return: Gateway endpoint to connect to, e.g. "tcp://127.0.0.1:5020"
+    """
+    framer = Framer.RTU if transport == 'rtu_over_tcp' else Framer.SOCKET
+    server = threading.Thread(target=run_simulator_server, name=f"simulator-{sim['name']}-tcp", daemon=True,
+                              args=(SimulatedTcpServer,),
+                              kwargs={'context': get_simulator_context(sim), 'address': (host, tcp_port),
+                                      'framer': framer, 'ignore_missing_slaves': True})
+    server.start()
+    endpoint = make_gateway_endpoint(transport, f"{host}:{tcp_port}")
+    SIMULATORS[endpoint] = sim
+    logger.info(f"Simulator {sim['name']} listening on {endpoint}")
+    return endpoint
+
+def bridge_pty_pair(fd_a, fd_b):
+    """Copy bytes between two pty masters in both directions, like a null-modem cable."""
+    peers = {fd_a: fd_b, fd_b: fd_a}
+    while True:
+        ready, _, _ = select.select(list(peers), [], [], 1)
+        for fd in ready:
+            try:
+                data = os.read(fd, 4096)
+            except OSError:
+                # The serial port on this side is not open at the moment
+                time.sleep(0.1)
+                continue
+            if data:
+                os.write(peers[fd], data)
+
+def start_simulator_pty(sim, baudrate=MODBUS_CONFIG['baudrate']):
+    """
+    Serve a simulator as a Modbus RTU slave on a pseudo-terminal (Linux/macOS only).
+
+    Two pty pairs are bridged back to back: the simulator server opens one, the app the other.
+
+    :return: Serial port to connect to, e.g. "/dev/pts/5"
+    """
+    import tty
+    server_master, server_slave = os.openpty()
+    app_master, app_slave = os.openpty()
+    for fd in (server_slave, app_slave):
+        tty.setraw(fd)
+    server_port, app_port = os.ttyname(server_slave), os.ttyname(app_slave)
+    # Keep the slave ends open so the masters do not report a hang-up while a side is closed
+    sim['pty_fds'] = (server_master, server_slave, app_master, app_slave)
+    
+    threading.Thread(target=bridge_pty_pair, args=(server_master, app_master), name=f"simulator-{sim['name']}-pty",
+                     daemon=True).start()
+    threading.Thread(target=run_simulator_server, name=f"simulator-{sim['name']}-rtu", daemon=True,
+                     args=(SimulatedSerialServer,),
+                     kwargs={'context': get_simulator_context(sim), 'framer': Framer.RTU, 'port': server_port,
+                             'baudrate': baudrate, 'ignore_missing_slaves': True}).start()
+    SIMULATORS[app_port] = sim
+    logger.info(f"Simulator {sim['name']} answering on serial port {app_port}")
+    return app_port
+
+def list_simulator_ports():
+    """Return dropdown options for the running simulators, next to the serial ports."""
+    return [{'label': f"{port} (Simulator {sim['name']})", 'value': port} for port, sim in SIMULATORS.items()
+            if not parse_gateway_endpoint(port)]
+
+# --- asyncio engine ---
+# Alternative to one thread per bus: all buses run as tasks on a single event loop using the
+# pymodbus async clients, which keeps the overhead low when one host supervises many devices.
+ENGINE_OPTIONS = [
+    {'label': 'Threads (one per port)', 'value': 'thread'},
+    {'label': 'asyncio (single event loop)', 'value': 'asyncio'}
+]
+ASYNC_ENGINE = {
+    'loop': None,  # Event loop running all asyncio buses
+    'thread': None  # Thread running the loop
+}
+
+def get_async_loop():
+    """Return the event loop of the asyncio engine, starting it on first use."""
+    with bus_registry_lock:
+        if ASYNC_ENGINE['loop'] is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="modbus-asyncio", daemon=True)
+            thread.start()
+            ASYNC_ENGINE.update({'loop': loop, 'thread': thread})
+            logger.info("asyncio engine started")
+        return ASYNC_ENGINE['loop']
+
+def run_async(coroutine, timeout=None):
+    """Run a coroutine on the asyncio engine loop from another thread (e.g. a Dash callback) and return its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_async_loop()).result(timeout)
+
+async def async_connect_client(port, config, max_attempts=3):
+    """
+    Open an async client for a serial port or gateway, retrying without blocking the other buses.
+
+    :param port: Serial port or gateway endpoint
+    :param config: Connection settings (baudrate, parity, stopbits, bytesize, timeout)
+    :param max_attempts: Number of connection attempts
+    :return: Connected client, or None if all attempts failed
+    """
+    client = create_modbus_client(port, config, use_async=True)
+    for attempt in range(max_attempts):
+        logger.info(f"Async connection attempt {attempt+1}/{max_attempts} on {port}")
+        try:
+            if await client.connect():
+                enable_keepalive(client)
+                return client
+        except Exception as e:
+            logger.error(f"Error during async connection attempt {attempt+1} on {port}: {str(e)}")
+        await asyncio.sleep(1)
+    client.close()
+    return None
+
+async def async_connect_pool(port, config, depth):
+    """
+    Open up to depth connections to a gateway; the first one is required, the others are optional.
+
+    :return: List of connected clients, empty if the first connection failed
+    """
+    pool = []
+    for index in range(depth):
+        client = await async_connect_client(port, config, max_attempts=3 if index == 0 else 1)
+        if client is None:
+            if index:
+                logger.warning(f"{port} accepted only {index} of {depth} connections")
+            break
+        pool.append(client)
+    return pool
+
+async def async_close_client(client):
+    """Close an async client on the engine loop."""
+    client.close()
+
+async def async_ensure_bus_connected(bus):
+    """Same as ensure_bus_connected for a bus on the asyncio engine, checking every pooled connection."""
+    connected = True
+    for client in bus['pool']:
+        if client.connected:
+            continue
+        
+        logger.warning(f"Connection of {bus['port']} lost, attempting to reconnect")
+        try:
+            reconnected = await client.connect()
+        except Exception as e:
+            logger.error(f"Error during reconnection attempt on {bus['port']}: {str(e)}")
+            reconnected = False
+        if reconnected:
+            enable_keepalive(client)
+        else:
+            logger.error(f"Failed to reconnect to {bus['port']}")
+        # The bus is usable as long as its main connection is
+        if client is bus['client']:
+            connected = reconnected
+    return connected
+
+async def async_scan_device(bus, device, client=None):
+    """Same as scan_device for a bus on the asyncio engine, optionally on one of the pooled connections."""
+    scan = begin_device_scan(bus, device, time.time())
+    if not scan['blocks']:
+        return scan['next_due']
+    
+    # Queued writes are sent between the read blocks of the scan
+    values = await async_read_register_blocks(client or bus['client'], scan['blocks'], device['unit_id'],
+                                              device['holes'], device['breaker'],
+                                              between_requests=lambda: async_serve_bus_queue(bus),
+                                              device_key=device['key'])
+    return finish_device_scan(device, scan, values)
+
+async def async_scan_round(bus):
+    """
+    Scan every unit of a bus once and return when the next scan falls due.
+
+    With several pooled connections, units are scanned concurrently, one per connection, so the
+    gateway has that many transactions in flight instead of waiting for each response in turn.
+    """
+    next_due = time.time() + POLLER_SETTINGS['interval']
+    clients = [client for client in bus['pool'] if client.connected] or [bus['client']]
+    devices = get_round_devices(bus)
+    for index in range(0, len(devices), len(clients)):
+        if bus['stop_event'].is_set():
+            break
+        group = devices[index:index + len(clients)]
+        due = await asyncio.gather(*(async_scan_device(bus, device, client) for device, client in zip(group, clients)))
+        next_due = min([next_due] + list(due))
+    return next_due
+
+async def async_bus_worker_loop(bus):
+    """Task scanning the units of one bus round-robin on the asyncio engine until the bus is stopped."""
+    logger.info(f"Async bus worker for {bus['port']} started")
+    while not bus['stop_event'].is_set():
+        # Cleared before serving the queue, see bus_worker_loop
+        bus['async_wakeup'].clear()
+        next_due = time.time() + POLLER_SETTINGS['interval']
+        try:
+            if not await async_ensure_bus_connected(bus):
+                mark_bus_disconnected(bus)
+                fail_bus_queue(bus, ConnectionError(f"{bus['port']} is not connected"))
+            else:
+                await async_serve_bus_queue(bus)
+                update_bus_schedule(bus, time.time())
+                next_due = min(next_due, await async_scan_round(bus))
+        except Exception as e:
+            logger.error(f"Unexpected error in async bus worker for {bus['port']}: {str(e)}")
+            logger.error(traceback.format_exc())
+        
+        try:
+            await asyncio.wait_for(bus['async_wakeup'].wait(), max(next_due - time.time(), 0))
+        except asyncio.TimeoutError:
+            pass
+    logger.info(f"Async bus worker for {bus['port']} stopped")
+
+async def async_serve_bus_queue(bus):
+    """Same as serve_bus_queue for a bus on the asyncio engine."""
+    while True:
+        job = next_bus_job(bus)
+        if job is None:
+            return
+        device = job['device']
+        try:
+            if job['kind'] == 'read':
+                result = await async_read_register_blocks(bus['client'], job['blocks'], device['unit_id'], device['holes'],
+                                                          device_key=device['key'])
+            else:
+                result = {}
+                for block in plan_block_writes(job['writes'], job['verify']):
+                    start = time.perf_counter()
+                    try:
+                        response = await write_modbus_block(bus['client'], block, device['unit_id'], job['verify'])
+                    except Exception as e:
+                        logger.error(f"Error writing {block['type']} {block['start']} on {device['key']}: {str(e)}")
+                        response = None
+                    record_write_block(device['key'], block, job['verify'], response, time.perf_counter() - start)
+                    result.update(check_write_block(block, response, job['verify']))
+            complete_bus_job(job, result)
+        except Exception as e:
+            logger.error(f"Queued {job['kind']} on {device['key']} failed: {str(e)}")
+            job['future'].set_exception(e)
+
+# --- Device transaction API ---
+async def async_read_device_registers(device_key, addresses):
+    """
+    Awaitable batch read of registers of REGISTER_MAP on a connected device.
+
+    The read is queued on the bus (see submit_reads), so it works for both engines and can be
+    awaited on any event loop.
+
+    :param device_key: Device key as returned by make_device_key
+    :param addresses: Register addresses to read
+    :return: Dictionary mapping each address to its raw value, or to None if it could not be read
+    """
+    return await asyncio.wrap_future(submit_reads(device_key, addresses))
+
+async def async_write_device_registers(device_key, values, verify=False):
+    """
+    Awaitable batch write to Holding registers and Coils of REGISTER_MAP on a connected device.
+
+    The writes are queued as one job, so no scan request is interleaved, and adjacent addresses
+    are merged into FC16/FC15 requests. Can be awaited on any event loop.
+
+    :param device_key: Device key as returned by make_device_key
+    :param values: Dictionary of raw values to write keyed by address
+    :param verify: Write Holding registers with FC23 and check the values read back
+    :return: Dictionary mapping each address to True if the write succeeded
+    """
+    writes = [(address, value, REGISTER_MAP.get(address, {}).get('type', 'Holding'))
+              for address, value in sorted(values.items())]
+    responses = await asyncio.wrap_future(submit_writes(device_key, writes, verify=verify))
+    results = {}
+    for address, value, register_type in writes:
+        results[address] = responses.get(address) is not None
+        if not results[address]:
+            logger.warning(f"Failed to write {value} to {register_type} {address} on {device_key}")
+    return results
+
+def write_device_register(device_key, address, value, register_type):
+    """
+    Write one register of a device through the queue of its bus and wait for the result.
+
+    :param value: Raw value, or list of raw words written to consecutive registers in one request
+    :return: Modbus response, or None if the write failed
+    """
+    words = value if isinstance(value, list) else [value]
+    try:
+        responses = submit_writes(device_key, [(address, value, register_type)]).result(WRITE_TIMEOUT)
+        if any(responses.get(address + offset) is None for offset in range(len(words))):
+            return None
+        return responses[address]
+    except Exception as e:
+        logger.error(f"Error writing to {register_type} {address} on {device_key}: {str(e)}")
+        return None
+
+# --- Parameter backup ---
+# A backup holds the values of all Holding registers of REGISTER_MAP read from one device,
+# e.g. a golden drive, so they can be cloned onto other units. Every register is stored once at
+# its address with its data type and word order, however many words it occupies.
+BACKUP_FORMAT = "modbus-parameter-backup"
+BACKUP_FORMAT_VERSION = 2
+BULK_TIMEOUT = 60  # Seconds to wait for the reads and writes of a backup or restore
+
+def get_backup_addresses():
+    """Return the addresses of the Holding registers of REGISTER_MAP, which make up a backup."""
+    return sorted(address for address, register_info in REGISTER_MAP.items() if register_info['type'] == 'Holding')
+
+def get_backup_register_info(entry):
+    """Return a register map entry to encode the unscaled value of a backup entry with encode_register_words."""
+    return {'type': 'Holding', 'data_type': entry['data_type'], 'word_order': entry['word_order'],
+            'words': entry['words'], 'multiplier': 1}
+
+def get_decoded_value(decoded, row):
+    """Return the unscaled value of a row of decode_register_values: text for strings, int or float otherwise."""
+    if decoded['strings'][row]:
+        return decoded['strings'][row].decode('ascii', errors='replace')
+    value = float(decoded['values'][row])
+    return int(value) if value.is_integer() else value
+
+def read_backup_values(device_key, addresses):
+    """
+    Read Holding registers of REGISTER_MAP from a device and decode them.
+
+    :return: Tuple of the raw words keyed by address (None if unreadable) and the decoded values keyed by
+             the address of each register whose words were all read
+    """
+    words = submit_reads(device_key, addresses).result(BULK_TIMEOUT)
+    decoded = decode_register_values(words)
+    values = {}
+    for address in addresses:
+        row = find_decoded_row(decoded, address)
+        if row is not None:
+            values[address] = get_decoded_value(decoded, row)
+    return words, values
+
+def create_parameter_backup(device_key):
+    """
+    Read every Holding register of REGISTER_MAP from a device with block reads.
+
+    :param device_key: Device key as returned by make_device_key
+    :return: Backup dict ready to be saved as JSON
+    :raises ValueError: If the device is not connected
+    """
+    addresses = get_backup_addresses()
+    _, values = read_backup_values(device_key, addresses)
+    unreadable = [address for address in addresses if address not in values]
+    if unreadable:
+        logger.warning(f"Backup of {device_key} skips unreadable registers {unreadable}")
+    
+    registers = {}
+    for address, value in values.items():
+        register_info = REGISTER_MAP[address]
+        registers[str(address)] = {
+            'name': register_info['name'],
+            'data_type': get_register_data_type(register_info),
+            'word_order': get_register_word_order(register_info),
+            'words': get_register_words(register_info),
+            'value': value
+        }
+    bus = get_device_bus(device_key)
+    return {
+        'format': BACKUP_FORMAT,
+        'version': BACKUP_FORMAT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'device': device_key,
+        'model': bus['config'].get('model', 'default') if bus else 'default',
+        'registers': registers
+    }
+
+def parse_parameter_backup(backup):
+    """
+    Validate a backup dict loaded from a file.
+
+    Version 1 backups, which hold one raw word per register, are read as UINT16 values.
+
+    :param backup: Dict as written by create_parameter_backup
+    :return: Dictionary of entries with the unscaled 'value', 'data_type', 'word_order' and 'words' keyed by address
+    :raises ValueError: If the file is not a backup, was written by a newer version or holds invalid values
+    """
+    if not isinstance(backup, dict) or backup.get('format') != BACKUP_FORMAT:
+        raise ValueError("Not a parameter backup file")
+    if backup.get('version', 0) > BACKUP_FORMAT_VERSION:
+        raise ValueError(f"Backup format version {backup.get('version')} is newer than supported ({BACKUP_FORMAT_VERSION})")
+    
+    entries = {}
+    for address, entry in backup.get('registers', {}).items():
+        entry = {
+            'value': entry['value'],
+            'data_type': entry.get('data_type', DEFAULT_DATA_TYPE),
+            'word_order': entry.get('word_order', DEFAULT_WORD_ORDER),
+            'words': int(entry.get('words', 1))
+        }
+        register_info = get_backup_register_info(entry)
+        entry.update(data_type=get_register_data_type(register_info), word_order=get_register_word_order(register_info))
+        entry['words'] = get_register_words(dict(register_info, data_type=entry['data_type']))
+        encode_register_words(get_backup_register_info(entry), entry['value'])  # Raises ValueError if invalid
+        entries[int(address)] = entry
+    return entries
+
+def diff_parameter_backup(device_key, backup_values):
+    """
+    Compare backup values with the live values of a device word by word.
+
+    Registers that are no longer Holding registers of the same number of words in REGISTER_MAP are ignored.
+
+    :param device_key: Device key as returned by make_device_key
+    :param backup_values: Dictionary of backup entries keyed by address, as returned by parse_parameter_backup
+    :return: Dictionary mapping each differing address to a (live value, backup value) tuple of unscaled values;
+             the live value is None if the register could not be read
+    """
+    addresses = sorted(address for address, entry in backup_values.items()
+                       if REGISTER_MAP.get(address, {}).get('type') == 'Holding'
+                       and get_register_words(REGISTER_MAP[address]) == entry['words'])
+    live_words, live_values = read_backup_values(device_key, addresses)
+    differences = {}
+    for address in addresses:
+        entry = backup_values[address]
+        words = encode_register_words(get_backup_register_info(entry), entry['value'])
+        if [live_words.get(address + offset) for offset in range(len(words))] != words:
+            differences[address] = (live_values.get(address), entry['value'])
+    return differences
+
+def restore_parameter_backup(device_key, backup_values):
+    """
+    Write the backup values that differ from the live device in batched transactions,
+    then verify them with a batched read-back.
+
+    Every word of a multi-word register is written in the same FC16 request.
+
+    :param device_key: Device key as returned by make_device_key
+    :param backup_values: Dictionary of backup entries keyed by address, as returned by parse_parameter_backup
+    :return: Dict with the 'differences' found, and the addresses whose write 'failed' or did not 'verify'
+    """
+    differences = diff_parameter_backup(device_key, backup_values)
+    if not differences:
+        return {'differences': {}, 'failed': [], 'unverified': []}
+    
+    writes = []
+    for address in differences:
+        entry = backup_values[address]
+        writes.append((address, encode_register_words(get_backup_register_info(entry), entry['value']), 'Holding'))
+    logger.info(f"Restoring {len(writes)} registers on {device_key} in {len(plan_block_writes(writes))} transaction(s)")
+    responses = submit_writes(device_key, writes).result(BULK_TIMEOUT)
+    failed = sorted(address for address, words, _ in writes
+                    if any(responses.get(address + offset) is None for offset in range(len(words))))
+    
+    remaining = {address: backup_values[address] for address in differences if address not in failed}
+    unverified = sorted(diff_parameter_backup(device_key, remaining)) if remaining else []
+    if failed or unverified:
+        logger.warning(f"Restore on {device_key}: write failed for {failed}, verification failed for {unverified}")
+    return {'differences': differences, 'failed': failed, 'unverified': unverified}
+
+# --- Bus registry ---
+def add_bus_units(port, unit_ids):
+    """
+    Add units to a running bus; they are scanned from the next round on.
+
+    :param port: Port of the bus
+    :param unit_ids: Unit IDs to scan on that bus
+    """
+    with bus_registry_lock:
+        bus = BUS_WORKERS[port]
+        for unit_id in unit_ids:
+            key = make_device_key(port, unit_id)
+            if key not in DEVICES:
+                DEVICES[key] = {
+                    'key': key,
+                    'port': port,
+                    'unit_id': unit_id,
+                    'holes': get_model_holes(bus['config'].get('model')),  # Shared by all units of the same model
+                    'last_scan': {},
+                    'pending_reads': set(),
+                    'quarantine': {},  # Address -> {'failures', 'until'}, see update_quarantine
+                    'breaker': {'open': False, 'timeouts': 0, 'probes': 0, 'retry_at': 0},  # See update_breaker
+                    'turnaround': DEFAULT_TURNAROUND  # Learned response time in seconds, see record_transaction
+                }
+                publish_snapshot(key, status='running', values={}, decoded=None, timestamp=None)
+        # Plan with the new units on the next round
+        bus['schedule']['updated'] = 0
+        bus['units'] = list(dict.fromkeys(bus['units'] + list(unit_ids)))
+    wake_bus(bus)
+
+def create_bus(port, client, config, port_info, pool=None, register_map=None, block_size=MAX_READ_REGISTERS):
+    """
+    Return the dict of a bus without units and without a worker, see start_bus for the other parameters.
+
+    :param register_map: Registers to scan on the bus, None for REGISTER_MAP
+    :param block_size: Maximum number of registers per read request
+    """
+    bus = {
+        'port': port,
+        'client': client,
+        'pool': pool or [client],
+        'engine': config['engine'],
+        'config': dict(config),
+        'port_info': port_info,
+        'register_map': register_map,
+        'block_size': block_size,
+        'units': [],
+        'next_unit': 0,  # Index of the unit the next round starts with
+        'busy_time': 0.0,  # Seconds spent in requests, see record_transaction
+        'schedule': {'periods': {}, 'stretched': {}, 'planned_utilisation': None, 'demand': None,
+                     'utilisation': None, 'target': None, 'updated': 0, 'busy_time': 0.0},  # See update_bus_schedule
+        'stop_event': threading.Event(),
+    }
+    # Only the worker uses the client, everything else goes through the queue
+    bus['queue'] = queue.PriorityQueue()
+    if bus['engine'] == 'asyncio':
+        bus['loop'] = get_async_loop()
+        bus['async_wakeup'] = asyncio.Event()
+    else:
+        bus['wakeup_event'] = threading.Event()  # Set to start the next scan early (stop request, queued job, re-read)
+    return bus
+
+def start_bus(port, client, config, unit_ids, port_info, pool=None):
+    """
+    Start scanning the given units on a connected client, replacing any bus on the same port.
+
+    With config['engine'] == 'asyncio' the client must be an async client connected on the engine
+    loop and the bus runs as a task there; otherwise it gets its own worker thread.
+
+    :param port: Port of the bus (serial port or gateway endpoint)
+    :param client: Connected Modbus client, owned by the worker from now on
+    :param config: Connection settings used to open the client
+    :param unit_ids: Unit IDs to scan on that bus
+    :param port_info: Description of the connection shown in the UI
+    :param pool: All connections to a gateway, client first (asyncio engine only, see async_scan_round)
+    """
+    stop_bus(port)
+    
+    bus = create_bus(port, client, config, port_info, pool)
+    with bus_registry_lock:
+        BUS_WORKERS[port] = bus
+        add_bus_units(port, unit_ids)
+    
+    if bus['engine'] == 'asyncio':
+        bus['task'] = asyncio.run_coroutine_threadsafe(async_bus_worker_loop(bus), bus['loop'])
+    else:
+        bus['thread'] = threading.Thread(target=bus_worker_loop, args=(bus,), name=f"modbus-bus-{port}", daemon=True)
+        bus['thread'].start()
+
+def stop_bus(port):
+    """Stop the worker of a bus, wait for its current scan to finish and close its client."""
+    with bus_registry_lock:
+        bus = BUS_WORKERS.pop(port, None)
+        if not bus:
+            return
+        for unit_id in bus['units']:
+            key = make_device_key(port, unit_id)
+            DEVICES.pop(key, None)
+            with snapshot_lock:
+                DEVICE_SNAPSHOTS.pop(key, None)
+    
+    logger.info(f"Stopping bus worker for {port}")
+    bus['stop_event'].set()
+    wake_bus(bus)
+    try:
+        # Buses driven directly (see run_benchmark_point) have no worker
+        if 'task' in bus:
+            bus['task'].result()
+        elif 'thread' in bus and bus['thread'].is_alive():
+            bus['thread'].join()
+    except Exception as e:
+        logger.error(f"Bus worker for {port} ended with an error: {str(e)}")
+    fail_bus_queue(bus, ConnectionError(f"{port} was disconnected"))
+    
+    try:
+        logger.info(f"Closing Modbus connection on {port}")
+        for client in bus['pool']:
+            if bus['engine'] == 'asyncio':
+                run_async(async_close_client(client))
+            else:
+                client.close()
+    except Exception as e:
+        logger.error(f"Error closing connection on {port}: {str(e)}")
 
-        return result
+def stop_all_buses():
+    """Stop every bus worker and close all connections."""
+    for port in list(BUS_WORKERS):
+        stop_bus(port)
 
-    except Exception as e:
-        logger.error(f"Error reading {register_type} register at {address}: {e}")
-        logger.error(traceback.format_exc())
-        raise
+# --- Benchmark ---
+# Runs the real scan path (planner, block reader, quarantine, snapshots) against an in-process
+# simulator over a matrix of map sizes, block sizes, baud rates, device latencies and unit
+# counts, so results of different versions can be compared (see --benchmark).
+BENCHMARK_DEFAULTS = {
+    'map_sizes': [50, 0],  # Number of registers taken from REGISTER_MAP, 0 for all
+    'block_sizes': [MAX_READ_REGISTERS, 16],  # Maximum registers per read request
+    'baudrates': [19200, 115200],
+    'latencies': [0.002],  # Device response latency in seconds
+    'units': [1, 4],
+    'cycles': 10,
+    'warmup': 2  # Cycles run before measuring, while the register holes are learned
+}
 
-# Function to write a value to a Modbus register
+def get_percentile(samples, percentile):
+    """Return a percentile of a list of samples (nearest rank)."""
+    ranked = sorted(samples)
+    return ranked[max(0, math.ceil(percentile / 100 * len(ranked)) - 1)]
 
-def write_modbus_register(client, address, value, unit_id, register_type):
+def run_benchmark_point(map_size, block_size, baudrate, latency, units, cycles, warmup):
     """
-    Writes a value to a Modbus register.
-    :param client: Modbus client
-    :param address: Register address
-    :param value: Value to write
-    :param unit_id: Modbus unit/slave ID
-    :param register_type: "Holding" or "Coil"
-    :return: Modbus response
+    Measure full scans of all units on one simulated bus.
+
+    A cycle scans every unit once with all registers due, exactly like a bus worker round.
+
+    :return: Result dict with the parameters and the measured rates, latencies and CPU time
     """
+    register_map = dict(sorted(REGISTER_MAP.items())[:map_size or None])
+    name = f"benchmark-{len(register_map)}-{block_size}-{baudrate}-{latency}-{units}"
+    port = SIMULATOR_SCHEME + name
+    sim = create_simulator(name, register_map, unit_ids=range(1, units + 1), seed=0,
+                           latency=latency, jitter=0, baudrate=baudrate)
+    config = dict(MODBUS_CONFIG, baudrate=baudrate, engine='thread', model=name)
+    client = create_modbus_client(port, config)
+    client.connect()
+    
+    durations, cpu_times = [], []
     try:
-        if register_type not in ("Holding", "Coil"):
-            raise ValueError("write register_type must be 'Holding' or 'Coil'")
-        
-        # Select the appropriate write function
-        if register_type == "Holding":
-            write_func = client.write_register
-        elif register_type == "Coil":
-            # Fix: Use write_coil (singular) not write_coils (plural)
-            write_func = client.write_coil
-            
-            # For coils, ensure value is boolean
-            value = bool(int(float(value)))
-            
-        # Use the appropriate parameter based on pymodbus version
-        if USE_UNIT_PARAMETER:
-            result = write_func(address=address, value=value, unit=unit_id)
-        else:
-            result = write_func(address=address, value=value, slave=unit_id)
-        return result
-    except Exception as e:
-        logger.error(f"Error writing to {register_type} {address}: {str(e)}")
-        return None
+        # The map and block size belong to this bus only, buses and callbacks running meanwhile keep theirs
+        with bus_registry_lock:
+            bus = BUS_WORKERS[port] = create_bus(port, client, config, name, register_map=register_map,
+                                                 block_size=block_size)
+            add_bus_units(port, list(range(1, units + 1)))
+        for cycle in range(warmup + cycles):
+            if cycle == warmup:
+                requests_before = sim['requests']
+            start, cpu_start = time.perf_counter(), time.process_time()
+            for device in get_round_devices(bus):
+                device['last_scan'].clear()  # Everything is due
+                scan_device(bus, device)
+            if cycle >= warmup:
+                durations.append(time.perf_counter() - start)
+                cpu_times.append(time.process_time() - cpu_start)
+    finally:
+        stop_bus(port)
+        SIMULATORS.pop(port, None)
+        with holes_lock:
+            LEARNED_HOLES.pop(name, None)
+    
+    elapsed = sum(durations)
+    transactions = sim['requests'] - requests_before
+    return {
+        'map_size': len(register_map),
+        'block_size': block_size,
+        'baudrate': baudrate,
+        'latency': latency,
+        'units': units,
+        'cycles': cycles,
+        'transactions_per_cycle': transactions / cycles,
+        'transactions_per_s': transactions / elapsed,
+        'registers_per_s': len(register_map) * units * cycles / elapsed,
+        'cycle_latency': {
+            'mean': elapsed / cycles,
+            'p50': get_percentile(durations, 50),
+            'p95': get_percentile(durations, 95),
+            'p99': get_percentile(durations, 99)
+        },
+        'cpu_time_per_cycle': sum(cpu_times) / cycles
+    }
+
+def run_benchmark(output_path, **matrix):
+    """
+    Run the benchmark over every combination of the matrix and save the results as JSON.
+
+    :param output_path: JSON file to write
+    :param matrix: Overrides of BENCHMARK_DEFAULTS
+    :return: Benchmark report dict
+    """
+    settings = dict(BENCHMARK_DEFAULTS, **{k: v for k, v in matrix.items() if v is not None})
+    holes_file_existed = os.path.exists(HOLES_FILE)
+    results = []
+    for map_size, block_size, baudrate, latency, units in itertools.product(
+            settings['map_sizes'], settings['block_sizes'], settings['baudrates'], settings['latencies'], settings['units']):
+        result = run_benchmark_point(map_size, block_size, baudrate, latency, units, settings['cycles'], settings['warmup'])
+        logger.info(f"Benchmark {result['map_size']} registers, blocks of {block_size}, {baudrate} baud, "
+                    f"{latency * 1000:g} ms latency, {units} unit(s): {result['transactions_per_s']:.1f} transactions/s, "
+                    f"{result['registers_per_s']:.0f} registers/s, p95 cycle {result['cycle_latency']['p95'] * 1000:.1f} ms")
+        results.append(result)
+    # Scans save the holes of the benchmark models while learning them; write the file back without them
+    if holes_file_existed:
+        save_learned_holes()
+    elif os.path.exists(HOLES_FILE):
+        os.remove(HOLES_FILE)
+    
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'pymodbus_version': PYMODBUS_VERSION,
+        'python_version': sys.version.split()[0],
+        'settings': settings,
+        'results': results
+    }
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Saved benchmark results to {output_path}")
+    return report
 
 # --- Serial port detection ---
 def list_serial_ports():
@@ -1029,7 +3599,7 @@ def list_serial_ports():
         else:
             logger.warning("No serial ports detected. If using a USB converter, check if it's properly connected and drivers are installed.")
             
-        return port_list
+        return port_list + list_simulator_ports()
     except Exception as e:
         logger.error(f"Error detecting serial ports: {str(e)}")
         logger.error(traceback.format_exc())
@@ -1039,6 +3609,26 @@ def list_serial_ports():
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
 app.title = "Modbus RTU Web Viewer"
 
+# Metrics endpoint for Prometheus, next to the Dash app on the same Flask server
+@app.server.route("/metrics")
+def serve_metrics():
+    return flask.Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+# Every Dash callback is a POST to this route; time them all here instead of in each callback
+@app.server.before_request
+def start_callback_timer():
+    if flask.request.path == "/_dash-update-component":
+        flask.g.callback_start = time.perf_counter()
+
+@app.server.after_request
+def record_callback_duration(response):
+    start = flask.g.pop('callback_start', None)
+    if start is not None:
+        payload = flask.request.get_json(silent=True) or {}
+        observe_metric('dash_callback_duration_seconds', {'callback': payload.get('output', 'unknown')},
+                       time.perf_counter() - start)
+    return response
+
 # Check USB serial drivers and status
 def check_usb_serial_status():
     try:
@@ -1117,6 +3707,37 @@ app.layout = dbc.Container([
                 dbc.Col(dbc.Button("Connect", id="connect-btn", color="primary"), width="auto"),
                 dbc.Col(html.Div(id="connection-status"), width=4),
             ], className="mb-3"),
+            
+            # Drives behind an Ethernet gateway; all units entered below share one connection to it
+            dbc.Row([
+                dbc.Col(html.Div("Transport:"), width=2),
+                dbc.Col(
+                    dcc.Dropdown(
+                        id="transport-select",
+                        options=TRANSPORT_OPTIONS,
+                        value=MODBUS_CONFIG['transport'],
+                        clearable=False
+                    ), width=2
+                ),
+                dbc.Col(dcc.Input(
+                    id="gateway-address-input",
+                    type="text",
+                    placeholder=f"Gateway host[:port], default port {DEFAULT_GATEWAY_PORT}",
+                    className="form-control"),
+                    width=3
+                ),
+                dbc.Col(html.Div("Pipeline Depth:"), width="auto"),
+                dbc.Col(dcc.Input(
+                    id="pipeline-depth-input",
+                    type="number",
+                    value=MODBUS_CONFIG['pipeline_depth'],
+                    min=1,
+                    max=MAX_PIPELINE_DEPTH,
+                    step=1,
+                    className="form-control"),
+                    width=1
+                ),
+            ], className="mb-3"),
 
             # Protocol Settings
             html.H6("Protocol Settings", className="mt-3"),
@@ -1178,16 +3799,14 @@ app.layout = dbc.Container([
                     )
                 ], width=2),
                 
-                # Unit ID
+                # Unit IDs, several units on the same bus are scanned round-robin
                 dbc.Col([
-                    html.Label("Unit ID:"),
+                    html.Label("Unit ID(s):"),
                     dcc.Input(
                         id="unit-id-input",
-                        type="number",
-                        value=MODBUS_CONFIG['unit_id'],
-                        min=1,
-                        max=247,
-                        step=1,
+                        type="text",
+                        value=str(MODBUS_CONFIG['unit_id']),
+                        placeholder="e.g. 1 or 1,2,5",
                         className="form-control"
                     )
                 ], width=2),
@@ -1206,8 +3825,74 @@ app.layout = dbc.Container([
                     width=2
                 ),
                 dbc.Col(dbc.Button("Apply Settings", id="apply-settings-btn", color="info"), width="auto"),
-                # Add a new column to display the suggested interval
-                dbc.Col(html.Div(id="suggested-interval-display"), width=4),
+                # Bus utilisation and the scan periods admitted by the scheduler
+                dbc.Col(html.Div(id="suggested-interval-display"), width=6),
+            ], className="mb-2"),
+            
+            # The display refresh only re-renders the latest scan, it does not touch the bus
+            dbc.Row([
+                dbc.Col(html.Div("Display Refresh (sec):"), width=2),
+                dbc.Col(dcc.Input(
+                    id="refresh-interval", 
+                    value=1, 
+                    type="number", 
+                    min=0.5, 
+                    step=0.5, 
+                    className="form-control"), 
+                    width=2
+                ),
+            ], className="mb-2"),
+            
+            # Scan classes are slowed down rather than loading the bus beyond this
+            dbc.Row([
+                dbc.Col(html.Div("Target Bus Utilisation (%):"), width=2),
+                dbc.Col(dcc.Input(
+                    id="target-utilisation", 
+                    value=round(SCHEDULER_SETTINGS['target_utilisation'] * 100), 
+                    type="number", 
+                    min=10, 
+                    max=100, 
+                    step=5, 
+                    className="form-control"), 
+                    width=2
+                ),
+            ], className="mb-2"),
+            
+            # Every register is recorded, the graph shows this much history
+            dbc.Row([
+                dbc.Col(html.Div("Recorded History (min):"), width=2),
+                dbc.Col(dcc.Input(
+                    id="recorder-retention", 
+                    value=RECORDER_SETTINGS['retention'] // 60, 
+                    type="number", 
+                    min=1, 
+                    step=1, 
+                    className="form-control"), 
+                    width=2
+                ),
+            ], className="mb-2"),
+            
+            # The engine applies to ports connected after "Apply Settings"
+            dbc.Row([
+                dbc.Col(html.Div("Polling Engine:"), width=2),
+                dbc.Col(
+                    dcc.Dropdown(
+                        id="engine-select",
+                        options=ENGINE_OPTIONS,
+                        value=MODBUS_CONFIG['engine'],
+                        clearable=False
+                    ),
+                    width=3
+                ),
+                dbc.Col(html.Div("Device Model:"), width=2),
+                dbc.Col(dcc.Input(
+                    id="device-model-input",
+                    type="text",
+                    value=MODBUS_CONFIG['model'],
+                    placeholder="e.g. inverter-v2",
+                    className="form-control"),
+                    width=3
+                ),
             ], className="mb-2"),
             
             
@@ -1248,6 +3933,43 @@ app.layout = dbc.Container([
                 dbc.Col(dcc.Download(id="download-csv")),
             ], className="mb-3"),
             
+            # Backup of all Holding registers of the selected device, e.g. to clone a golden drive
+            dbc.Row([
+                dbc.Col(html.Div("Parameter Backup:"), width=2),
+                dbc.Col(
+                    dbc.Button("Backup Holding Registers", id="backup-params-btn", color="secondary"),
+                    width=3
+                ),
+                dbc.Col(html.Div(id="backup-status"), width=5),
+                dbc.Col(dcc.Download(id="download-backup")),
+            ], className="mb-3"),
+            
+            dbc.Row([
+                dbc.Col(html.Div("Restore Parameters:"), width=2),
+                dbc.Col(
+                    dcc.Upload(
+                        id='upload-backup',
+                        children=html.Div([
+                            'Drag and Drop or ',
+                            html.A('Select Backup File')
+                        ]),
+                        style={
+                            'width': '100%',
+                            'height': '40px',
+                            'lineHeight': '40px',
+                            'borderWidth': '1px',
+                            'borderStyle': 'dashed',
+                            'borderRadius': '5px',
+                            'textAlign': 'center'
+                        },
+                        multiple=False
+                    ),
+                    width=3
+                ),
+                dbc.Col(dbc.Button("Restore", id="restore-params-btn", color="warning"), width="auto"),
+                dbc.Col(html.Div(id="restore-status"), width=5),
+            ], className="mb-3"),
+            
         ])
     ], className="mb-4"),
 
@@ -1384,6 +4106,15 @@ app.layout = dbc.Container([
                             dbc.Button("Clear Graph", id="clear-graph-btn", color="secondary", className="me-2"),
                             width=2
                         ),
+                        dbc.Col(
+                            dcc.Dropdown(
+                                id="graph-render-mode",
+                                options=GRAPH_RENDER_OPTIONS,
+                                value=DEFAULT_GRAPH_RENDER_MODE,
+                                clearable=False
+                            ),
+                            width=2
+                        ),
                     ], className="mb-3"),
         
                     dbc.Row([
@@ -1407,6 +4138,25 @@ app.layout = dbc.Container([
             
             html.Hr(),
             html.H5("Live Register Values:"),
+            dbc.Row([
+                dbc.Col(html.Div("Device:"), width=1),
+                dbc.Col(
+                    dcc.Dropdown(
+                        id="device-select",
+                        options=[],  # Populated with the scanned devices
+                        placeholder="Connect to a device first",
+                        clearable=False
+                    ),
+                    width=4
+                ),
+            ], className="mb-3"),
+            # Edits staged with the "Stage" buttons are written together, adjacent registers in one request
+            dbc.Row([
+                dbc.Col(html.Div(id="staged-writes-list"), width=5),
+                dbc.Col(dbc.Switch(id="verify-writes-switch", label="Verify (FC23 read-back)", value=False), width=2),
+                dbc.Col(dbc.Button("Commit Staged Writes", id="commit-staged-btn", color="primary"), width="auto"),
+                dbc.Col(dbc.Button("Clear Staged", id="clear-staged-btn", color="secondary"), width="auto"),
+            ], className="mb-3"),
             html.Div(id="register-table"),
         ])
     ]),
@@ -1416,7 +4166,18 @@ app.layout = dbc.Container([
     
     dcc.Download(id="download-graph-csv"),
     # Store current config in a dcc.Store component
-    dcc.Store(id="current-config", data=MODBUS_CONFIG)
+    dcc.Store(id="current-config", data=MODBUS_CONFIG),
+    # Sequence number of the snapshot last rendered in this browser session
+    dcc.Store(id="rendered-sequence", data=None),
+    # Table structure last rendered in this browser session (see update_table) and the values shown in it
+    dcc.Store(id="rendered-layout", data=None),
+    dcc.Store(id="register-values", data=None),
+    # Device, registers, cursor of each trace and zoom range the register graph was last drawn with (see update_graph)
+    dcc.Store(id="graph-cursors", data=None),
+    # Raw values staged for a batch write, keyed by register address
+    dcc.Store(id="staged-writes", data={}),
+    # Raw values of the uploaded parameter backup, keyed by register address
+    dcc.Store(id="restore-backup", data=None)
 ], fluid=True)  # Added fluid=True for better layout on all screen sizes
 
 
@@ -1438,17 +4199,17 @@ def refresh_ports(n):
     Input({'type': 'coil-write-btn', 'index': dash.ALL}, 'n_clicks'),
     [State({'type': 'coil-write-btn', 'index': dash.ALL}, 'id'),
      State({'type': 'coil-switch', 'index': dash.ALL}, 'value'),
-     State("current-config", "data")],
+     State("device-select", "value")],
     prevent_initial_call=True
 )
-def write_coil_value(n_clicks, ids, values, config):
-    global client
-    
+def write_coil_value(n_clicks, ids, values, device_key):
     if not n_clicks or not any(n_clicks):
         return dash.no_update, dash.no_update
     
-    # Check if client is connected
-    if not client or not client.is_socket_open():
+    # Check if the selected device is connected
+    device = DEVICES.get(device_key)
+    bus = get_device_bus(device_key)
+    if not device or not bus or not is_bus_connected(bus):
         return dash.no_update, dbc.Alert("Not connected to device", color="danger")
     
     # Find the button that was clicked
@@ -1468,10 +4229,10 @@ def write_coil_value(n_clicks, ids, values, config):
                 # Convert bool to value
                 coil_value = bool(new_value)
                 
-                # Write the value
-                result = write_modbus_register(client, register_index, coil_value, config['unit_id'], register_type)
+                # Write the value (waits for the bus worker to finish its current request)
+                result = write_device_register(device_key, register_index, coil_value, register_type)
                 
-                if result and not hasattr(result, 'isError'):
+                if result is not None and not result.isError():
                     return dash.no_update, dbc.Alert(f"Coil value {new_value} written to register {register_index}", color="success")
                 else:
                     return dash.no_update, dbc.Alert(f"Failed to write to coil {register_index}", color="danger")
@@ -1528,6 +4289,7 @@ def update_from_csv_upload(contents, filename):
         
         # Update the register map and renamed vars
         REGISTER_MAP = new_register_map
+        mark_register_map_changed()
         renamed_vars = {k: v['name'] for k, v in REGISTER_MAP.items()}
         
         logger.info(f"Successfully updated register map with {len(REGISTER_MAP)} registers from CSV")
@@ -1554,7 +4316,8 @@ def export_register_map_to_csv(n_clicks):
         
         # Create a string buffer
         csv_string = io.StringIO()
-        fieldnames = ['Address', 'Name', 'Type', 'Multiplier', 'Unit', 'BitDefinitions']
+        fieldnames = ['Address', 'Name', 'Type', 'Multiplier', 'Unit', 'BitDefinitions', 'ScanRate', 'DataType',
+                      'WordOrder', 'Words']
         
         # Write CSV header and data
         writer = csv.DictWriter(csv_string, fieldnames=fieldnames)
@@ -1578,7 +4341,11 @@ def export_register_map_to_csv(n_clicks):
                 'Type': register_info['type'],
                 'Multiplier': register_info.get('multiplier', 1),
                 'Unit': unit,
-                'BitDefinitions': bit_defs_str
+                'BitDefinitions': bit_defs_str,
+                'ScanRate': register_info.get('scan', DEFAULT_SCAN_CLASS),
+                'DataType': register_info.get('data_type', DEFAULT_DATA_TYPE),
+                'WordOrder': register_info.get('word_order', DEFAULT_WORD_ORDER),
+                'Words': register_info.get('words', '')
             })
         
         # Generate timestamp for filename
@@ -1603,17 +4370,17 @@ def export_register_map_to_csv(n_clicks):
     Input({'type': 'write-btn', 'index': dash.ALL}, 'n_clicks'),
     [State({'type': 'write-btn', 'index': dash.ALL}, 'id'),
      State({'type': 'value-input', 'index': dash.ALL}, 'value'),
-     State("current-config", "data")],
+     State("device-select", "value")],
     prevent_initial_call=True
 )
-def write_holding_register_value(n_clicks, ids, values, config):
-    global client
-    
+def write_holding_register_value(n_clicks, ids, values, device_key):
     if not n_clicks or not any(n_clicks):
         return dash.no_update, dash.no_update
     
-    # Check if client is connected
-    if not client or not client.is_socket_open():
+    # Check if the selected device is connected
+    device = DEVICES.get(device_key)
+    bus = get_device_bus(device_key)
+    if not device or not bus or not is_bus_connected(bus):
         return dash.no_update, dbc.Alert("Not connected to device", color="danger")
     
     # Find the button that was clicked
@@ -1627,22 +4394,16 @@ def write_holding_register_value(n_clicks, ids, values, config):
                 if register_type != "Holding":
                     continue
                     
-                # Get the multiplier to convert back to raw value
-                multiplier = REGISTER_MAP[register_index].get('multiplier', 1)
-                
                 try:
-                    # Convert input value considering the multiplier
-                    if multiplier != 0:
-                        raw_value = int(float(values[i]) / multiplier)
-                    else:
-                        raw_value = int(float(values[i]))
+                    # Convert input value considering the multiplier and data type
+                    raw_words = encode_register_words(REGISTER_MAP[register_index], values[i])
                         
-                    logger.info(f"Writing value {raw_value} to holding register {register_index}")
+                    logger.info(f"Writing value {raw_words} to holding register {register_index}")
                     
-                    # Write the value
-                    result = write_modbus_register(client, register_index, raw_value, config['unit_id'], register_type)
+                    # Write the value (waits for the bus worker to finish its current request)
+                    result = write_device_register(device_key, register_index, raw_words, register_type)
                     
-                    if result and not hasattr(result, 'isError'):
+                    if result is not None and not result.isError():
                         return dash.no_update, dbc.Alert(f"Value {values[i]} written to holding register {register_index}", color="success")
                     else:
                         return dash.no_update, dbc.Alert(f"Failed to write to holding register {register_index}", color="danger")
@@ -1652,6 +4413,187 @@ def write_holding_register_value(n_clicks, ids, values, config):
     
     return dash.no_update, dash.no_update
     
+@app.callback(
+    Output("staged-writes", "data"),
+    [Input({'type': 'stage-btn', 'index': dash.ALL}, 'n_clicks'),
+     Input({'type': 'coil-stage-btn', 'index': dash.ALL}, 'n_clicks')],
+    [State({'type': 'value-input', 'index': dash.ALL}, 'value'),
+     State({'type': 'value-input', 'index': dash.ALL}, 'id'),
+     State({'type': 'coil-switch', 'index': dash.ALL}, 'value'),
+     State({'type': 'coil-switch', 'index': dash.ALL}, 'id'),
+     State("staged-writes", "data")],
+    prevent_initial_call=True
+)
+def stage_register_write(stage_clicks, coil_stage_clicks, values, value_ids, coil_values, coil_ids, staged):
+    # Re-rendering the table recreates the buttons, which also triggers this callback
+    if not ctx.triggered or not ctx.triggered[0]['value']:
+        raise PreventUpdate
+    
+    register_index = ctx.triggered_id['index']
+    staged = dict(staged or {})
+    try:
+        if ctx.triggered_id['type'] == 'stage-btn':
+            new_value = dict(zip((i['index'] for i in value_ids), values)).get(register_index)
+            if new_value in (None, ""):
+                raise PreventUpdate
+            # Convert the displayed value back to the raw register words
+            raw_words = encode_register_words(REGISTER_MAP[register_index], new_value)
+        else:
+            raw_words = [int(bool(dict(zip((i['index'] for i in coil_ids), coil_values)).get(register_index)))]
+    except (KeyError, ValueError) as e:
+        logger.error(f"Cannot stage write to register {register_index}: {str(e)}")
+        raise PreventUpdate
+    
+    logger.info(f"Staged value {raw_words} for register {register_index}")
+    # Words of multi-word values are staged at consecutive addresses and committed in the same request
+    for offset, raw_value in enumerate(raw_words):
+        staged[str(register_index + offset)] = raw_value
+    return staged
+
+
+@app.callback(
+    Output("staged-writes-list", "children"),
+    Input("staged-writes", "data")
+)
+def render_staged_writes(staged):
+    if not staged:
+        return html.Div("No staged writes", className="text-muted")
+    items = []
+    for address, raw_value in sorted(staged.items(), key=lambda item: int(item[0])):
+        register_info = REGISTER_MAP.get(int(address), {})
+        items.append(html.Li(f"{address}: {register_info.get('name', 'Unknown')} = {raw_value}"))
+    return html.Div([html.Strong(f"{len(staged)} staged write(s):"), html.Ul(items, className="mb-0")])
+
+
+@app.callback(
+    [Output("staged-writes", "data", allow_duplicate=True),
+     Output("connection-status", "children", allow_duplicate=True)],
+    [Input("commit-staged-btn", "n_clicks"),
+     Input("clear-staged-btn", "n_clicks")],
+    [State("staged-writes", "data"),
+     State("verify-writes-switch", "value"),
+     State("device-select", "value")],
+    prevent_initial_call=True
+)
+def commit_staged_writes(commit_clicks, clear_clicks, staged, verify, device_key):
+    if ctx.triggered_id == "clear-staged-btn":
+        return {}, dash.no_update
+    if not staged:
+        return dash.no_update, dbc.Alert("No staged writes", color="warning")
+    if device_key not in DEVICES:
+        return dash.no_update, dbc.Alert("Not connected to device", color="danger")
+    
+    writes = [(int(address), raw_value, REGISTER_MAP.get(int(address), {}).get('type', 'Holding'))
+              for address, raw_value in staged.items()]
+    transactions = len(plan_block_writes(writes, verify))
+    logger.info(f"Committing {len(writes)} staged writes to {device_key} in {transactions} transaction(s)")
+    try:
+        responses = submit_writes(device_key, writes, verify=verify).result(WRITE_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Error committing staged writes: {str(e)}")
+        return dash.no_update, dbc.Alert(f"Error: {str(e)}", color="danger")
+    
+    # Keep the failed writes staged so they can be retried
+    failed = {address: raw_value for address, raw_value in staged.items() if responses.get(int(address)) is None}
+    if failed:
+        return failed, dbc.Alert(f"{len(failed)} of {len(writes)} staged writes failed: "
+                                 f"{', '.join(sorted(failed, key=int))}", color="danger")
+    return {}, dbc.Alert(f"{len(writes)} staged writes committed in {transactions} transaction(s)"
+                         f"{' and verified' if verify else ''}", color="success")
+
+
+@app.callback(
+    [Output("download-backup", "data"),
+     Output("backup-status", "children")],
+    Input("backup-params-btn", "n_clicks"),
+    State("device-select", "value"),
+    prevent_initial_call=True
+)
+def backup_parameters(n_clicks, device_key):
+    if not n_clicks:
+        return dash.no_update, dash.no_update
+    if device_key not in DEVICES:
+        return dash.no_update, dbc.Alert("Not connected to device", color="danger")
+    
+    try:
+        logger.info(f"Creating parameter backup of {device_key}")
+        backup = create_parameter_backup(device_key)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"parameters_{device_key.replace(':', '_').replace('/', '_')}_{timestamp}.json"
+        return dict(
+            content=json.dumps(backup, indent=2),
+            filename=filename
+        ), dbc.Alert(f"Backed up {len(backup['registers'])} Holding registers", color="success")
+    except Exception as e:
+        logger.error(f"Error creating parameter backup: {str(e)}")
+        logger.error(traceback.format_exc())
+        return dash.no_update, dbc.Alert(f"Error creating backup: {str(e)}", color="danger")
+
+
+@app.callback(
+    [Output("restore-backup", "data"),
+     Output("restore-status", "children")],
+    Input("upload-backup", "contents"),
+    [State("upload-backup", "filename"),
+     State("device-select", "value")],
+    prevent_initial_call=True
+)
+def load_parameter_backup(contents, filename, device_key):
+    if contents is None:
+        return dash.no_update, dash.no_update
+    
+    try:
+        content_type, content_string = contents.split(',')
+        backup_values = parse_parameter_backup(json.loads(base64.b64decode(content_string)))
+    except Exception as e:
+        logger.error(f"Error reading parameter backup {filename}: {str(e)}")
+        return None, dbc.Alert(f"Error reading backup: {str(e)}", color="danger")
+    
+    status = f"Loaded {len(backup_values)} registers from {filename}."
+    if device_key in DEVICES:
+        # Preview what a restore would change on the selected device
+        try:
+            differences = diff_parameter_backup(device_key, backup_values)
+            status += f" {len(differences)} differ from {device_key}"
+            if differences:
+                status += ": " + ", ".join(f"{address} ({live} → {value})" for address, (live, value) in list(differences.items())[:10])
+                if len(differences) > 10:
+                    status += ", ..."
+        except Exception as e:
+            logger.error(f"Error comparing parameter backup: {str(e)}")
+    return {str(address): value for address, value in backup_values.items()}, dbc.Alert(status, color="info")
+
+
+@app.callback(
+    Output("restore-status", "children", allow_duplicate=True),
+    Input("restore-params-btn", "n_clicks"),
+    [State("restore-backup", "data"),
+     State("device-select", "value")],
+    prevent_initial_call=True
+)
+def restore_parameters(n_clicks, backup, device_key):
+    if not n_clicks:
+        return dash.no_update
+    if not backup:
+        return dbc.Alert("Load a backup file first", color="warning")
+    if device_key not in DEVICES:
+        return dbc.Alert("Not connected to device", color="danger")
+    
+    try:
+        result = restore_parameter_backup(device_key, {int(address): value for address, value in backup.items()})
+    except Exception as e:
+        logger.error(f"Error restoring parameters: {str(e)}")
+        logger.error(traceback.format_exc())
+        return dbc.Alert(f"Error restoring parameters: {str(e)}", color="danger")
+    
+    if not result['differences']:
+        return dbc.Alert(f"{device_key} already matches the backup", color="success")
+    if result['failed'] or result['unverified']:
+        return dbc.Alert(f"Restored {len(result['differences'])} registers with errors - write failed: "
+                         f"{result['failed'] or 'none'}, verification failed: {result['unverified'] or 'none'}", color="danger")
+    return dbc.Alert(f"Restored and verified {len(result['differences'])} registers", color="success")
+
+
 @app.callback(
     Output({'type': 'multiplier-input', 'index': dash.ALL}, 'value'),
     Input({'type': 'multiplier-input', 'index': dash.ALL}, 'value'),
@@ -1673,6 +4615,7 @@ def update_register_multipliers(values, ids):
                 else:
                     # If it's still using the old format, convert to new format
                     REGISTER_MAP[register_index] = {'name': REGISTER_MAP[register_index], 'type': 'Holding', 'multiplier': val}
+        mark_register_map_changed()
         
         return values
     except Exception as e:
@@ -1691,22 +4634,14 @@ def update_register_multipliers(values, ids):
     prevent_initial_call=True
 )
 def disconnect_modbus(n_clicks):
-    global client
     logger.info("Disconnect button clicked")
     
-    if client:
-        try:
-            logger.info("Closing Modbus connection")
-            client.close()
-            logger.info("Connection closed successfully")
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Error closing connection: {error_msg}")
-            logger.error(traceback.format_exc())
-        client = None
-        logger.info("Client set to None")
+    if BUS_WORKERS:
+        # Stops scanning and closes the connection of every bus
+        stop_all_buses()
+        logger.info("All connections closed")
     else:
-        logger.warning("Disconnect called but client was already None")
+        logger.warning("Disconnect called but no bus was connected")
     
     return [
         dbc.Alert("Disconnected", color="warning"),
@@ -1724,10 +4659,12 @@ def disconnect_modbus(n_clicks):
      State("bytesize-select", "value"),
      State("timeout-input", "value"),
      State("unit-id-input", "value"),
+     State("engine-select", "value"),
+     State("device-model-input", "value"),
      State("current-config", "data")],
     prevent_initial_call=True
 )
-def update_config(n_clicks, baudrate, parity, stopbits, bytesize, timeout, unit_id, current_config):
+def update_config(n_clicks, baudrate, parity, stopbits, bytesize, timeout, unit_id, engine, model, current_config):
     if n_clicks:
         logger.info("Updating Modbus configuration")
         
@@ -1743,8 +4680,12 @@ def update_config(n_clicks, baudrate, parity, stopbits, bytesize, timeout, unit_
             changes.append(f"Byte Size: {current_config['bytesize']} -> {bytesize}")
         if current_config['timeout'] != timeout:
             changes.append(f"Timeout: {current_config['timeout']} -> {timeout}")
-        if current_config['unit_id'] != unit_id:
+        if str(current_config['unit_id']) != str(unit_id):
             changes.append(f"Unit ID: {current_config['unit_id']} -> {unit_id}")
+        if current_config.get('engine', 'thread') != engine:
+            changes.append(f"Engine: {current_config.get('engine', 'thread')} -> {engine}")
+        if current_config.get('model', 'default') != model:
+            changes.append(f"Device Model: {current_config.get('model', 'default')} -> {model}")
             
         if changes:
             logger.info(f"Configuration changes: {', '.join(changes)}")
@@ -1758,17 +4699,27 @@ def update_config(n_clicks, baudrate, parity, stopbits, bytesize, timeout, unit_
             'stopbits': stopbits,
             'bytesize': bytesize,
             'timeout': timeout,
-            'unit_id': unit_id
+            'unit_id': unit_id,
+            'engine': engine,
+            'model': (model or '').strip() or 'default'
         })
         
-        # If we have an active client, log a warning that reconnection is needed
-        global client
-        if client and client.is_socket_open():
+        # If we have an active bus, log a warning that reconnection is needed
+        if BUS_WORKERS:
             logger.warning("Configuration updated but client is still connected with old settings. Reconnect to apply changes.")
             
     return current_config
 
 
+def render_port_status():
+    """Describe every connected bus and the units scanned on it."""
+    lines = []
+    for bus in list(BUS_WORKERS.values()):
+        units = ', '.join(str(unit_id) for unit_id in bus['units'])
+        lines.append(html.Div(f"{bus['port_info']} - Unit(s) {units}"))
+    return dbc.Alert(lines, color="info") if lines else ""
+
+
 @app.callback(
     [Output("connection-status", "children"),
      Output("interval-component", "disabled"),
@@ -1777,12 +4728,27 @@ def update_config(n_clicks, baudrate, parity, stopbits, bytesize, timeout, unit_
      Output("port-status", "children")],
     Input("connect-btn", "n_clicks"),
     [State("com-port", "value"),
+     State("transport-select", "value"),
+     State("gateway-address-input", "value"),
+     State("pipeline-depth-input", "value"),
      State("current-config", "data"),
-     State("poll-interval", "value")],
+     State("poll-interval", "value"),
+     State("refresh-interval", "value")],
     prevent_initial_call=True
 )
-def connect_modbus(n_clicks, port, config, poll_interval):
-    global client
+def connect_modbus(n_clicks, port, transport, gateway_address, pipeline_depth, config, poll_interval, refresh_interval):
+    if transport in ENDPOINT_SCHEMES:
+        # Gateways are scanned like a serial port, with the endpoint as the port of the bus
+        port = make_gateway_endpoint(transport, gateway_address)
+        if not port:
+            logger.warning(f"Invalid gateway address '{gateway_address}'")
+            return [
+                dbc.Alert("Please enter the gateway as host or host:port.", color="warning"), 
+                True, 
+                2000,
+                {"display": "none"},
+                ""
+            ]
     logger.info(f"Attempting to connect to port {port} with config {config}")
     
     if not port:
@@ -1795,21 +4761,46 @@ def connect_modbus(n_clicks, port, config, poll_interval):
             ""
         ]
 
-    # First, close any existing connection
-    if client:
-        try:
-            logger.info("Closing existing connection")
-            client.close()
-        except Exception as e:
-            logger.error(f"Error closing existing connection: {str(e)}")
-            logger.error(traceback.format_exc())
+    config = dict(config)
+    config.setdefault('engine', 'thread')
+    config['transport'] = transport or 'rtu'
+    config['pipeline_depth'] = pipeline_depth or 1
+    gateway = parse_gateway_endpoint(port)
+    unit_ids = parse_unit_ids(config['unit_id'])
+    if not unit_ids:
+        logger.warning(f"No valid unit ID in '{config['unit_id']}'")
+        return [
+            dbc.Alert("Please enter unit IDs between 1 and 247, e.g. 1 or 1,2,5.", color="warning"), 
+            dash.no_update, 
+            dash.no_update,
+            dash.no_update,
+            dash.no_update
+        ]
+
+    # This port may already be scanned with the same settings (e.g. by another browser session) - join it
+    serial_settings = ('baudrate', 'parity', 'stopbits', 'bytesize', 'timeout', 'engine', 'pipeline_depth')
+    bus = BUS_WORKERS.get(port)
+    if (bus and is_bus_connected(bus)
+            and all(bus['config'].get(k) == config.get(k) for k in serial_settings)):
+        logger.info(f"Joining the running scan of {port}, adding units {unit_ids}")
+        add_bus_units(port, unit_ids)
+        return [
+            dbc.Alert("✅ Connected!", color="success"),
+            False,
+            refresh_interval * 1000,
+            {"display": "block"},
+            render_port_status()
+        ]
+
+    # First, stop scanning this port and close its connection; other ports keep running
+    stop_bus(port)
 
     # Add a small delay to allow the port to be released
     time.sleep(0.5)
     
     # Check if the port physically exists before attempting to connect
     try:
-        if os.name == 'posix':  # Linux/macOS
+        if gateway is None and port not in SIMULATORS and os.name == 'posix':  # Linux/macOS
             if not os.path.exists(port):
                 logger.error(f"Port {port} does not exist physically")
                 return [
@@ -1823,17 +4814,46 @@ def connect_modbus(n_clicks, port, config, poll_interval):
     except Exception as e:
         logger.error(f"Error checking if port exists: {str(e)}")
 
+    if gateway is None:
+        port_info = f"Connected to {port} - {config['baudrate']} baud, {config['bytesize']}{config['parity']}{config['stopbits']}"
+    else:
+        transport_label = next(o['label'] for o in TRANSPORT_OPTIONS if o['value'] == gateway[0])
+        port_info = f"Connected to gateway {gateway[1]}:{gateway[2]} - {transport_label}"
+    if config['engine'] == 'asyncio':
+        # The asyncio engine opens the port on its event loop, so retries do not hold up the other buses
+        depth = get_pipeline_depth(port, config)
+        try:
+            pool = run_async(async_connect_pool(port, config, depth))
+        except Exception as e:
+            logger.error(f"Exception during async connection: {str(e)}")
+            logger.error(traceback.format_exc())
+            pool = []
+        client = pool[0] if pool else None
+        if len(pool) > 1:
+            port_info += f", {len(pool)} transactions in flight"
+        if not client:
+            return [
+                dbc.Alert(f"❌ Could not connect to {port}.", color="danger"), 
+                True, 
+                2000,
+                {"display": "none"},  # Hide disconnect button
+                ""
+            ]
+        POLLER_SETTINGS['interval'] = poll_interval
+        start_bus(port, client, config, unit_ids, port_info + " (asyncio)", pool)
+        logger.info(f"Successfully connected: {port_info}, units {unit_ids}, asyncio engine")
+        return [
+            dbc.Alert("✅ Connected!", color="success"), 
+            False, 
+            refresh_interval * 1000,
+            {"display": "block"},  # Show disconnect button
+            render_port_status()
+        ]
+
     # Now try to connect
     try:
-        logger.info(f"Creating ModbusSerialClient with settings: {config}")
-        client = ModbusSerialClient(
-            port=port,
-            baudrate=config['baudrate'],
-            parity=config['parity'],
-            stopbits=config['stopbits'],
-            bytesize=config['bytesize'],
-            timeout=config['timeout']
-        )
+        logger.info(f"Creating Modbus client for {port} with settings: {config}")
+        client = create_modbus_client(port, config)
         
         # Try multiple times to connect (handle resource temporarily unavailable)
         max_attempts = 3
@@ -1841,16 +4861,18 @@ def connect_modbus(n_clicks, port, config, poll_interval):
             try:
                 logger.info(f"Connection attempt {attempt+1}/{max_attempts}")
                 if client.connect():
-                    # Successfully connected
-                    interval_ms = poll_interval * 1000
-                    port_info = f"Connected to {port} - {config['baudrate']} baud, {config['bytesize']}{config['parity']}{config['stopbits']}"
-                    logger.info(f"Successfully connected: {port_info}")
+                    enable_keepalive(client)
+                    # Successfully connected - start scanning in the background
+                    POLLER_SETTINGS['interval'] = poll_interval
+                    interval_ms = refresh_interval * 1000
+                    start_bus(port, client, config, unit_ids, port_info)
+                    logger.info(f"Successfully connected: {port_info}, units {unit_ids}")
                     return [
                         dbc.Alert("✅ Connected!", color="success"), 
                         False, 
                         interval_ms,
                         {"display": "block"},  # Show disconnect button
-                        dbc.Alert(port_info, color="info")
+                        render_port_status()
                     ]
                 else:
                     error_msg = None
@@ -1948,28 +4970,310 @@ def connect_modbus(n_clicks, port, config, poll_interval):
         ]
 
 
+@app.callback(
+    [Output("connection-status", "children", allow_duplicate=True),
+     Output("interval-component", "disabled", allow_duplicate=True),
+     Output("interval-component", "interval", allow_duplicate=True),
+     Output("disconnect-btn", "style", allow_duplicate=True),
+     Output("port-status", "children", allow_duplicate=True)],
+    Input("rendered-sequence", "modified_timestamp"),
+    [State("rendered-sequence", "data"),
+     State("refresh-interval", "value")],
+    prevent_initial_call='initial_duplicate'
+)
+def join_running_scan(modified_timestamp, rendered_sequence, refresh_interval):
+    """On page load, attach a new browser session to the scans that are already running"""
+    if rendered_sequence is not None or not BUS_WORKERS:
+        raise PreventUpdate
+    
+    logger.info(f"New browser session joining the running scans of {', '.join(BUS_WORKERS)}")
+    return [
+        dbc.Alert("✅ Connected!", color="success"),
+        False,
+        refresh_interval * 1000,
+        {"display": "block"},
+        render_port_status()
+    ]
+
+
+@app.callback(
+    [Output("device-select", "options"),
+     Output("device-select", "value")],
+    Input("interval-component", "n_intervals"),
+    [State("device-select", "options"),
+     State("device-select", "value")],
+    prevent_initial_call=True
+)
+def update_device_options(n_intervals, current_options, current_device):
+    """Keep the device dropdown in sync with the units scanned on all buses"""
+    options = [{'label': f"{device['port']} - Unit {device['unit_id']}", 'value': key}
+               for key, device in sorted(DEVICES.items())]
+    if options == current_options:
+        raise PreventUpdate
+    
+    device_keys = [option['value'] for option in options]
+    device = current_device if current_device in device_keys else (device_keys[0] if device_keys else None)
+    return options, device
+
+
+def build_register_values(registers, snapshot):
+    """
+    Return the value cells of the register table for the latest snapshot of a device.
+
+    :param registers: List of (address, register info) tuples shown in the table
+    :param snapshot: Device snapshot, see publish_snapshot
+    :return: Tuple (payload for the register-values store, number of registers that failed); the payload
+             maps addresses to the value text in 'values', the binary representation in 'binary' and
+             the bits of the value as an integer in 'bits'
+    """
+    register_values = snapshot['values']
+    quarantine = snapshot.get('quarantine', {})
+    now = time.time()
+    
+    # Decoded by the bus worker; look up the row of each register
+    decoded = snapshot.get('decoded') or decode_register_values({})
+    decoded_rows = dict(zip(decoded['addresses'].tolist(), range(len(decoded['addresses']))))
+    scaled_values = decoded['scaled'].tolist()
+    raw_values = decoded['raw'].tolist()
+    
+    payload = {'values': {}, 'binary': {}, 'bits': {}}
+    connection_errors = 0
+    for address, register_info in registers:
+        raw_value = register_values.get(address)
+        if quarantine.get(address, {}).get('until', 0) > now:
+            # Skipped by the bus worker until the back-off expires
+            entry = quarantine[address]
+            value = f"⛔ Quarantined ({entry['failures']} failures, retry in {int(entry['until'] - now) + 1}s)"
+            connection_errors += 1
+        elif address not in register_values:
+            # Not scanned yet (e.g. just added or first scan still running)
+            value = "⏳ Waiting"
+        elif raw_value is None:
+            value = "⚠️ Error"
+            connection_errors += 1
+        elif register_info['type'] not in WORD_REGISTER_TYPES:
+            value = "ON" if raw_value else "OFF"
+        else:
+            row = decoded_rows.get(address)
+            register_words = get_register_words(register_info)
+            if row is None:
+                # Multi-word values are only decoded once all their words were read
+                value = "⚠️ Error" if register_words > 1 else str(raw_value)
+            elif get_register_data_type(register_info) == 'string':
+                value = decoded['strings'][row].decode('ascii', errors='replace')
+            else:
+                value = f"{scaled_values[row]:.2f}"
+                # 16 bits per word, MSB first
+                payload['binary'][address] = decoded['binary'][row].decode()[-WORD_BITS * register_words:]
+                payload['bits'][address] = raw_values[row]
+            
+            # Add the unit of measure (if available)
+            unit = register_info.get('unit', '')
+            if unit:
+                value = f"{value} {unit}"
+        payload['values'][address] = value
+    
+    return payload, connection_errors
+
+def get_bit_status(bits, bit_position):
+    """Return the text and style of a bit in the register table, empty while the register has no value."""
+    if bits is None:
+        return "", {}
+    bit_value = bool(bits >> bit_position & 1)
+    status_style = {'color': 'green', 'fontWeight': 'bold'} if bit_value else {'color': 'red', 'fontWeight': 'bold'}
+    return (" ON" if bit_value else " OFF"), status_style
+
+def render_register_row(address, register_info, payload, snapshot):
+    """
+    Return the row of a register in the register table.
+
+    The value cells carry pattern-matching IDs ('register-value', 'register-binary' and 'bit-status')
+    that the register-values store updates on every refresh without rendering the row again.
+
+    :param payload: Current value cells, see build_register_values
+    :param snapshot: Device snapshot the payload was built from
+    """
+    register_type = register_info['type']
+    
+    # Get register name
+    register_name = register_info['name'] if isinstance(register_info, dict) else register_info
+    value = payload['values'].get(address, "")
+
+    if register_type in ['Holding', 'Input']:
+        register_words = get_register_words(register_info)
+        is_string = get_register_data_type(register_info) == 'string'
+        value_span = html.Span(["Value: ", html.Span(value, id={'type': 'register-value', 'index': address})],
+                               style={'fontFamily': 'monospace', 'fontSize': '18px'})
+        binary_span = html.Span(["Binary: ", html.Span(payload['binary'].get(address, ""),
+                                                       id={'type': 'register-binary', 'index': address})],
+                                style={'fontFamily': 'monospace', 'fontSize': '14px'})
+
+        # Check if we should show bit definitions
+        bits_display = []
+        show_bits = address in BIT_DISPLAY_SETTINGS and BIT_DISPLAY_SETTINGS[address].get("show_bits", True)
+
+        # Add bit descriptions if available and enabled
+        if address in BIT_DEFINITIONS and show_bits and not is_string:
+            # Create bit display with tooltips/descriptions, starting from bit 0 (LSB)
+            for bit_position, bit_desc in sorted(BIT_DEFINITIONS[address].items()):
+                if not 0 <= bit_position < WORD_BITS * register_words:
+                    continue
+                status_text, status_style = get_bit_status(payload['bits'].get(address), bit_position)
+    
+                # Show all bits with definitions, regardless of value
+                bits_display.append(html.Div([
+                    html.Span(f"Bit {bit_position} {bit_desc}: "), 
+                    html.Span(status_text, id={'type': 'bit-status', 'index': f"{address}:{bit_position}"},
+                              style=status_style),
+                ], style={'fontSize': '14px', 'marginBottom': '2px'}))
+
+        if register_type == 'Holding':
+            # For holding registers, include numeric input and write button
+            value_display = html.Div([
+                html.Div([
+                    value_span,
+                    html.Br(),          
+                    binary_span,
+                    # Add the bit descriptions if any
+                    html.Div(bits_display) if bits_display else None,  
+                ], style={'marginBottom': '5px', 'width': '60%'}),
+                    dcc.Input(
+                        id={'type': 'value-input', 'index': address},
+                        type="text" if is_string else "number",
+                        value="",
+                        className="form-control",
+                        style={'width': '25%', 'display': 'inline-block'}
+                    ),
+                    dbc.Button(
+                        "Write", 
+                        id={'type': 'write-btn', 'index': address},
+                        color="primary",
+                        size="md",
+                        className="ms-2",
+                        style={'width': '15%', 'display': 'inline-block'}
+                    ),
+                    dbc.Button(
+                        "Stage", 
+                        id={'type': 'stage-btn', 'index': address},
+                        color="secondary",
+                        size="md",
+                        className="ms-1",
+                        style={'width': '15%', 'display': 'inline-block'}
+                    )
+
+            ], style={'display': 'flex', 'alignItems': 'center', 'width': '100%'})
+        else:  # Input registers (read-only)
+            value_display = html.Div([
+                value_span,
+                html.Br(),          
+                binary_span,
+                # Add the bit descriptions if any
+                html.Div(bits_display) if bits_display else None,
+            ], style={'width': '100%'})
+
+    elif register_type == 'Coil':
+        # For coils, use a toggle switch; it starts at the state read and is left to the user afterwards
+        is_on = bool(snapshot['values'].get(address))
+        value_display = html.Div([
+            html.Div(value, id={'type': 'register-value', 'index': address}, style={'width': '45%', 'display': 'inline-block'}),
+            dbc.Switch(
+                id={'type': 'coil-switch', 'index': address},
+                value=is_on,
+                className="me-2",
+                style={'width': '40%', 'display': 'inline-block'}
+            ),
+            dbc.Button(
+                "Write", 
+                id={'type': 'coil-write-btn', 'index': address},
+                color="primary",
+                size="md",
+                className="ms-2",
+                style={'width': '15%', 'display': 'inline-block'}
+            ),
+            dbc.Button(
+                "Stage", 
+                id={'type': 'coil-stage-btn', 'index': address},
+                color="secondary",
+                size="md",
+                className="ms-1",
+                style={'width': '15%', 'display': 'inline-block'}
+            ),
+        ], style={'display': 'flex', 'alignItems': 'center', 'width': '100%'})
+    else:  # For discrete inputs (read-only)
+        # Just show value as text
+        value_display = html.Div(value, id={'type': 'register-value', 'index': address}, style={'padding': '6px 0'})
+    
+    return dbc.Row([
+        dbc.Col(f"{address}", width=1),
+        dbc.Col(dcc.Input(
+            id={'type': 'name-input', 'index': address},
+            value=renamed_vars.get(address, register_name),
+            debounce=True,
+            className="form-control"
+        ), width=3),
+        dbc.Col(
+            dcc.Dropdown(
+                id={'type': 'type-dropdown', 'index': address},
+                options=REGISTER_TYPE_OPTIONS,
+                value=register_info['type'] if isinstance(register_info, dict) else "Holding",
+                clearable=False,
+                className="form-control"
+            ),
+            width=1
+        ),
+        dbc.Col(
+            dcc.Dropdown(
+                id={'type': 'scan-dropdown', 'index': address},
+                options=SCAN_CLASS_OPTIONS,
+                value=register_info.get('scan', DEFAULT_SCAN_CLASS),
+                clearable=False,
+                className="form-control"
+            ),
+            width=1
+        ),
+        dbc.Col(
+            dcc.Dropdown(
+                id={'type': 'data-type-dropdown', 'index': address},
+                options=DATA_TYPE_OPTIONS,
+                value=get_register_data_type(register_info),
+                clearable=False,
+                className="form-control"
+            ) if register_type in WORD_REGISTER_TYPES else None,
+            width=1
+        ),
+        #dbc.Col(register_multiplier, width=1),
+        dbc.Col(value_display, width=4),
+        dbc.Col(dbc.Button(
+            "🗑️", 
+            id={'type': 'delete-btn', 'index': address},
+            color="danger",
+            size="sm"
+        ), width=1)
+    ], className="mb-2")
+
 @app.callback(
     [Output("register-table", "children"),
      Output("connection-status", "children", allow_duplicate=True),
      Output("interval-component", "disabled", allow_duplicate=True),
-     Output("poll-interval", "value", allow_duplicate=True),
-     Output("suggested-interval-display", "children")],  # Added output for suggested interval display
+     Output("suggested-interval-display", "children"),  # Bus utilisation and admitted scan periods
+     Output("rendered-sequence", "data"),
+     Output("register-values", "data"),
+     Output("rendered-layout", "data")],
     [Input("interval-component", "n_intervals"),
      Input("add-register-btn", "n_clicks"),
-     Input("register-type-filter", "value")],
+     Input("register-type-filter", "value"),
+     Input("device-select", "value")],
     [State("new-register-addr", "value"),
      State("new-register-name", "value"),
      State("new-register-type", "value"),
      State("current-config", "data"),
-     State("poll-interval", "value")],
+     State("rendered-sequence", "data"),
+     State("rendered-layout", "data")],
     prevent_initial_call=True
 )
-def update_table(n_intervals, add_clicks, register_type_filter, 
-                 new_addr, new_name, new_type, config, current_poll_interval):
-    global client, renamed_vars, REGISTER_MAP, last_read_duration
-    
-    # Start timing the read operation
-    start_time = time.time()
+def update_table(n_intervals, add_clicks, register_type_filter, device_key,
+                 new_addr, new_name, new_type, config, rendered_sequence, rendered_layout):
+    global renamed_vars, REGISTER_MAP
 
     trigger_id = ctx.triggered_id if ctx.triggered else None
     #logger.debug(f"update_table called. Trigger: {trigger_id}, intervals: {n_intervals}")
@@ -1978,13 +5282,30 @@ def update_table(n_intervals, add_clicks, register_type_filter,
     if trigger_id == "add-register-btn" and new_addr is not None and new_name:
         logger.info(f"Adding new register - Address: {new_addr}, Name: {new_name}, Type: {new_type}")
         REGISTER_MAP[new_addr] = {'name': new_name, 'type': new_type}
+        mark_register_map_changed()
         renamed_vars[new_addr] = new_name
+        for key in list(DEVICES):
+            request_register_reread(key, new_addr)
+    
+    # The rows are only rendered again when the register map, the filter, the device or its state change;
+    # otherwise a refresh just sends the values to the register-values store
+    snapshot = get_device_snapshot(device_key) or {'status': 'stopped', 'sequence': 0}
+    layout = [register_map_version, register_type_filter, device_key, snapshot['status'],
+              snapshot.get('retry_at') if snapshot['status'] == 'offline' else None]
+    render = layout != rendered_layout
+    
+    # All sessions share the bus scans - nothing to do if this session already shows the latest one
+    # of its device; the device is part of the layout, so switching devices always renders
+    if trigger_id == "interval-component" and snapshot['sequence'] == rendered_sequence and not render:
+        raise PreventUpdate
     
     rows = []
     header = dbc.Row([
         dbc.Col("Register", width=1),
         dbc.Col("Name", width=3),
         dbc.Col("Type", width=1),
+        dbc.Col("Scan", width=1),
+        dbc.Col("Data type", width=1),
         #dbc.Col("Multiplier", width=1),
         dbc.Col("Value", width=4),
         dbc.Col("Actions", width=1)
@@ -1992,284 +5313,129 @@ def update_table(n_intervals, add_clicks, register_type_filter,
   
     rows.append(header)
 
-    # Empty suggested display (default)
-    suggested_display = ""
+    # Empty schedule display (default)
+    schedule_display = ""
 
-    if not client:
+    # Only the bus workers talk to the devices - render the latest snapshot of the selected one
+    sequence = snapshot['sequence']
+    if snapshot['status'] == 'stopped':
         logger.warning("Modbus client not initialized")
         rows.append(html.Div([dbc.Alert("Client not initialized", color="danger")]))
-        return [html.Div(rows), dash.no_update, dash.no_update, dash.no_update, suggested_display]
+        return [html.Div(rows) if render else dash.no_update, dash.no_update, dash.no_update, schedule_display,
+                sequence, dash.no_update, layout]
 
-    # Check if client is still connected first
-    if not client.is_socket_open():
-        logger.warning("Socket not open, attempting to reconnect")
-        try:
-            # Try to reconnect
-            if not client.connect():
-                logger.error("Failed to reconnect to device")
-                rows.append(dbc.Alert("Lost connection to device. Attempting to reconnect...", color="warning"))
-                return [html.Div(rows), dbc.Alert("❌ Connection lost", color="danger"), True, dash.no_update, suggested_display]
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Error during reconnection attempt: {error_msg}")
-            logger.error(traceback.format_exc())
-            rows.append(dbc.Alert(f"Connection error: {error_msg}", color="danger"))
-            return [html.Div(rows), dbc.Alert("❌ Connection error", color="danger"), True, dash.no_update, suggested_display]
+    if snapshot['status'] == 'connection_lost':
+        rows.append(dbc.Alert("Lost connection to device. Attempting to reconnect...", color="warning"))
+        return [html.Div(rows) if render else dash.no_update, dbc.Alert("❌ Connection lost", color="danger"),
+                dash.no_update, schedule_display, sequence, dash.no_update, layout]
 
-    # Now read registers since we know we're connected
-    try:
-        connection_errors = 0
-        #logger.debug(f"Reading {len(REGISTER_MAP)} registers")
-        
-        # Filter registers by type if needed
-        filtered_registers = REGISTER_MAP.items()
-        if register_type_filter != "all":
-            filtered_registers = [(addr, reg) for addr, reg in REGISTER_MAP.items() 
-                                 if reg['type'] == register_type_filter]
-        
-        for address, register_info in sorted(filtered_registers):
-            try:
-                register_type = register_info['type']
-                #logger.debug(f"Reading register {address} of type {register_type} with unit ID {config['unit_id']}")
-                
-                # Use our version-compatible read function
-                result = read_modbus_register(client, address, config['unit_id'], register_type)
-                
-                if result and not result.isError():
-                    # Handle different register types differently
-                    if register_type in ['Holding', 'Input']:
-                        value = result.registers[0]
-                        
-                        # If this register is selected for graphing, store its data
-                        if address in GRAPH_DATA:
-                            # Get register multiplier with default of 1 if not specified
-                            register_multiplier = register_info.get('multiplier', 1) if isinstance(register_info, dict) else 1
-                            # Apply multiplier to the value
-                            scaled_value = value * register_multiplier
-                            # Store timestamp and value
-                            current_time = datetime.now()
-                            GRAPH_DATA[address]['times'].append(current_time)
-                            GRAPH_DATA[address]['values'].append(scaled_value)
-                    
-                            # Limit the number of data points
-                            if len(GRAPH_DATA[address]['times']) > MAX_DATA_POINTS:
-                                GRAPH_DATA[address]['times'].popleft()
-                                GRAPH_DATA[address]['values'].popleft()
-                    else:  # coil or discrete_input
-                        value = "ON" if result.bits[0] else "OFF"
-                    
-                   # logger.debug(f"Register {address} value: {value}")
-                else:
-                    error_info = result.message if hasattr(result, 'message') else "Unknown error"
-                    logger.warning(f"Error reading register {address}: {error_info}")
-                    value = "⚠️ Error"
-                    connection_errors += 1
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"Exception reading register {address}: {error_msg}")
-                logger.error(traceback.format_exc())
-                value = "⚠️ Error"
-                connection_errors += 1
-                
-            # Get register name
-            register_name = register_info['name'] if isinstance(register_info, dict) else register_info
-            
-            # Get register multiplier with default of 1 if not specified
-            register_multiplier = register_info.get('multiplier', 1) if isinstance(register_info, dict) else 1
+    if snapshot['status'] == 'offline':
+        # The circuit breaker paused the scan of this unit; the other units on the bus keep being scanned
+        next_check = datetime.fromtimestamp(snapshot.get('retry_at', time.time())).strftime('%H:%M:%S')
+        rows.append(dbc.Alert(f"Device is not responding. Checking again at {next_check}...", color="warning"))
+        return [html.Div(rows) if render else dash.no_update, dbc.Alert("❌ Device not responding", color="danger"),
+                dash.no_update, schedule_display, sequence, dash.no_update, layout]
 
-            if register_type in ['Holding', 'Input']:
-                # Apply multiplier to the displayed value for registers
-                display_value = value if value == "⚠️ Error" else value * register_multiplier
+    # Filter registers by type if needed
+    filtered_registers = REGISTER_MAP.items()
+    if register_type_filter != "all":
+        filtered_registers = [(addr, reg) for addr, reg in REGISTER_MAP.items() 
+                             if reg['type'] == register_type_filter]
+    filtered_registers = sorted(filtered_registers)
     
-                # Format the display value to limit decimal places
-                formatted_display_value = value if value == "⚠️ Error" else f"{display_value:.2f}"
+    payload, connection_errors = build_register_values(filtered_registers, snapshot)
+    table = dash.no_update
+    if render:
+        rows.extend(render_register_row(address, register_info, payload, snapshot)
+                    for address, register_info in filtered_registers)
+        table = html.Div(rows)
     
-                # Get unit of measure (if available)
-                unit = register_info.get('unit', '')
-    
-                # Format display with unit
-                if unit:
-                    value_with_unit = f"{formatted_display_value} {unit}"
-                else:
-                    value_with_unit = formatted_display_value
-    
-                # Add binary representation for integer values with bit descriptions
-                bits_display = []
-                if isinstance(value, int) and value != "⚠️ Error":
-                    # Convert to binary and format as 16 bits
-                    bits = format(value, '016b')
-                    binary_display = f"{bits}"
-
-                    # Check if we should show bit definitions
-                    show_bits = address in BIT_DISPLAY_SETTINGS and BIT_DISPLAY_SETTINGS[address].get("show_bits", True)
-
-                    # Add bit descriptions if available and enabled
-                    if address in BIT_DEFINITIONS and show_bits:
-                        # Create bit display with tooltips/descriptions
-                        for i, bit in enumerate(reversed(bits)):  # Reverse to start from bit 0 (LSB)
-                            bit_position = i
-                            bit_value = bit == '1'
-                
-                            # Check if this bit has a definition
-                            if bit_position in BIT_DEFINITIONS[address]:
-                                bit_desc = BIT_DEFINITIONS[address][bit_position]
-                    
-                                # Style based on value
-                                status_style = {'color': 'green', 'fontWeight': 'bold'} if bit_value else {'color': 'red', 'fontWeight': 'bold'}
-                                status_text = "ON" if bit_value else "OFF"
-                    
-                                # Show all bits with definitions, regardless of value
-                                bits_display.append(html.Div([
-                                    html.Span(f"Bit {bit_position} {bit_desc}: "), 
-                                    html.Span(f" {status_text}", style=status_style),
-                                ], style={'fontSize': '14px', 'marginBottom': '2px'}))
-                else:
-                    binary_display = ""
-    
-                if register_type == 'Holding':
-                    # For holding registers, include numeric input and write button
-                    value_display = html.Div([
-                        html.Div([
-                            html.Span(f"Value: {value_with_unit}", 
-                                     style={'fontFamily': 'monospace', 'fontSize': '18px'}),
-                            html.Br(),          
-                            html.Span(f"Binary: {binary_display}", 
-                                     style={'fontFamily': 'monospace', 'fontSize': '14px'}),
-                            # Add the bit descriptions if any
-                            html.Div(bits_display) if bits_display else None,  
-                        ], style={'marginBottom': '5px', 'width': '60%'}),
-                            dcc.Input(
-                                id={'type': 'value-input', 'index': address},
-                                type="number",
-                                value="",
-                                className="form-control",
-                                style={'width': '25%', 'display': 'inline-block'}
-                            ),
-                            dbc.Button(
-                                "Write", 
-                                id={'type': 'write-btn', 'index': address},
-                                color="primary",
-                                size="md",
-                                className="ms-2",
-                                style={'width': '15%', 'display': 'inline-block'}
-                            )
-
-                    ], style={'display': 'flex', 'alignItems': 'center', 'width': '100%'})
-                else:  # Input registers (read-only)
-                    value_display = html.Div([
-                        html.Span(f"Value: {value_with_unit}", 
-                                 style={'fontFamily': 'monospace', 'fontSize': '18px'}),
-                        html.Br(),          
-                        html.Span(f"Binary: {binary_display}", 
-                                 style={'fontFamily': 'monospace', 'fontSize': '14px'}),
-                        # Add the bit descriptions if any
-                        html.Div(bits_display) if bits_display else None,
-                    ], style={'width': '100%'})
-
-
-
-            elif register_type == 'Coil':
-                # For coils, use a toggle switch
-                is_on = True if value == "ON" or value == True else False
-                value_display = html.Div([
-                    html.Div(f"{value}", style={'width': '45%', 'display': 'inline-block'}),
-                    dbc.Switch(
-                        id={'type': 'coil-switch', 'index': address},
-                        value=is_on,
-                        className="me-2",
-                        style={'width': '40%', 'display': 'inline-block'}
-                    ),
-                    dbc.Button(
-                        "Write", 
-                        id={'type': 'coil-write-btn', 'index': address},
-                        color="primary",
-                        size="md",
-                        className="ms-2",
-                        style={'width': '15%', 'display': 'inline-block'}
-                    ),
-                ], style={'display': 'flex', 'alignItems': 'center', 'width': '100%'})
-            else:  # For discrete inputs (read-only)
-                # Just show value as text
-                value_display = html.Div(value, style={'padding': '6px 0'})
-            
-            rows.append(
-                dbc.Row([
-                    dbc.Col(f"{address}", width=1),
-                    dbc.Col(dcc.Input(
-                        id={'type': 'name-input', 'index': address},
-                        value=renamed_vars.get(address, register_name),
-                        debounce=True,
-                        className="form-control"
-                    ), width=3),
-                    dbc.Col(
-                        dcc.Dropdown(
-                            id={'type': 'type-dropdown', 'index': address},
-                            options=REGISTER_TYPE_OPTIONS,
-                            value=register_info['type'] if isinstance(register_info, dict) else "Holding",
-                            clearable=False,
-                            className="form-control"
-                        ),
-                        width=1
-                    ),
-                    #dbc.Col(register_multiplier, width=1),
-                    dbc.Col(value_display, width=4),
-                    dbc.Col(dbc.Button(
-                        "🗑️", 
-                        id={'type': 'delete-btn', 'index': address},
-                        color="danger",
-                        size="sm"
-                    ), width=1)
-                ], className="mb-2")
-            )
-        
-        # If all registers failed, we likely have a connection issue
-        if connection_errors == len(filtered_registers) and len(filtered_registers) > 0:
-            logger.error(f"All {len(filtered_registers)} register reads failed - probable connection issue")
-            return [html.Div(rows), dbc.Alert("❌ Communication errors", color="danger"), dash.no_update, dash.no_update, suggested_display]
-            
-    except ModbusException as e:
-        error_msg = str(e)
-        logger.error(f"Modbus exception during register reads: {error_msg}")
-        logger.error(traceback.format_exc())
-        rows.append(dbc.Alert(f"Modbus error: {error_msg}", color="danger"))
-        # Don't disable interval - keep trying
-        return [html.Div(rows), dbc.Alert(f"❌ Modbus error: {error_msg}", color="danger"), dash.no_update, dash.no_update, suggested_display]
+    # If all registers failed, we likely have a connection issue
+    if connection_errors == len(filtered_registers) and len(filtered_registers) > 0:
+        logger.error(f"All {len(filtered_registers)} register reads failed - probable connection issue")
+        return [table, dbc.Alert("❌ Communication errors", color="danger"), dash.no_update, schedule_display,
+                sequence, payload, layout]
 
-    if connection_errors > 0:
-        logger.warning(f"{connection_errors} out of {len(filtered_registers)} register reads failed")
-    else:
-        logger.debug("All register reads successful")
-    
-    # Calculate the suggested polling interval
-    suggested_interval = adjust_polling_interval(start_time)
+    # Bus utilisation measured and planned by the scheduler of the bus (see update_bus_schedule)
+    bus = get_device_bus(device_key)
+    schedule = bus['schedule'] if bus else None
+    read_duration = snapshot['read_duration']
+    if not schedule or schedule['planned_utilisation'] is None:
+        return [table, dash.no_update, dash.no_update, schedule_display, sequence, payload, layout]
     
-    # Format the suggested interval display with explanation
-    if last_read_duration > 0:
-        suggested_display = html.Div([
-            html.Span(f"Last read time: {last_read_duration:.3f}s", className="me-2"),
-            html.Span(f"Suggested interval: {suggested_interval:.1f}s", 
-                      style={"fontWeight": "bold", "color": "blue"})
-        ])
-    
-    # Check if we should update the polling interval
-    if (last_read_duration == 0 or 
-        abs(suggested_interval - current_poll_interval) / current_poll_interval > 0.1):
-        return [html.Div(rows), dash.no_update, dash.no_update, suggested_interval, suggested_display]
-    else:
-        return [html.Div(rows), dash.no_update, dash.no_update, dash.no_update, suggested_display]
+    utilisation = schedule['utilisation']
+    parts = [html.Span(f"Last read time: {read_duration:.3f}s", className="me-2")]
+    if utilisation is not None:
+        parts.append(html.Span(f"Bus utilisation: {utilisation:.0%}", className="me-2"))
+    parts.append(html.Span(f"planned {schedule['planned_utilisation']:.0%} of {schedule['target']:.0%} target",
+                           className="me-2"))
+    if schedule['stretched']:
+        # The requested periods do not fit on the bus - show what is scanned instead
+        slowed = ', '.join(f"{scan_class} every {period:.2f}s" for scan_class, period in schedule['stretched'].items())
+        parts.append(html.Span(f"Bus full, scanning {slowed}", style={"fontWeight": "bold", "color": "orange"}))
+    schedule_display = html.Div(parts)
+    return [table, dash.no_update, dash.no_update, schedule_display, sequence, payload, layout]
+
+# Fill the value cells of the register table from the register-values store in the browser
+app.clientside_callback(
+    """
+    function(payload) {
+        if (!payload) {
+            throw window.dash_clientside.PreventUpdate;
+        }
+        const outputs = window.dash_clientside.callback_context.outputs_list;
+        const bitValue = function(id) {
+            const [address, bit] = id.index.split(':');
+            const bits = payload.bits[address];
+            return bits === undefined ? null : Math.floor(bits / Math.pow(2, Number(bit))) % 2 === 1;
+        };
+        return [
+            outputs[0].map(output => payload.values[output.id.index] ?? ''),
+            outputs[1].map(output => payload.binary[output.id.index] ?? ''),
+            outputs[2].map(output => {
+                const value = bitValue(output.id);
+                return value === null ? '' : (value ? ' ON' : ' OFF');
+            }),
+            outputs[3].map(output => {
+                const value = bitValue(output.id);
+                return value === null ? {} : {color: value ? 'green' : 'red', fontWeight: 'bold'};
+            })
+        ];
+    }
+    """,
+    [Output({'type': 'register-value', 'index': dash.ALL}, 'children'),
+     Output({'type': 'register-binary', 'index': dash.ALL}, 'children'),
+     Output({'type': 'bit-status', 'index': dash.ALL}, 'children'),
+     Output({'type': 'bit-status', 'index': dash.ALL}, 'style')],
+    Input("register-values", "data")
+)
 
      
 @app.callback(
     Output("interval-component", "interval", allow_duplicate=True),
-    Input("poll-interval", "value"),
+    [Input("poll-interval", "value"),
+     Input("refresh-interval", "value"),
+     Input("target-utilisation", "value"),
+     Input("recorder-retention", "value")],
     prevent_initial_call=True
 )
-def update_polling_interval(poll_interval):
-    """Update the polling interval when the value changes"""
-    logger.info(f"Updating polling interval to {poll_interval}s")
+def update_polling_interval(poll_interval, refresh_interval, target_utilisation, retention):
+    """Update the poller scan interval, the target bus utilisation, the recorded history and the display refresh interval when they change"""
+    if poll_interval:
+        logger.info(f"Updating polling interval to {poll_interval}s")
+        POLLER_SETTINGS['interval'] = max(poll_interval, min_polling_interval)
+    if target_utilisation:
+        SCHEDULER_SETTINGS['target_utilisation'] = min(max(target_utilisation, 10), 100) / 100
+        # Re-plan every bus on its next round
+        for bus in list(BUS_WORKERS.values()):
+            bus['schedule']['updated'] = 0
+    if retention:
+        RECORDER_SETTINGS['retention'] = max(retention, 1) * 60
+    
+    if not refresh_interval:
+        return dash.no_update
     # Convert to milliseconds for the interval component
-    interval_ms = max(poll_interval, min_polling_interval) * 1000
-    return interval_ms
+    return refresh_interval * 1000
 
     
 
@@ -2291,6 +5457,9 @@ def update_names(values, ids):
             # Update the name in REGISTER_MAP
             if register_index in REGISTER_MAP:
                 if isinstance(REGISTER_MAP[register_index], dict):
+                    if REGISTER_MAP[register_index]['name'] != val:
+                        # Update the labels of the register in the other sessions and dropdowns
+                        mark_register_map_changed()
                     REGISTER_MAP[register_index]['name'] = val
                 else:
                     # If it's still using the old format, convert to new format
@@ -2324,6 +5493,7 @@ def update_register_types(values, ids):
                 else:
                     # If it's still using the old format, convert to new format
                     REGISTER_MAP[register_index] = {'name': REGISTER_MAP[register_index], 'type': val}
+        mark_register_map_changed()
         
         return values
     except Exception as e:
@@ -2332,6 +5502,58 @@ def update_register_types(values, ids):
         logger.error(traceback.format_exc())
         return values  # Return original values in case of error
 
+@app.callback(
+    Output({'type': 'scan-dropdown', 'index': dash.ALL}, 'value'),
+    Input({'type': 'scan-dropdown', 'index': dash.ALL}, 'value'),
+    State({'type': 'scan-dropdown', 'index': dash.ALL}, 'id'),
+    prevent_initial_call=True
+)
+def update_register_scan_classes(values, ids):
+    try:
+        for val, id_dict in zip(values, ids):
+            register_index = id_dict['index']
+            
+            # Update the scan class in REGISTER_MAP, the poller picks it up on its next cycle
+            if register_index in REGISTER_MAP and REGISTER_MAP[register_index].get('scan', DEFAULT_SCAN_CLASS) != val:
+                logger.info(f"Updating register {register_index} scan class to '{val}'")
+                REGISTER_MAP[register_index]['scan'] = val
+                mark_register_map_changed()
+                for key in list(DEVICES):
+                    request_register_reread(key, register_index)
+        
+        return values
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Error updating register scan classes: {error_msg}")
+        logger.error(traceback.format_exc())
+        return values  # Return original values in case of error
+
+@app.callback(
+    Output({'type': 'data-type-dropdown', 'index': dash.ALL}, 'value'),
+    Input({'type': 'data-type-dropdown', 'index': dash.ALL}, 'value'),
+    State({'type': 'data-type-dropdown', 'index': dash.ALL}, 'id'),
+    prevent_initial_call=True
+)
+def update_register_data_types(values, ids):
+    try:
+        for val, id_dict in zip(values, ids):
+            register_index = id_dict['index']
+            
+            # Update the data type in REGISTER_MAP; a value with more words changes the read plan
+            if register_index in REGISTER_MAP and get_register_data_type(REGISTER_MAP[register_index]) != val:
+                logger.info(f"Updating register {register_index} data type to '{val}'")
+                REGISTER_MAP[register_index]['data_type'] = val
+                mark_register_map_changed()
+                for key in list(DEVICES):
+                    request_register_reread(key, register_index)
+        
+        return values
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Error updating register data types: {error_msg}")
+        logger.error(traceback.format_exc())
+        return values  # Return original values in case of error
+
 @app.callback(
     Output("register-table", "children", allow_duplicate=True),
     Input({'type': 'delete-btn', 'index': dash.ALL}, 'n_clicks'),
@@ -2353,6 +5575,7 @@ def delete_register(n_clicks, ids):
             # Remove the register from both dictionaries
             if register_index in REGISTER_MAP:
                 del REGISTER_MAP[register_index]
+                mark_register_map_changed()
             if register_index in renamed_vars:
                 del renamed_vars[register_index]
     
@@ -2361,34 +5584,266 @@ def delete_register(n_clicks, ids):
 
 # Add this after the client variable definition
 # Store time-series data for graphing
-GRAPH_DATA = {}  # Dictionary to store graph data by register address
-MAX_DATA_POINTS = 10000  # Maximum number of data points to keep for each register
+GRAPH_DATA = {}  # Recorded samples by device key, then by scan class, see create_graph_buffer and record_graph_samples
+RECORDER_INITIAL_ROWS = 1000  # Scans a new buffer has room for before it grows
+graph_series_ids = itertools.count()  # Tells a buffer or column apart from one created again after a clear
+GRAPH_PLOT_POINTS = 1000  # Buckets each trace is reduced to when drawn, about the plot width in pixels
 
-@app.callback(
-    Output("graph-register-select", "value", allow_duplicate=True),
-    Input("graph-register-select", "value"),
-    prevent_initial_call=True
-)
-def initialize_graph_data(selected_registers):
-    """Initialize data structures when registers are selected for graphing"""
-    global GRAPH_DATA
-    
-    if not selected_registers:
-        return selected_registers
-    
-    # Make sure selected_registers is a list
-    if not isinstance(selected_registers, list):
-        selected_registers = [selected_registers]
+def create_graph_buffer(capacity=RECORDER_INITIAL_ROWS):
+    """
+    Create an empty ring buffer for the recorded samples of the registers of one scan class of a device.
+
+    The buffer is columnar: a row per scan with one timestamp shared by all registers, and a float32
+    value column per recorded register holding NaN where the scan did not read the register. Every row
+    is written twice, at row and row + capacity, so the last capacity rows are always one contiguous
+    slice and can be handed out as views without copying.
+
+    :param capacity: Number of scans kept
+    :return: Dictionary with the buffer arrays, the column of each address and the number of rows written
+    """
+    return {
+        'id': next(graph_series_ids),
+        'capacity': capacity,
+        'count': 0,  # Rows ever written; unlike the buffer it keeps growing, so sessions can track what they drew
+        'times': np.zeros(2 * capacity, dtype='datetime64[us]'),
+        'values': np.empty((2 * capacity, 0), dtype=np.float32, order='F'),
+        'addresses': np.empty(0, dtype=np.int64),  # Address of each value column
+        'columns': {},  # Value column of each address
+        'column_ids': {},  # Id of the column of each address
+        'map_version': None  # register_map_version the columns were set up for
+    }
+
+def get_graph_buffers(device_key):
+    """
+    Return the graph buffers of a device by scan class, with columns for the current register map.
+
+    Only Holding and Input registers with a numeric data type are recorded, the ones that can be graphed.
+    Each scan class has a buffer of its own so that a scan only writes the columns it can have read.
+    The caller holds graph_lock.
+
+    :param device_key: Device the samples are recorded for
+    :return: Dictionary of graph buffers keyed by scan class
+    """
+    buffers = GRAPH_DATA.setdefault(device_key, {})
+    if buffers and all(buffer['map_version'] == register_map_version for buffer in buffers.values()):
+        return buffers
     
-    # Initialize data for newly selected registers
-    for register in selected_registers:
-        if register not in GRAPH_DATA:
-            GRAPH_DATA[register] = {
-                'times': deque(maxlen=MAX_DATA_POINTS),
-                'values': deque(maxlen=MAX_DATA_POINTS)
-            }
+    addresses_by_class = {}
+    for address, register_info in REGISTER_MAP.items():
+        if register_info['type'] in ('Holding', 'Input') and get_register_data_type(register_info) != 'string':
+            addresses_by_class.setdefault(register_info.get('scan', DEFAULT_SCAN_CLASS), []).append(address)
+    for scan_class in list(buffers):
+        if scan_class not in addresses_by_class:
+            del buffers[scan_class]
+    for scan_class, addresses in addresses_by_class.items():
+        buffer = buffers.setdefault(scan_class, create_graph_buffer())
+        set_graph_columns(buffer, addresses)
+        buffer['map_version'] = register_map_version
+    return buffers
+
+def find_graph_buffer(device_key, register):
+    """Return the graph buffer with the column of a register, or None if the register is not recorded; the caller holds graph_lock."""
+    for buffer in GRAPH_DATA.get(device_key, {}).values():
+        if register in buffer['columns']:
+            return buffer
+    return None
+
+def set_graph_columns(buffer, addresses):
+    """
+    Give a graph buffer a value column for exactly the given registers; the caller holds graph_lock.
+
+    Columns of registers that are kept retain their history, new columns start out as NaN.
+
+    :param buffer: Graph buffer of create_graph_buffer
+    :param addresses: Register addresses to keep columns for
+    """
+    addresses = set(addresses)
+    if addresses == set(buffer['columns']):
+        return
+    kept = [address for address in buffer['addresses'].tolist() if address in addresses]
+    added = sorted(address for address in addresses if address not in buffer['columns'])
+    kept_values = buffer['values'][:, [buffer['columns'][address] for address in kept]]
+    added_values = np.full((2 * buffer['capacity'], len(added)), np.nan, dtype=np.float32)
+    buffer['values'] = np.asfortranarray(np.hstack([kept_values, added_values]))
+    buffer['addresses'] = np.array(kept + added, dtype=np.int64)
+    buffer['columns'] = {address: column for column, address in enumerate(kept + added)}
+    for address in added:
+        buffer['column_ids'][address] = next(graph_series_ids)
+    for address in list(buffer['column_ids']):
+        if address not in buffer['columns']:
+            del buffer['column_ids'][address]
+
+def resize_graph_buffer(buffer, capacity):
+    """
+    Move the rows of a graph buffer to arrays for a new number of scans; the caller holds graph_lock.
+
+    :param buffer: Graph buffer of create_graph_buffer
+    :param capacity: Number of scans kept from now on
+    """
+    times, values = get_graph_rows(buffer)
+    times, values = times[-capacity:], values[-capacity:]
+    positions = np.arange(buffer['count'] - len(times), buffer['count']) % capacity
+    new_times = np.zeros(2 * capacity, dtype='datetime64[us]')
+    new_values = np.full((2 * capacity, values.shape[1]), np.nan, dtype=np.float32, order='F')
+    for offset in (0, capacity):
+        new_times[positions + offset] = times
+        new_values[positions + offset] = values
+    buffer.update(capacity=capacity, times=new_times, values=new_values)
+
+def get_graph_rows(buffer, first=0):
+    """
+    Return views of the rows written to a graph buffer from row first on; the caller holds graph_lock.
+
+    Rows more than the retention window older than the latest row are left out.
+
+    :param buffer: Graph buffer of create_graph_buffer
+    :param first: Number of the first row wanted; rows that were overwritten are left out
+    :return: Tuple (times, values) of views, values with a column per address of the buffer
+    """
+    first = max(first, buffer['count'] - buffer['capacity'], 0)
+    start = first % buffer['capacity']
+    stop = start + buffer['count'] - first
+    times, values = buffer['times'][start:stop], buffer['values'][start:stop]
+    if len(times):
+        retention = np.timedelta64(int(RECORDER_SETTINGS['retention'] * 1e6), 'us')
+        start = np.searchsorted(times, times[-1] - retention)
+        times, values = times[start:], values[start:]
+    return times, values
+
+def get_graph_samples(device_key, register, first=0):
+    """
+    Return the samples of a register recorded from row first of its graph buffer on; the caller holds graph_lock.
+
+    :param device_key: Device the register belongs to
+    :param register: Register address
+    :param first: Number of the first row of the buffer wanted
+    :return: Tuple (times, values) of the rows in which the register was read, empty if it is not recorded
+    """
+    buffer = find_graph_buffer(device_key, register)
+    if buffer is None:
+        return np.empty(0, dtype='datetime64[us]'), np.empty(0, dtype=np.float32)
+    times, values = get_graph_rows(buffer, first)
+    column_values = values[:, buffer['columns'][register]]
+    read = ~np.isnan(column_values)
+    return times[read], column_values[read]
+
+def get_graph_cursor(device_key, register):
+    """
+    Return how far the recording of a register has got; the caller holds graph_lock.
+
+    :return: List [buffer id, column id, rows written to the buffer], ids None if the register is not recorded
+    """
+    buffer = find_graph_buffer(device_key, register)
+    if buffer is None:
+        return [None, None, 0]
+    return [buffer['id'], buffer['column_ids'][register], buffer['count']]
+
+def get_new_graph_samples(device_key, registers, cursors):
+    """
+    Collect the samples recorded since a browser session last drew the graph.
+
+    :param device_key: Device the registers belong to
+    :param registers: Graphed register addresses, in trace order
+    :param cursors: Cursor of get_graph_cursor of each trace when the graph was last drawn
+    :return: Tuple (times, values, cursors) with the new samples and the updated cursor of each trace,
+             or None if a buffer or column was cleared or replaced and the graph has to be redrawn
+    """
+    new_times, new_values, new_cursors = [], [], []
+    with graph_lock:
+        for register, cursor in zip(registers, cursors):
+            new_cursor = get_graph_cursor(device_key, register)
+            if new_cursor[:2] != cursor[:2]:
+                return None
+            # Rows older than the buffer were dropped, the browser trims its copy the same way
+            times, values = get_graph_samples(device_key, register, cursor[2])
+            new_times.append(times)
+            new_values.append(values)
+            new_cursors.append(new_cursor)
+    return new_times, new_values, new_cursors
+
+def get_graph_frame(device_key, registers):
+    """
+    Return the recorded samples of registers as a DataFrame with a Timestamp column and a column per register.
+
+    Registers of the same scan class share their rows, those of other classes were read at other times
+    and are left empty in rows they were not read in.
+
+    :param device_key: Device the registers belong to
+    :param registers: Register addresses
+    :return: DataFrame with a row per scan that read any of the registers, or None if there are no samples
+    """
+    frame = None
+    with graph_lock:
+        for register in registers:
+            times, values = get_graph_samples(device_key, register)
+            if not len(times):
+                continue
+            register_name = f"{register}_{REGISTER_MAP[register]['name']}" if register in REGISTER_MAP else f"Register_{register}"
+            register_frame = pd.DataFrame({"Timestamp": times, register_name: values})
+            frame = register_frame if frame is None else frame.merge(register_frame, on="Timestamp", how='outer')
+    if frame is None:
+        return None
+    return frame.sort_values("Timestamp", ignore_index=True)
+
+def get_zoom_range(relayout_data):
+    """
+    Return the time range of the x axis after the register graph was zoomed or panned.
+
+    :param relayout_data: relayoutData of the register graph
+    :return: List [start, end] of the range, None if zoomed out to the whole history,
+             or False if the x axis did not change
+    """
+    if not relayout_data:
+        return False
+    if relayout_data.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+    if 'xaxis.range' in relayout_data:
+        return list(relayout_data['xaxis.range'])
+    return False
+
+def downsample_min_max(times, values, buckets):
+    """
+    Pick the samples to draw so that the lowest and highest value of every pixel column is kept.
+
+    The time span is split into buckets of equal duration and only the minimum and maximum sample
+    of each bucket is kept, so spikes stay visible however far the graph is zoomed out.
+
+    :param times: Sorted sample times as datetime64 array
+    :param values: Sample values as float array
+    :param buckets: Number of buckets
+    :return: Sorted indices of the samples to keep
+    """
+    if len(values) <= 2 * buckets:
+        return np.arange(len(values))
     
-    return selected_registers
+    ticks = times.astype('int64')
+    bucket = (ticks - ticks[0]) * buckets // (ticks[-1] - ticks[0] + 1)
+    # Sorted by bucket, then by value: the first sample of a bucket is its minimum, the last its maximum
+    order = np.lexsort((values, bucket))
+    sorted_buckets = bucket[order]
+    first = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+    return np.unique(np.r_[0, order[first], order[last], len(values) - 1])
+
+def downsample_graph_series(times, values, zoom_range):
+    """
+    Reduce a graph series to the samples worth drawing in the visible time range.
+
+    :param times: Sample times as datetime64 array
+    :param values: Sample values as float array
+    :param zoom_range: Visible [start, end] of the x axis, or None for the whole history
+    :return: Tuple (times, values) of arrays to draw
+    """
+    if zoom_range:
+        start, end = (np.datetime64(pd.Timestamp(limit).to_datetime64(), 'us') for limit in zoom_range)
+        # Keep one sample beyond each edge so that lines run to the border of the plot
+        first = max(np.searchsorted(times, start, 'left') - 1, 0)
+        last = np.searchsorted(times, end, 'right') + 1
+        times, values = times[first:last], values[first:last]
+    keep = downsample_min_max(times, values, GRAPH_PLOT_POINTS)
+    return times[keep], values[keep]
 
 # Callback to add bit definitions
 @app.callback(
@@ -2413,6 +5868,7 @@ def add_bit_definition(n_clicks, register, bit_position, description):
     
     # Add or update bit definition
     BIT_DEFINITIONS[register][bit_position] = description
+    mark_register_map_changed()
     logger.info(f"Added bit definition for register {register}, bit {bit_position}: {description}")
     
     # Return updated table and clear inputs
@@ -2486,6 +5942,7 @@ def delete_bit_definition(n_clicks, ids):
                 # If no more definitions for this register, remove the register entry
                 if not BIT_DEFINITIONS[register]:
                     del BIT_DEFINITIONS[register]
+                mark_register_map_changed()
     
     # Return updated table for the currently selected register
     ctx_inputs = dash.callback_context.inputs
@@ -2518,6 +5975,7 @@ def toggle_bit_display(show_value, register):
             
         # Update the show_bits setting
         BIT_DISPLAY_SETTINGS[register]["show_bits"] = show_value
+        mark_register_map_changed()
         logger.info(f"Set bit display for register {register} to {show_value}")
         
     # Handle register selection change
@@ -2550,55 +6008,91 @@ def update_graph_register_options(table_children, csv_upload):
 
 # Add this callback to update the graph with new data
 @app.callback(
-    Output("register-graph", "figure"),
+    [Output("register-graph", "figure"),
+     Output("register-graph", "extendData"),
+     Output("graph-cursors", "data")],
     [Input("interval-component", "n_intervals"),
      Input("graph-register-select", "value"),
-     Input("clear-graph-btn", "n_clicks")]
+     Input("clear-graph-btn", "n_clicks"),
+     Input("device-select", "value"),
+     Input("register-graph", "relayoutData"),
+     Input("graph-render-mode", "value")],
+    State("graph-cursors", "data")
 )
-def update_graph(n_intervals, selected_registers, clear_clicks):
-    """Update the graph with the latest data for selected registers"""
-    global GRAPH_DATA
-    
+def update_graph(n_intervals, selected_registers, clear_clicks, device_key, relayout_data, render_mode, cursors):
+    """
+    Draw the graph of the selected registers from the recorded history and stream new samples to it.
+
+    The figure is only rebuilt when the selection or the device changes, the graph is zoomed or
+    panned, or the graph is cleared. Each trace is then reduced to GRAPH_PLOT_POINTS buckets of the
+    visible time range, so zooming in fetches the full resolution. On a refresh only the samples
+    added since the last one are sent with extendData, so the cost of a refresh does not grow with
+    the history kept in GRAPH_DATA.
+
+    In WebGL render mode the traces are drawn with Scattergl. In either mode markers are left out
+    of traces with more than GRAPH_MARKER_POINTS points.
+
+    :param cursors: Device, registers, cursor of each trace and zoom range last drawn in this browser session
+    """
     # Initialize the figure
     fig = go.Figure()
     
-    # Clear graph data if clear button was clicked
+    # Clear the recorded history if clear button was clicked; the buffers created afterwards get
+    # new ids, so other sessions drawing the old ones redraw on their next refresh
     if ctx.triggered_id == "clear-graph-btn" and clear_clicks:
-        GRAPH_DATA = {}
-        return fig
+        with graph_lock:
+            GRAPH_DATA.clear()
+        return fig, dash.no_update, None
     
-    # If no registers selected, return empty figure
-    if not selected_registers:
-        return fig
+    # If no registers or device selected, return empty figure
+    if not selected_registers or not device_key:
+        return fig, dash.no_update, None
     
     # Make sure selected_registers is a list
     if not isinstance(selected_registers, list):
         selected_registers = [selected_registers]
     
-    # Initialize data structures for registers if they don't exist
-    for register in selected_registers:
-        if register not in GRAPH_DATA:
-            GRAPH_DATA[register] = {
-                'times': deque(maxlen=MAX_DATA_POINTS),
-                'values': deque(maxlen=MAX_DATA_POINTS)
-            }
-    
-    # Remove data for registers no longer selected
-    for register in list(GRAPH_DATA.keys()):
-        if register not in selected_registers:
-            del GRAPH_DATA[register]
-    
-    # Add a trace for each selected register
-    for register in selected_registers:
-        if register in GRAPH_DATA and len(GRAPH_DATA[register]['times']) > 0:
-            register_name = REGISTER_MAP[register]['name'] if register in REGISTER_MAP else f"Register {register}"
-            
-            fig.add_trace(go.Scatter(
-                x=list(GRAPH_DATA[register]['times']),
-                y=list(GRAPH_DATA[register]['values']),
-                mode='lines+markers',
-                name=f"{register}: {register_name}"
-            ))
+    same_graph = cursors and cursors['device'] == device_key and cursors['registers'] == selected_registers
+    zoom_range = cursors['range'] if same_graph else None
+    if ctx.triggered_id == "register-graph":
+        zoom_range = get_zoom_range(relayout_data)
+        if zoom_range is False:
+            raise PreventUpdate
+    
+    # Stream the new samples if the graph already shows the selected registers
+    if ctx.triggered_id == "interval-component" and same_graph:
+        new_samples = get_new_graph_samples(device_key, selected_registers, cursors['traces'])
+        # Streamed samples are not downsampled, redraw once they outnumber the drawn ones
+        if new_samples is not None and cursors['streamed'] < GRAPH_PLOT_POINTS:
+            new_times, new_values, traces = new_samples
+            streamed = max(len(times) for times in new_times)
+            if not streamed:
+                raise PreventUpdate
+            extension = [dict(x=new_times, y=new_values), list(range(len(selected_registers))),
+                         RECORDER_SETTINGS['max_rows']]
+            return dash.no_update, extension, dict(cursors, traces=traces, streamed=cursors['streamed'] + streamed)
+    
+    # Take the samples to draw from the recorded history of the device
+    traces, trace_cursors = [], []
+    with graph_lock:
+        for register in selected_registers:
+            times, values = get_graph_samples(device_key, register)
+            traces.append(downsample_graph_series(times, values, zoom_range))
+            trace_cursors.append(get_graph_cursor(device_key, register))
+    cursors = dict(device=device_key, registers=selected_registers, traces=trace_cursors,
+                   range=zoom_range, streamed=0)
+    
+    # Add a trace for each selected register, empty ones too so that trace indices match the selection
+    scatter = go.Scattergl if render_mode == 'webgl' else go.Scatter
+    for register, (times, values) in zip(selected_registers, traces):
+        register_name = REGISTER_MAP[register]['name'] if register in REGISTER_MAP else f"Register {register}"
+        
+        fig.add_trace(scatter(
+            x=times,
+            y=values,
+            mode='lines' if len(times) > GRAPH_MARKER_POINTS else 'lines+markers',
+            name=f"{register}: {register_name}"
+        ))
     
     # Update layout
     fig.update_layout(
@@ -2608,19 +6102,22 @@ def update_graph(n_intervals, selected_registers, clear_clicks):
         legend_title="Registers",
         margin=dict(l=40, r=40, t=40, b=40),
         hovermode="closest",
-        height=400
+        height=400,
+        # Keep the zoom of the user when the figure is redrawn for the same registers
+        uirevision=f"{device_key}:{selected_registers}"
     )
     
-    return fig
+    return fig, dash.no_update, cursors
 
 # 5. Improved CSV export callback with better error handling
 @app.callback(
     Output("download-graph-csv", "data"),
     Input("export-graph-csv-btn", "n_clicks"),  # Fixed button ID
-    State("graph-register-select", "value"),
+    [State("graph-register-select", "value"),
+     State("device-select", "value")],
     prevent_initial_call=True
 )
-def export_graph_data_as_csv(n_clicks, selected_registers):
+def export_graph_data_as_csv(n_clicks, selected_registers, device_key):
     # Keep existing function implementation
     # (Make sure to fix the PreventUpdate import if needed)
     if not n_clicks or not selected_registers:
@@ -2633,13 +6130,9 @@ def export_graph_data_as_csv(n_clicks, selected_registers):
             selected_registers = [selected_registers]
         
         # Check if we have any data to export
-        has_data = False
-        for register in selected_registers:
-            if register in GRAPH_DATA and len(GRAPH_DATA[register]['times']) > 0:
-                has_data = True
-                break
+        df = get_graph_frame(device_key, selected_registers)
         
-        if not has_data:
+        if df is None:
             logger.warning("No data to export to CSV")
             # Return a simple CSV with headers but no data
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -2649,47 +6142,20 @@ def export_graph_data_as_csv(n_clicks, selected_registers):
                 type="text/plain",
             )
         
-        # Create a consolidated DataFrame with all register data
-        data_dict = {"Timestamp": []}
+        # Create a proper CSV string using pandas
+        csv_string = df.to_csv(index=False, date_format='%Y-%m-%d %H:%M:%S.%f')
         
-        # Add data for each register
-        for register in selected_registers:
-            if register in GRAPH_DATA and len(GRAPH_DATA[register]['times']) > 0:
-                register_name = f"{register}_{REGISTER_MAP[register]['name']}" if register in REGISTER_MAP else f"Register_{register}"
-                
-                # Convert times to strings to avoid JSON serialization issues
-                formatted_times = [t.strftime('%Y-%m-%d %H:%M:%S.%f') for t in GRAPH_DATA[register]['times']]
-                
-                # Add formatted times and values to the data dictionary
-                if not data_dict["Timestamp"]:
-                    data_dict["Timestamp"] = formatted_times
-                
-                data_dict[register_name] = list(GRAPH_DATA[register]['values'])
+        # Generate timestamp for filename
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"modbus_data_{timestamp}.csv"
         
-        # Create a proper CSV string using pandas
-        # Convert to DataFrame and then to CSV
-        if data_dict["Timestamp"]:
-            df = pd.DataFrame(data_dict)
-            csv_string = df.to_csv(index=False)
-            
-            # Generate timestamp for filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"modbus_data_{timestamp}.csv"
-            
-            logger.info(f"Successfully created CSV with {len(df)} rows")
-            
-            return dict(
-                content=csv_string,
-                filename=filename,
-                type="text/csv",
-            )
-        else:
-            # Fallback if no timestamps were collected
-            return dict(
-                content="No timestamp data available for selected registers",
-                filename="modbus_data_empty.txt",
-                type="text/plain",
-            )
+        logger.info(f"Successfully created CSV with {len(df)} rows")
+        
+        return dict(
+            content=csv_string,
+            filename=filename,
+            type="text/csv",
+        )
             
     except Exception as e:
         error_msg = str(e)
@@ -2707,10 +6173,11 @@ def export_graph_data_as_csv(n_clicks, selected_registers):
     Output("export-status", "children"),
     Input("export-graph-csv-btn", "n_clicks"),
     [State("graph-register-select", "value"),
-     State("register-graph", "figure")],
+     State("register-graph", "figure"),
+     State("device-select", "value")],
     prevent_initial_call=True
 )
-def update_export_status(png_clicks, csv_clicks, selected_registers, figure):
+def update_export_status(csv_clicks, selected_registers, figure, device_key):
     """Display status messages for export operations"""
     ctx_triggered = ctx.triggered_id if ctx.triggered else None
     
@@ -2722,13 +6189,8 @@ def update_export_status(png_clicks, csv_clicks, selected_registers, figure):
             return dbc.Alert("No registers selected. Please select registers from the dropdown.", color="warning")
         
         # Check if we have any data to export
-        has_data = False
-        for register in selected_registers if isinstance(selected_registers, list) else [selected_registers]:
-            if register in GRAPH_DATA and len(GRAPH_DATA[register]['times']) > 0:
-                has_data = True
-                break
-        
-        if not has_data:
+        registers = selected_registers if isinstance(selected_registers, list) else [selected_registers]
+        if get_graph_frame(device_key, registers) is None:
             return dbc.Alert("No data available for the selected registers. Please wait for data collection.", color="warning")
         
         return dbc.Alert("Starting CSV export. If download doesn't appear, check browser settings.", color="success")
@@ -2737,15 +6199,9 @@ def update_export_status(png_clicks, csv_clicks, selected_registers, figure):
 
 # Ensure proper cleanup when application exits
 def signal_handler(sig, frame):
-    global client
     logger.info(f"Signal {sig} received, shutting down...")
-    if client:
-        try:
-            logger.info("Closing Modbus connection before exit")
-            client.close()
-            logger.info("Connection closed successfully")
-        except Exception as e:
-            logger.error(f"Error closing connection during shutdown: {str(e)}")
+    # Stops every bus worker and closes its connection
+    stop_all_buses()
     logger.info("Exiting application")
     sys.exit(0)
     
@@ -2760,23 +6216,65 @@ signal.signal(signal.SIGTERM, signal_handler)  # Handle termination signal
 
 # Add a cleanup function to release port on exit
 def cleanup_on_exit():
-    global client
     logger.info("Cleanup on exit called")
-    if client:
-        try:
-            logger.info("Closing Modbus connection")
-            client.close()
-            logger.info("Modbus connection closed successfully")
-        except Exception as e:
-            logger.error(f"Error during cleanup: {str(e)}")
-            logger.error(traceback.format_exc())
+    if BUS_WORKERS:
+        stop_all_buses()
     else:
-        logger.info("No active client to close during cleanup")
+        logger.info("No active bus to close during cleanup")
 
 # Add this near the top of the script where other constants are defined
 DEFAULT_REGISTER_MAP_CSV = "register_map_default.csv"
 
 # Then update the main code to load from this CSV on startup if it exists
+def parse_command_line(argv=None):
+    """Parse the command line options of the application."""
+    parser = argparse.ArgumentParser(description="Modbus RTU Web Viewer")
+    parser.add_argument('--simulator', choices=['inprocess', 'pty', 'tcp'],
+                        help="Start a simulated device, reachable in-process, on a pseudo-terminal or over TCP")
+    parser.add_argument('--simulator-map', metavar='CSV', help="Register map of the simulator (default: current map)")
+    parser.add_argument('--simulator-units', default='1', help="Unit IDs answered by the simulator, e.g. 1,2,5")
+    parser.add_argument('--simulator-port', type=int, default=5020, help="TCP port of the simulator server")
+    parser.add_argument('--simulator-latency', type=float, default=SIMULATOR_DEFAULTS['latency'],
+                        help="Response latency in seconds")
+    parser.add_argument('--simulator-jitter', type=float, default=SIMULATOR_DEFAULTS['jitter'],
+                        help="Random extra latency in seconds")
+    parser.add_argument('--simulator-exception-rate', type=float, default=SIMULATOR_DEFAULTS['exception_rate'],
+                        help="Share of requests answered with a slave device failure")
+    parser.add_argument('--simulator-timeout-rate', type=float, default=SIMULATOR_DEFAULTS['timeout_rate'],
+                        help="Share of requests left unanswered")
+    parser.add_argument('--simulator-seed', type=int, help="Seed for repeatable simulator runs")
+    parser.add_argument('--benchmark', metavar='JSON', help="Run the poll engine benchmark, save the results and exit")
+    parser.add_argument('--benchmark-map-sizes', type=parse_number_list, help="e.g. 50,100,0 (0 = whole map)")
+    parser.add_argument('--benchmark-block-sizes', type=parse_number_list, help="e.g. 16,64,125")
+    parser.add_argument('--benchmark-baudrates', type=parse_number_list, help="e.g. 9600,19200,115200")
+    parser.add_argument('--benchmark-latencies', type=lambda value: parse_number_list(value, float),
+                        help="Device latencies in seconds, e.g. 0,0.005")
+    parser.add_argument('--benchmark-units', type=parse_number_list, help="Units per bus, e.g. 1,4,16")
+    parser.add_argument('--benchmark-cycles', type=int, help="Measured cycles per combination")
+    return parser.parse_args(argv)
+
+def parse_number_list(value, number_type=int):
+    """Parse a comma separated command line list like "1,4,16"."""
+    try:
+        return [number_type(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a comma separated list of numbers")
+
+def start_simulator_from_args(args):
+    """Create and start the simulator requested on the command line and return the port to connect to."""
+    register_map = load_register_map_from_csv(args.simulator_map) if args.simulator_map else REGISTER_MAP
+    sim = create_simulator("default", register_map, parse_unit_ids(args.simulator_units), seed=args.simulator_seed,
+                           latency=args.simulator_latency, jitter=args.simulator_jitter,
+                           exception_rate=args.simulator_exception_rate, timeout_rate=args.simulator_timeout_rate)
+    if args.simulator == 'tcp':
+        port = start_simulator_tcp(sim, args.simulator_port)
+    elif args.simulator == 'pty':
+        port = start_simulator_pty(sim)
+    else:
+        port = SIMULATOR_SCHEME + sim['name']
+    logger.info(f"Simulator ready, connect to {port}")
+    return port
+
 if __name__ == '__main__':
     # Register the cleanup function to be called on exit
     import atexit
@@ -2790,6 +6288,7 @@ if __name__ == '__main__':
         logger.info(f"Loading default register map from {DEFAULT_REGISTER_MAP_CSV}")
         try:
             REGISTER_MAP = load_register_map_from_csv(DEFAULT_REGISTER_MAP_CSV)
+            mark_register_map_changed()
             renamed_vars = {k: v['name'] for k, v in REGISTER_MAP.items()}
             logger.info(f"Loaded {len(REGISTER_MAP)} registers from default CSV")
         except Exception as e:
@@ -2799,6 +6298,19 @@ if __name__ == '__main__':
         logger.info(f"Default register map CSV not found: {DEFAULT_REGISTER_MAP_CSV}")
         logger.info("Using built-in register map")
     
+    # Plan block reads around the invalid addresses learned in earlier sessions
+    load_learned_holes()
+    
+    args = parse_command_line()
+    if args.benchmark:
+        run_benchmark(args.benchmark, map_sizes=args.benchmark_map_sizes, block_sizes=args.benchmark_block_sizes,
+                      baudrates=args.benchmark_baudrates, latencies=args.benchmark_latencies,
+                      units=args.benchmark_units, cycles=args.benchmark_cycles)
+        sys.exit(0)
+    # With debug=True the reloader runs this file twice; only the process serving the app starts a simulator
+    if args.simulator and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_simulator_from_args(args)
+    
     try:
         logger.info("Starting Dash server")
         app.run(debug=True)
@@ -0,0 +1,87 @@
+import importlib.util
+import itertools
+import os
+import sys
+
+import pytest
+
+MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Mb-poll.py")
+simulator_names = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def mb():
+    """The Mb-poll.py module, loaded once (its file name is not importable)."""
+    spec = importlib.util.spec_from_file_location("mb_poll", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["mb_poll"] = module
+    spec.loader.exec_module(module)
+    yield module
+    module.stop_all_buses()
+
+
+@pytest.fixture
+def register_map(mb, monkeypatch):
+    """Return a function that replaces REGISTER_MAP for the test."""
+    def set_register_map(new_map):
+        monkeypatch.setattr(mb, "REGISTER_MAP", new_map)
+        mb.mark_register_map_changed()
+        return new_map
+    yield set_register_map
+    monkeypatch.undo()
+    mb.mark_register_map_changed()
+
+
+@pytest.fixture
+def simulated_bus(mb, monkeypatch):
+    """
+    Return a function that starts a bus scanning an in-process simulator (SimulatedModbusClient)
+    and returns the simulator and the key of its first device. The buses are stopped after the test.
+    """
+    monkeypatch.setattr(mb, "save_learned_holes", lambda *args: None)
+    ports = []
+
+    def start(unit_ids=(1,), **settings):
+        sim = mb.create_simulator(f"test{next(simulator_names)}", unit_ids=unit_ids, seed=1, **settings)
+        port = mb.SIMULATOR_SCHEME + sim['name']
+        config = dict(mb.MODBUS_CONFIG, engine='thread')
+        client = mb.create_modbus_client(port, config)
+        client.connect()
+        mb.start_bus(port, client, config, list(unit_ids), "test")
+        ports.append(port)
+        return sim, mb.make_device_key(port, unit_ids[0])
+
+    yield start
+    for port in ports:
+        mb.stop_bus(port)
+
+
+@pytest.fixture
+def driven_bus(mb, monkeypatch):
+    """
+    Return a function that creates a bus on an in-process simulator without a worker, like the
+    benchmark does, so the test drives its scans with scan_device. Returns the simulator, the bus
+    and the device of unit 1; the bus is stopped after the test.
+    """
+    monkeypatch.setattr(mb, "save_learned_holes", lambda *args: None)
+    ports = []
+
+    def create(register_map, implemented=None, timeout=1, **settings):
+        name = f"driven{next(simulator_names)}"
+        sim = mb.create_simulator(name, implemented or register_map, generators={}, seed=1, latency=0, jitter=0,
+                                  **settings)
+        port = mb.SIMULATOR_SCHEME + name
+        config = dict(mb.MODBUS_CONFIG, engine='thread', model=name, timeout=timeout)
+        client = mb.create_modbus_client(port, config)
+        client.connect()
+        with mb.bus_registry_lock:
+            bus = mb.BUS_WORKERS[port] = mb.create_bus(port, client, config, name, register_map=register_map)
+            mb.add_bus_units(port, [1])
+        ports.append(port)
+        return sim, bus, mb.DEVICES[mb.make_device_key(port, 1)]
+
+    yield create
+    for port in ports:
+        mb.stop_bus(port)
+        with mb.holes_lock:
+            mb.LEARNED_HOLES.pop(port[len(mb.SIMULATOR_SCHEME):], None)
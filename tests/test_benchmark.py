@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.mark.parametrize("count, percentile, rank", [
+    (100, 50, 50),
+    (100, 95, 95),
+    (100, 99, 99),
+    (100, 100, 100),
+    (10, 50, 5),
+    (10, 95, 10),
+    (10, 1, 1),
+    (1, 99, 1),
+])
+def test_percentile_is_the_nearest_rank(mb, count, percentile, rank):
+    samples = list(range(count, 0, -1))  # Unsorted on purpose
+
+    assert mb.get_percentile(samples, percentile) == rank
+
+
+def test_percentile_of_zero_is_the_minimum(mb):
+    assert mb.get_percentile([3, 1, 2], 0) == 1
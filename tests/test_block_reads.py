@@ -0,0 +1,179 @@
+import pytest
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.register_read_message import ReadHoldingRegistersResponse
+
+
+def holding(*addresses, **settings):
+    return {address: dict({'name': str(address), 'type': 'Holding', 'multiplier': 1, 'unit': ''}, **settings)
+            for address in addresses}
+
+
+def spans(blocks):
+    return [(block['type'], block['start'], block['count']) for block in blocks]
+
+
+def test_contiguous_registers_are_read_in_one_block(mb):
+    blocks = mb.plan_block_reads(holding(*range(10)))
+
+    assert spans(blocks) == [('Holding', 0, 10)]
+    assert blocks[0]['addresses'] == list(range(10))
+
+
+def test_small_gaps_are_bridged_and_large_gaps_split(mb):
+    gap = mb.MAX_BRIDGE_GAP_REGISTERS
+    register_map = holding(0, 1 + gap, 2 + 2 * gap + 1)
+
+    blocks = mb.plan_block_reads(register_map)
+
+    assert spans(blocks) == [('Holding', 0, 2 + gap), ('Holding', 2 + 2 * gap + 1, 1)]
+    # Bridged addresses are read but not wanted
+    assert blocks[0]['addresses'] == [0, 1 + gap]
+
+
+def test_register_types_are_planned_separately(mb):
+    register_map = holding(0, 1)
+    register_map.update({2: {'name': '2', 'type': 'Input'}, 3: {'name': '3', 'type': 'Coil'}})
+
+    assert sorted(spans(mb.plan_block_reads(register_map))) == [('Coil', 3, 1), ('Holding', 0, 2), ('Input', 2, 1)]
+
+
+@pytest.mark.parametrize("block_size", [125, 16, 1])
+def test_blocks_respect_the_block_size(mb, block_size):
+    blocks = mb.plan_block_reads(holding(*range(300)), block_size=block_size)
+
+    assert all(block['count'] <= block_size for block in blocks)
+    assert [address for block in blocks for address in block['addresses']] == list(range(300))
+
+
+def test_bits_use_the_bit_limit(mb):
+    register_map = {address: {'name': str(address), 'type': 'Coil'} for address in range(mb.MAX_READ_BITS + 1)}
+
+    assert spans(mb.plan_block_reads(register_map)) == [('Coil', 0, mb.MAX_READ_BITS), ('Coil', mb.MAX_READ_BITS, 1)]
+
+
+def test_multi_word_values_are_never_split(mb):
+    register_map = holding(*range(0, 14, 2), data_type='uint32')
+
+    blocks = mb.plan_block_reads(register_map, block_size=5)
+
+    assert spans(blocks) == [('Holding', 0, 4), ('Holding', 4, 4), ('Holding', 8, 4), ('Holding', 12, 2)]
+    assert blocks[0]['spans'] == {0: 2, 2: 2}
+
+
+def test_known_holes_are_isolated_and_not_bridged(mb):
+    holes = {'Holding': {2, 6}}
+
+    blocks = mb.plan_block_reads(holding(0, 1, 3, 4, 6), holes)
+
+    # 3 follows the hole at 2, 6 is a hole that is still wanted
+    assert spans(blocks) == [('Holding', 0, 2), ('Holding', 3, 2), ('Holding', 6, 1)]
+
+
+def test_isolated_registers_get_a_request_of_their_own(mb):
+    blocks = mb.plan_block_reads(holding(*range(5)), isolated={2})
+
+    assert spans(blocks) == [('Holding', 0, 2), ('Holding', 2, 1), ('Holding', 3, 2)]
+
+
+def test_blocks_do_not_extend_across_learned_boundaries(mb):
+    holes = {mb.get_boundary_key('Holding'): {3}}
+
+    assert spans(mb.plan_block_reads(holding(*range(6)), holes)) == [('Holding', 0, 3), ('Holding', 3, 3)]
+
+
+def test_split_block_halves_the_wanted_values(mb):
+    block, = mb.plan_block_reads(holding(0, 1, 2, 6, 7))
+
+    left, right, gap = mb.split_block(block)
+
+    assert spans([left, right]) == [('Holding', 0, 2), ('Holding', 2, 6)]
+    assert right['addresses'] == [2, 6, 7]
+    assert gap == range(2, 2)
+
+
+def test_split_block_skips_the_gap_and_keeps_multi_word_values_whole(mb):
+    register_map = holding(0)
+    register_map.update(holding(5, data_type='float32'))
+    block, = mb.plan_block_reads(register_map)
+
+    left, right, gap = mb.split_block(block)
+
+    assert spans([left, right]) == [('Holding', 0, 1), ('Holding', 5, 2)]
+    assert right['spans'] == {5: 2}
+    assert gap == range(1, 5)
+
+
+def read_from_simulator(mb, register_map, implemented, holes):
+    """Read the planned blocks of register_map from a simulator implementing only the implemented registers."""
+    sim = mb.create_simulator("bisection", register_map=implemented, generators={}, latency=0, jitter=0)
+    for address in implemented:
+        mb.write_simulated_values(sim, 1, 'Holding', address, [address])
+    client = mb.SimulatedModbusClient(sim)
+    client.connect()
+    values = mb.read_register_blocks(client, mb.plan_block_reads(register_map, holes), 1, holes)
+    return values, sim['requests']
+
+
+def test_bisection_learns_a_hole_in_a_bridged_gap(mb):
+    register_map = holding(0, 1, 2, 5, 6)
+    holes = {}
+
+    values, requests = read_from_simulator(mb, register_map, holding(0, 1, 2, 4, 5, 6), holes)
+
+    assert values == {0: 0, 1: 1, 2: 2, 5: 5, 6: 6}
+    assert holes == {'Holding': {3, 4}}
+    # Refused block, both halves, and both halves of the refused right half
+    assert requests == 5
+    assert spans(mb.plan_block_reads(register_map, holes)) == [('Holding', 0, 3), ('Holding', 5, 2)]
+
+
+def test_bisection_learns_a_wanted_address_the_device_lacks(mb):
+    holes = {}
+
+    values, _ = read_from_simulator(mb, holding(0, 1, 2, 3), holding(0, 1, 3), holes)
+
+    assert values == {0: 0, 1: 1, 2: None, 3: 3}
+    assert holes == {'Holding': {2}}
+
+
+def run_steps(mb, blocks, respond, holes=None):
+    """Drive block_read_steps with a function returning the response to each block; return the values and the blocks sent."""
+    sent = []
+    steps = mb.block_read_steps(blocks, holes)
+    try:
+        block = next(steps)
+        while True:
+            sent.append((block['start'], block['count']))
+            block = steps.send(respond(block))
+    except StopIteration as finished:
+        return finished.value, sent
+
+
+def test_bisection_learns_a_boundary_when_only_the_combined_span_is_refused(mb):
+    def respond(block):
+        if block['start'] < 50 < block['start'] + block['count']:
+            return ExceptionResponse(0x03, mb.ILLEGAL_DATA_ADDRESS)
+        return ReadHoldingRegistersResponse(list(range(block['start'], block['start'] + block['count'])))
+
+    register_map = holding(*range(40, 60))
+    holes = {}
+
+    values, sent = run_steps(mb, mb.plan_block_reads(register_map, holes), respond, holes)
+
+    assert values == {address: address for address in range(40, 60)}
+    assert sent == [(40, 20), (40, 10), (50, 10)]
+    assert holes == {mb.get_boundary_key('Holding'): {50}}
+    _, sent = run_steps(mb, mb.plan_block_reads(register_map, holes), respond, holes)
+    assert sent == [(40, 10), (50, 10)]
+
+
+def test_blocks_refused_with_other_exceptions_are_read_register_by_register(mb):
+    def respond(block):
+        if block['start'] == 1 or block['count'] > 1:
+            return ExceptionResponse(0x03, mb.SIMULATOR_EXCEPTION_CODE)
+        return ReadHoldingRegistersResponse([7])
+
+    values, sent = run_steps(mb, mb.plan_block_reads(holding(0, 1, 2)), respond, {})
+
+    assert values == {0: 7, 1: None, 2: 7}
+    assert sent == [(0, 3), (0, 1), (1, 1), (2, 1)]
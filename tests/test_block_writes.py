@@ -0,0 +1,68 @@
+import pytest
+
+
+def runs(blocks):
+    return [(block['type'], block['start'], len(block['addresses'])) for block in blocks]
+
+
+def test_adjacent_writes_are_merged_and_gaps_split(mb):
+    writes = [(0, 1, 'Holding'), (1, 2, 'Holding'), (3, 3, 'Holding'), (4, True, 'Coil')]
+
+    blocks = mb.plan_block_writes(writes)
+
+    assert runs(blocks) == [('Holding', 0, 2), ('Holding', 3, 1), ('Coil', 4, 1)]
+    assert blocks[0]['values'] == [1, 2]
+
+
+def test_last_value_of_a_repeated_address_wins(mb):
+    blocks = mb.plan_block_writes([(0, 1, 'Holding'), (0, 2, 'Holding')])
+
+    assert blocks[0]['values'] == [2]
+
+
+@pytest.mark.parametrize("register_type, verify, limit", [
+    ('Holding', False, 123),  # FC16
+    ('Coil', False, 1968),  # FC15
+    ('Holding', True, 121),  # FC23
+])
+def test_runs_respect_the_request_limits(mb, register_type, verify, limit):
+    writes = [(address, 1, register_type) for address in range(limit + 1)]
+
+    assert runs(mb.plan_block_writes(writes, verify)) == [(register_type, 0, limit), (register_type, limit, 1)]
+
+
+def test_word_lists_are_not_split_across_requests(mb):
+    writes = [(address, 1, 'Holding') for address in range(120)] + [(120, [1, 2, 3, 4], 'Holding')]
+
+    blocks = mb.plan_block_writes(writes)
+
+    assert runs(blocks) == [('Holding', 0, 120), ('Holding', 120, 4)]
+    assert blocks[1]['values'] == [1, 2, 3, 4]
+
+
+def test_word_lists_longer_than_a_request_are_chunked(mb):
+    blocks = mb.plan_block_writes([(0, list(range(125)), 'Holding')])
+
+    assert runs(blocks) == [('Holding', 0, 123), ('Holding', 123, 2)]
+
+
+def test_only_holding_registers_and_coils_can_be_written(mb):
+    with pytest.raises(ValueError):
+        mb.plan_block_writes([(0, 1, 'Input')])
+
+
+@pytest.mark.parametrize("verify", [False, True])
+def test_planned_blocks_are_written_in_one_request_each(mb, verify):
+    register_map = {address: {'name': str(address), 'type': 'Holding'} for address in range(200)}
+    sim = mb.create_simulator("writes", register_map=register_map, generators={}, latency=0, jitter=0)
+    client = mb.SimulatedModbusClient(sim)
+    client.connect()
+    writes = [(address, address + 1, 'Holding') for address in range(200)]
+
+    results = {}
+    for block in mb.plan_block_writes(writes, verify):
+        results.update(mb.check_write_block(block, mb.write_modbus_block(client, block, 1, verify), verify))
+
+    assert sim['requests'] == 2
+    assert all(response is not None for response in results.values())
+    assert list(mb.read_simulated_values(sim, 1, 'Holding', 0, 200)) == list(range(1, 201))
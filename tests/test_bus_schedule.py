@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def normal_period(mb, monkeypatch):
+    monkeypatch.setitem(mb.POLLER_SETTINGS, 'interval', 10)
+
+
+def test_classes_that_fit_keep_their_periods(mb):
+    periods, planned = mb.plan_bus_schedule({'fast': 0.01, 'normal': 1, 'slow': 3}, 0.8)
+
+    assert periods == {'fast': 0.1, 'normal': 10, 'slow': 30}
+    assert planned == pytest.approx(0.3)
+
+
+def test_classes_without_registers_keep_their_periods(mb):
+    periods, planned = mb.plan_bus_schedule({'normal': 2}, 0.8)
+
+    assert periods == {'fast': 0.1, 'normal': 10, 'slow': 30}
+    assert planned == pytest.approx(0.2)
+
+
+def test_the_class_that_does_not_fit_is_stretched_to_the_remaining_share(mb):
+    periods, planned = mb.plan_bus_schedule({'fast': 0.05, 'normal': 5, 'slow': 3}, 0.8)
+
+    assert periods['fast'] == pytest.approx(0.1)
+    # Fast takes half the bus, normal gets the remaining 30 % instead of the 50 % it asks for
+    assert periods['normal'] == pytest.approx(5 / 0.3)
+    # Nothing is left for slow, which still gets the minimum share
+    assert periods['slow'] == pytest.approx(3 / (0.8 * mb.SCHEDULER_MIN_SHARE))
+    assert planned == pytest.approx(0.8 + 0.8 * mb.SCHEDULER_MIN_SHARE)
+
+
+def test_classes_are_admitted_in_priority_order(mb):
+    periods, planned = mb.plan_bus_schedule({'fast': 0.2, 'normal': 1, 'slow': 2}, 0.8)
+
+    assert periods['fast'] == pytest.approx(0.2 / 0.8)
+    assert periods['normal'] == pytest.approx(1 / (0.8 * mb.SCHEDULER_MIN_SHARE))
+    assert periods['slow'] == pytest.approx(2 / (0.8 * mb.SCHEDULER_MIN_SHARE))
+    assert planned == pytest.approx(0.8 * (1 + 2 * mb.SCHEDULER_MIN_SHARE))
+
+
+def test_admitted_periods_are_never_shorter_than_requested(mb):
+    periods, _ = mb.plan_bus_schedule({'fast': 0.001, 'normal': 0.001, 'slow': 0.001}, 1.0)
+
+    assert periods == {'fast': 0.1, 'normal': 10, 'slow': 30}
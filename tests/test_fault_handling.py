@@ -0,0 +1,129 @@
+import pytest
+
+FAULT_MAP = {address: {'name': str(address), 'type': 'Holding', 'multiplier': 1, 'unit': ''} for address in range(5)}
+
+
+def make_device():
+    return {'key': 'test:1', 'quarantine': {}}
+
+
+def test_quarantine_backs_off_exponentially_up_to_the_maximum(mb):
+    device = make_device()
+
+    untils = []
+    for now in range(12):
+        mb.update_quarantine(device, {0: 1, 1: None}, now)
+        untils.append(device['quarantine'][1]['until'] - now)
+
+    assert untils[:5] == [0, 5, 10, 20, 40]
+    assert max(untils) == mb.QUARANTINE_MAX_DELAY
+    assert device['quarantine'][1]['failures'] == 12
+
+
+def test_one_successful_read_releases_a_register(mb):
+    device = make_device()
+    mb.update_quarantine(device, {0: 1, 1: None}, 0)
+    mb.update_quarantine(device, {0: 1, 1: None}, 1)
+
+    mb.update_quarantine(device, {0: 1, 1: 7}, 100)
+
+    assert device['quarantine'] == {}
+
+
+def test_unreachable_devices_do_not_quarantine_their_registers(mb):
+    device = make_device()
+
+    mb.update_quarantine(device, {0: None, 1: None}, 0)
+
+    assert device['quarantine'] == {}
+
+
+def test_quarantined_registers_are_skipped_until_their_back_off_expires(mb, driven_bus):
+    sim, bus, device = driven_bus(FAULT_MAP, implemented={address: FAULT_MAP[address] for address in (0, 1, 2, 4)})
+    requests = []
+
+    def scan():
+        device['last_scan'].clear()  # Everything is due
+        before = sim['requests']
+        mb.scan_device(bus, device)
+        requests.append(sim['requests'] - before)
+        return mb.get_device_snapshot(device['key'])['values']
+
+    assert scan()[3] is None
+    assert device['quarantine'][3]['failures'] == 1
+    # Read on its own, fails again and is backed off
+    scan()
+    assert device['quarantine'][3]['failures'] == 2
+    assert device['quarantine'][3]['until'] > mb.time.time()
+    scan()
+    assert requests[-1] == 2  # 0-2 and 4, without 3
+
+    mb.write_simulated_values(sim, 1, 'Holding', 3, [33])
+    device['quarantine'][3]['until'] = 0
+    assert scan()[3] == 33
+    assert device['quarantine'] == {}
+
+
+
+def test_quarantined_registers_of_classes_without_a_period_are_probed_again(mb, driven_bus, monkeypatch):
+    register_map = {address: FAULT_MAP[address] for address in (0, 1)}
+    register_map[3] = dict(FAULT_MAP[3], scan='once')
+    sim, bus, device = driven_bus(register_map, implemented={address: FAULT_MAP[address] for address in (0, 1)})
+    read = []
+    read_register_blocks = mb.read_register_blocks
+
+    def record_reads(client, blocks, *args, **kwargs):
+        read.append(sorted(address for block in blocks for address in block['addresses']))
+        return read_register_blocks(client, blocks, *args, **kwargs)
+
+    def scan_normal():
+        device['last_scan']['normal'] = 0  # Due, while 'once' was read on connect
+        mb.scan_device(bus, device)
+        return mb.get_device_snapshot(device['key'])['values']
+
+    mb.scan_device(bus, device)
+    assert 'once' in device['last_scan'] and device['quarantine'][3]['failures'] == 1
+    monkeypatch.setattr(mb, "read_register_blocks", record_reads)
+    scan_normal()
+    assert read[-1] == [0, 1, 3]
+    assert device['quarantine'][3]['failures'] == 2
+    # Skipped while backed off
+    scan_normal()
+    assert read[-1] == [0, 1]
+
+    mb.write_simulated_values(sim, 1, 'Holding', 3, [33])
+    device['quarantine'][3]['until'] = 0
+    assert scan_normal()[3] == 33
+    assert device['quarantine'] == {}
+    # Released, so read once only
+    scan_normal()
+    assert read[-1] == [0, 1]
+
+
+def test_breaker_trips_probes_and_closes(mb, driven_bus):
+    sim, bus, device = driven_bus({address: FAULT_MAP[0] for address in range(0, 40, 10)}, timeout=0.01,
+                                  timeout_rate=1.0)
+    breaker = device['breaker']
+
+    mb.scan_device(bus, device)
+    # The remaining block is skipped once the breaker trips
+    assert sim['requests'] == mb.BREAKER_TRIP_TIMEOUTS
+    assert breaker['open']
+    assert mb.get_device_snapshot(device['key'])['status'] == 'offline'
+    # Nothing is read before the back-off expires
+    assert mb.begin_device_scan(bus, device, breaker['retry_at'] - 1)['blocks'] == []
+
+    breaker['retry_at'] = 0
+    probe = mb.begin_device_scan(bus, device, 1)
+    assert probe['probe'] and [block['count'] for block in probe['blocks']] == [1]
+    mb.scan_device(bus, device)
+    assert breaker['open'] and breaker['probes'] == 1
+    assert breaker['retry_at'] - mb.time.time() == pytest.approx(2 * mb.BREAKER_BASE_DELAY, abs=0.5)
+
+    sim['timeout_rate'] = 0.0
+    breaker['retry_at'] = 0
+    mb.scan_device(bus, device)
+    assert not breaker['open']
+    assert device['last_scan'] == {}  # Full scan right away
+    mb.scan_device(bus, device)
+    assert mb.get_device_snapshot(device['key'])['values'] == {address: 0 for address in range(0, 40, 10)}
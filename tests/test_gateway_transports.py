@@ -0,0 +1,119 @@
+import socket
+import time
+
+import pytest
+
+GATEWAY_MAP = {address: {'name': f"Parameter {address}", 'type': 'Holding', 'multiplier': 1, 'unit': ''}
+               for address in range(10)}
+GATEWAY_MAP.update({100 + address: {'name': f"Measurement {address}", 'type': 'Input', 'multiplier': 1, 'unit': ''}
+                    for address in range(5)})
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise TimeoutError("condition not met")
+        time.sleep(0.05)
+
+
+def is_listening(tcp_port):
+    try:
+        socket.create_connection(("127.0.0.1", tcp_port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+@pytest.fixture
+def gateway(mb, register_map, monkeypatch):
+    """Return a function that serves a simulator on an ephemeral port and connects to it like the UI does."""
+    register_map(GATEWAY_MAP)
+    monkeypatch.setattr(mb, "save_learned_holes", lambda *args: None)
+    monkeypatch.setitem(mb.POLLER_SETTINGS, 'interval', 3600)  # One scan, then only requested transactions
+    ports = []
+
+    def connect(transport, unit_ids, engine='thread', pipeline_depth=1, **settings):
+        sim = mb.create_simulator(f"gateway-{transport}-{engine}", unit_ids=(1, 2, 3, 4), generators={}, seed=1,
+                                  jitter=0, **settings)
+        tcp_port = get_free_port()
+        port = mb.start_simulator_tcp(sim, tcp_port, transport=transport)
+        wait_for(lambda: is_listening(tcp_port))
+        config = dict(mb.MODBUS_CONFIG, unit_id=",".join(map(str, unit_ids)), engine=engine)
+        mb.connect_modbus(1, None, transport, f"127.0.0.1:{tcp_port}", pipeline_depth, config, 3600, 1)
+        ports.append(port)
+        assert port in mb.BUS_WORKERS
+        return sim, port
+
+    yield connect
+    for port in ports:
+        mb.stop_bus(port)
+
+
+def wait_for_snapshots(mb, port, unit_ids):
+    keys = [mb.make_device_key(port, unit_id) for unit_id in unit_ids]
+    wait_for(lambda: all((mb.get_device_snapshot(key) or {}).get('values') for key in keys))
+    return keys
+
+
+@pytest.mark.parametrize("transport", ["tcp", "rtu_over_tcp"])
+def test_block_reads_and_writes_through_gateway(mb, gateway, transport):
+    sim, port = gateway(transport, [1])
+    mb.write_simulated_values(sim, 1, 'Holding', 0, list(range(10, 20)))
+    mb.write_simulated_values(sim, 1, 'Input', 100, list(range(50, 55)))
+    device_key, = wait_for_snapshots(mb, port, [1])
+
+    requests = sim['requests']
+    values = mb.submit_reads(device_key, sorted(GATEWAY_MAP)).result(10)
+    assert sim['requests'] - requests == 2  # One block per register type
+    assert values == {**{address: 10 + address for address in range(10)},
+                      **{100 + address: 50 + address for address in range(5)}}
+
+    responses = mb.submit_writes(device_key, [(address, 1000 + address, 'Holding') for address in range(3, 7)]).result(10)
+    assert len({id(response) for response in responses.values()}) == 1  # One FC16 request
+    assert not responses[3].isError()
+    assert list(mb.read_simulated_values(sim, 1, 'Holding', 3, 4)) == [1003, 1004, 1005, 1006]
+
+
+def test_units_behind_a_gateway_share_its_connection(mb, gateway):
+    sim, port = gateway('tcp', [1])
+    bus = mb.BUS_WORKERS[port]
+    client = bus['client']
+
+    config = dict(bus['config'], unit_id="2")
+    mb.connect_modbus(1, None, 'tcp', port.split("://")[1], 1, config, 3600, 1)
+
+    assert mb.BUS_WORKERS[port] is bus
+    assert bus['client'] is client and bus['pool'] == [client]
+    assert sorted(bus['units']) == [1, 2]
+    wait_for_snapshots(mb, port, [1, 2])
+
+
+def test_pooled_connections_keep_several_transactions_in_flight(mb, gateway, monkeypatch):
+    in_flight = {'current': 0, 'max': 0, 'clients': set()}
+    read_register_blocks = mb.async_read_register_blocks
+
+    async def count_in_flight(client, *args, **kwargs):
+        in_flight['current'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['current'])
+        in_flight['clients'].add(id(client))
+        try:
+            return await read_register_blocks(client, *args, **kwargs)
+        finally:
+            in_flight['current'] -= 1
+
+    monkeypatch.setattr(mb, "async_read_register_blocks", count_in_flight)
+    sim, port = gateway('tcp', [1, 2, 3], engine='asyncio', pipeline_depth=3, latency=0.2)
+    bus = mb.BUS_WORKERS[port]
+    assert len(bus['pool']) == 3
+
+    keys = wait_for_snapshots(mb, port, [1, 2, 3])
+    assert in_flight['max'] == 3
+    assert len(in_flight['clients']) == 3
+    assert mb.get_device_snapshot(keys[2])['values'][0] == 0
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+START = np.datetime64('2026-01-01T00:00:00', 'us')
+
+
+@pytest.fixture
+def recorder(mb, monkeypatch):
+    """Return RECORDER_SETTINGS, restored after the test."""
+    monkeypatch.setitem(mb.RECORDER_SETTINGS, 'retention', 3600)
+    monkeypatch.setitem(mb.RECORDER_SETTINGS, 'max_rows', 4)
+    return mb.RECORDER_SETTINGS
+
+
+def make_buffer(mb, capacity=4, addresses=(1, 2)):
+    buffer = mb.create_graph_buffer(capacity)
+    mb.set_graph_columns(buffer, addresses)
+    return buffer
+
+
+def append_rows(mb, buffer, rows, first=0):
+    for index in range(first, first + rows):
+        mb.append_graph_row(buffer, START + np.timedelta64(index, 's'),
+                            np.array([index, -index], dtype=np.float32)[:len(buffer['addresses'])])
+
+
+def seconds(times):
+    return ((times - START) // np.timedelta64(1, 's')).tolist()
+
+
+def test_the_ring_keeps_the_latest_rows_in_order(mb, recorder):
+    buffer = make_buffer(mb)
+
+    append_rows(mb, buffer, 10)
+    times, values = mb.get_graph_rows(buffer)
+
+    assert buffer['count'] == 10 and buffer['capacity'] == 4
+    assert seconds(times) == [6, 7, 8, 9]
+    assert values[:, 0].tolist() == [6, 7, 8, 9]
+    assert values[:, 1].tolist() == [-6, -7, -8, -9]
+    # Wrapped rows are still handed out as views of the buffer
+    assert np.shares_memory(values, buffer['values'])
+
+
+def test_rows_from_a_cursor_on(mb, recorder):
+    buffer = make_buffer(mb)
+    append_rows(mb, buffer, 10)
+
+    assert seconds(mb.get_graph_rows(buffer, 8)[0]) == [8, 9]
+    assert seconds(mb.get_graph_rows(buffer, 10)[0]) == []
+    # Overwritten rows are left out
+    assert seconds(mb.get_graph_rows(buffer, 2)[0]) == [6, 7, 8, 9]
+
+
+def test_the_ring_grows_while_its_rows_are_within_the_retention(mb, recorder):
+    recorder['max_rows'] = 16
+    buffer = make_buffer(mb, capacity=2)
+
+    append_rows(mb, buffer, 10)
+
+    assert buffer['capacity'] == 16
+    assert seconds(mb.get_graph_rows(buffer)[0]) == list(range(10))
+
+
+def test_rows_older_than_the_retention_are_overwritten_and_left_out(mb, recorder):
+    recorder.update(retention=3, max_rows=16)
+    buffer = make_buffer(mb, capacity=4)
+
+    append_rows(mb, buffer, 10)
+
+    assert buffer['capacity'] == 4
+    assert seconds(mb.get_graph_rows(buffer)[0]) == [6, 7, 8, 9]
+    recorder['retention'] = 1
+    assert seconds(mb.get_graph_rows(buffer)[0]) == [8, 9]
+
+
+@pytest.mark.parametrize("capacity, kept", [(2, [8, 9]), (3, [7, 8, 9]), (8, [6, 7, 8, 9])])
+def test_resizing_keeps_the_latest_rows(mb, recorder, capacity, kept):
+    buffer = make_buffer(mb)
+    append_rows(mb, buffer, 10)
+
+    mb.resize_graph_buffer(buffer, capacity)
+
+    assert seconds(mb.get_graph_rows(buffer)[0]) == kept
+    recorder['max_rows'] = capacity
+    append_rows(mb, buffer, capacity, first=10)
+    times, values = mb.get_graph_rows(buffer)
+    assert seconds(times) == list(range(10, 10 + capacity))
+    assert values[:, 0].tolist() == list(range(10, 10 + capacity))
+
+
+def test_changing_the_columns_keeps_the_history_of_kept_registers(mb, recorder):
+    buffer = make_buffer(mb)
+    append_rows(mb, buffer, 6)
+    column_id = buffer['column_ids'][2]
+
+    mb.set_graph_columns(buffer, [2, 3])
+    _, values = mb.get_graph_rows(buffer)
+
+    assert buffer['addresses'].tolist() == [2, 3]
+    assert buffer['column_ids'][2] == column_id and 1 not in buffer['column_ids']
+    assert values[:, 0].tolist() == [-2, -3, -4, -5]
+    assert np.isnan(values[:, 1]).all()
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+BACKUP_MAP = {
+    0: {'name': 'Mode', 'type': 'Holding', 'multiplier': 1, 'unit': ''},
+    1: {'name': 'Energy limit', 'type': 'Holding', 'multiplier': 0.1, 'unit': 'kWh', 'data_type': 'uint32'},
+    10: {'name': 'Drive name', 'type': 'Holding', 'multiplier': 1, 'unit': '', 'data_type': 'string', 'words': 4},
+    20: {'name': 'Speed', 'type': 'Input', 'multiplier': 1, 'unit': ''},
+}
+
+
+def set_words(mb, sim, address, words):
+    mb.write_simulated_values(sim, 1, 'Holding', address, words)
+
+
+def get_words(mb, sim, address, count):
+    return list(mb.read_simulated_values(sim, 1, 'Holding', address, count))
+
+
+@pytest.fixture
+def backup_device(mb, register_map, simulated_bus):
+    register_map(BACKUP_MAP)
+    sim, device_key = simulated_bus(generators={}, latency=0, jitter=0)
+    set_words(mb, sim, 0, [3])
+    set_words(mb, sim, 1, mb.encode_register_words(BACKUP_MAP[1], 7000000.0))  # 70000000 raw
+    set_words(mb, sim, 10, mb.encode_register_words(BACKUP_MAP[10], 'DRIVE-01'))
+    return sim, device_key
+
+
+def test_backup_stores_one_decoded_entry_per_register(mb, backup_device):
+    _, device_key = backup_device
+
+    backup = mb.create_parameter_backup(device_key)
+
+    assert backup['version'] == mb.BACKUP_FORMAT_VERSION
+    assert set(backup['registers']) == {'0', '1', '10'}
+    assert backup['registers']['1'] == {'name': 'Energy limit', 'data_type': 'uint32', 'word_order': 'big',
+                                        'words': 2, 'value': 70000000}
+    assert backup['registers']['10']['value'] == 'DRIVE-01'
+    assert backup['registers']['10']['words'] == 4
+
+
+def test_restore_writes_every_word_of_a_register_in_one_request(mb, backup_device, monkeypatch):
+    sim, device_key = backup_device
+    backup = mb.parse_parameter_backup(json.loads(json.dumps(mb.create_parameter_backup(device_key))))
+    set_words(mb, sim, 1, [0, 5])
+    set_words(mb, sim, 10, mb.encode_register_words(BACKUP_MAP[10], 'OTHER'))
+
+    assert mb.diff_parameter_backup(device_key, backup) == {1: (5, 70000000), 10: ('OTHER', 'DRIVE-01')}
+
+    blocks = []
+    write_modbus_block = mb.write_modbus_block
+
+    def record_block(client, block, unit_id, verify=False):
+        blocks.append((block['start'], list(block['values'])))
+        return write_modbus_block(client, block, unit_id, verify)
+
+    monkeypatch.setattr(mb, "write_modbus_block", record_block)
+    result = mb.restore_parameter_backup(device_key, backup)
+
+    assert result['failed'] == [] and result['unverified'] == []
+    assert sorted(result['differences']) == [1, 10]
+    assert blocks == [(1, mb.encode_register_words(BACKUP_MAP[1], 7000000.0)),
+                      (10, mb.encode_register_words(BACKUP_MAP[10], 'DRIVE-01'))]
+    assert get_words(mb, sim, 1, 2) == [70000000 >> 16, 70000000 & 0xFFFF]
+    assert mb.diff_parameter_backup(device_key, backup) == {}
+
+
+def test_parse_reads_version_1_backups_as_single_words(mb):
+    backup = {'format': mb.BACKUP_FORMAT, 'version': 1, 'registers': {'5': {'name': 'Mode', 'value': 65535}}}
+
+    assert mb.parse_parameter_backup(backup) == {
+        5: {'value': 65535, 'data_type': 'uint16', 'word_order': 'big', 'words': 1}}
+
+
+def test_parse_rejects_values_that_do_not_fit(mb):
+    backup = {'format': mb.BACKUP_FORMAT, 'version': 2,
+              'registers': {'1': {'value': 1 << 32, 'data_type': 'uint32', 'word_order': 'big', 'words': 2}}}
+
+    with pytest.raises(ValueError):
+        mb.parse_parameter_backup(backup)
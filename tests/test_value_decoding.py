@@ -0,0 +1,82 @@
+import math
+
+import pytest
+
+DECODING_MAP = {
+    0: {'name': 'Setpoint', 'type': 'Holding', 'multiplier': 0.1, 'unit': 'Hz'},
+    1: {'name': 'Offset', 'type': 'Holding', 'multiplier': 1, 'unit': '', 'data_type': 'int16'},
+    2: {'name': 'Energy', 'type': 'Input', 'multiplier': 1, 'unit': 'Wh', 'data_type': 'uint32'},
+    4: {'name': 'Torque', 'type': 'Input', 'multiplier': 1, 'unit': '', 'data_type': 'int32', 'word_order': 'little'},
+    6: {'name': 'Current', 'type': 'Input', 'multiplier': 1, 'unit': 'A', 'data_type': 'float32'},
+    8: {'name': 'Serial number', 'type': 'Holding', 'multiplier': 1, 'unit': '', 'data_type': 'string', 'words': 3},
+    20: {'name': 'Run', 'type': 'Coil'},
+}
+
+ROUND_TRIPS = [
+    (0, 123.4, 123.4),
+    (0, 0.3, 0.3),
+    (1, -2, -2),
+    (2, 4000000000, 4000000000),
+    (4, -70000, -70000),
+    (6, 2.5, 2.5),
+    (8, 'SN1234', b'SN1234'),
+]
+
+
+@pytest.fixture
+def decoding_map(register_map):
+    return register_map(DECODING_MAP)
+
+
+def encode_all(mb, display_values):
+    words = {}
+    for address, display_value in display_values.items():
+        for offset, word in enumerate(mb.encode_register_words(DECODING_MAP[address], display_value)):
+            words[address + offset] = word
+    return words
+
+
+@pytest.mark.parametrize("address, display_value, decoded_value", ROUND_TRIPS)
+def test_encoded_words_decode_to_the_same_value(mb, decoding_map, address, display_value, decoded_value):
+    decoded = mb.decode_register_values(encode_all(mb, {address: display_value}))
+    row = mb.find_decoded_row(decoded, address)
+
+    assert decoded['words'][row] == mb.get_register_words(DECODING_MAP[address])
+    if isinstance(decoded_value, bytes):
+        assert decoded['strings'][row] == decoded_value
+        assert math.isnan(decoded['values'][row])
+    else:
+        assert decoded['scaled'][row] == pytest.approx(decoded_value)
+
+
+def test_all_registers_decode_in_one_pass(mb, decoding_map):
+    decoded = mb.decode_register_values(encode_all(mb, {0: 123.4, 1: -2, 2: 4000000000, 4: -70000, 6: 2.5, 8: 'SN1234'}))
+
+    assert list(decoded['addresses']) == [0, 1, 2, 4, 6, 8]
+    assert decoded['scaled'][:5] == pytest.approx([123.4, -2, 4000000000, -70000, 2.5])
+
+
+def test_word_order_puts_the_low_word_first(mb, decoding_map):
+    assert mb.encode_register_words(DECODING_MAP[2], 0x12345678) == [0x1234, 0x5678]
+    assert mb.encode_register_words(DECODING_MAP[4], 0x12345678) == [0x5678, 0x1234]
+
+
+def test_registers_with_a_missing_word_are_not_decoded(mb, decoding_map):
+    words = encode_all(mb, {0: 1, 2: 7})
+    words[3] = None
+
+    assert list(mb.decode_register_values(words)['addresses']) == [0]
+
+
+def test_bits_of_a_value(mb, decoding_map):
+    decoded = mb.decode_register_values({0: 0b101})
+    row = mb.find_decoded_row(decoded, 0)
+
+    assert list(decoded['bits'][row][:3]) == [True, False, True]
+    assert decoded['binary'][row].endswith(b'101')
+
+
+@pytest.mark.parametrize("address, display_value", [(1, 40000), (1, -40000), (2, -1), (8, "TOO LONG")])
+def test_values_that_do_not_fit_are_rejected(mb, decoding_map, address, display_value):
+    with pytest.raises(ValueError):
+        mb.encode_register_words(DECODING_MAP[address], display_value)